@@ -155,6 +155,8 @@ def _train_node(self, iterable, nodenr, msg_iterable=None,
             return
         iterable, msg_iterable, _ = self._sanitize_iterables(iterable,
                                                              msg_iterable)
+        if not isinstance(iterable, NoneIterable):
+            iterable = self._prefetch_iterable(iterable)
         while True:
             if not self.flow[nodenr].get_remaining_train_phase():
                 break
@@ -243,6 +245,7 @@ def _train_node_single_phase(self, iterable, nodenr,
         ## stop_training part
         # unlike the normal mdp.Flow we always close the training
         # to perform the stop_training phase
+        self._reset_streams(nodenr)
         self._stop_training_hook()
         if stop_msg is None:
             result = self.flow[nodenr].stop_training()
@@ -300,6 +303,8 @@ def execute(self, iterable, msg_iterable=None, target_iterable=None):
         self._bi_reset()  # normaly not required, just for safety
         iterable, msg_iterable, target_iterable = \
             self._sanitize_iterables(iterable, msg_iterable, target_iterable)
+        if not isinstance(iterable, NoneIterable):
+            iterable = self._prefetch_iterable(iterable)
         y_results = None
         msg_results = MessageResultContainer()
         empty_iterator = True
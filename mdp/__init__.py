@@ -143,7 +143,7 @@ class MDPDeprecationWarning(DeprecationWarning, MDPWarning):
 from signal_node import (NodeMetaclass, Node, PreserveDimNode,
                          Cumulator, VariadicCumulator)
 
-from linear_flows import (Flow, CheckpointFlow,
+from linear_flows import (Flow, FrozenFlow, CheckpointFlow,
                           CheckpointFunction, CheckpointSaveFunction)
 
 # import helper functions:
@@ -182,6 +182,7 @@ class MDPDeprecationWarning(DeprecationWarning, MDPWarning):
            'Flow',
            'FlowException',
            'FlowExceptionCR',
+           'FrozenFlow',
            'IsNotInvertibleException',
            'IsNotTrainableException',
            'MDPException',
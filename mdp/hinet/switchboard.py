@@ -67,6 +67,11 @@ def __init__(self, input_dim, connections):
     def _execute(self, x):
         return x[:, self.connections]
 
+    def _get_affine_map(self):
+        A = numx.zeros((self.input_dim, self.output_dim), dtype=self.dtype)
+        A[self.connections, numx.arange(self.output_dim)] = 1
+        return A, numx.zeros(self.output_dim, dtype=self.dtype)
+
     @staticmethod
     def is_trainable():
         return False
@@ -8,6 +8,7 @@
 import cPickle as _cPickle
 import tempfile as _tempfile
 import copy as _copy
+import threading as _threading
 
 from mdp import numx
 
@@ -88,6 +89,18 @@ class Flow(object):
     basic flow class ('CheckpointFlow') allows user-supplied checkpoint
     functions to be executed at the end of each phase, for example to save
     the internal structures of a node for later analysis.
+
+    For repeated executions on small data chunks the allocation of the
+    intermediate arrays can be avoided by enabling the execute buffers
+    (see 'set_execute_buffers'), and the final result can be written into
+    a preallocated array with the 'out' argument of 'execute'.
+
+    The intermediate results during training can be cached, so that the
+    nodes in front of the trained node are not executed again for every
+    training phase and every node (see 'set_train_cache'). The data chunks
+    of iterables can be loaded in a background thread while the nodes are
+    busy (see 'set_prefetch').
+
     Flow objects are Python containers. Most of the builtin 'list'
     methods are available. A 'Flow' can be saved or copied using the
     corresponding 'save' and 'copy' methods.
@@ -107,6 +120,26 @@ def __init__(self, flow, crash_recovery=False, verbose=False):
         self.verbose = verbose
         self.set_crash_recovery(crash_recovery)
 
+    # True if the intermediate execute arrays are reused
+    _use_execute_buffers = False
+    # thread local storage of the reused arrays, created when needed
+    _execute_buffers = None
+    # (max_bytes, dirname) for the training cache, None if disabled
+    _train_cache_args = None
+    # the _ActivationCache used during training
+    _train_cache = None
+    # number of chunks fetched ahead in a background thread, 0 if disabled
+    _prefetch = 0
+
+    def __getstate__(self):
+        # the execute buffers are only a cache (and thread local storage
+        # can not be pickled)
+        state = self.__dict__.copy()
+        state.pop('_execute_buffers', None)
+        if state.get('_train_cache') is not None:
+            state['_train_cache'] = None
+        return state
+
     def _propagate_exception(self, except_, nodenr):
         # capture exception. the traceback of the error is printed and a
         # new exception, containing the identity of the node in the flow
@@ -152,16 +185,8 @@ def _train_node(self, data_iterable, nodenr):
             ## automatically when the node is executed.
             while True:
                 empty_iterator = True
-                for x in data_iterable:
+                for x, arg in self._train_data(data_iterable, nodenr):
                     empty_iterator = False
-                    # the arguments following the first are passed only to the
-                    # currently trained node, allowing the implementation of
-                    # supervised nodes
-                    if (type(x) is tuple) or (type(x) is list):
-                        arg = x[1:]
-                        x = x[0]
-                    else:
-                        arg = ()
                     # check if the required number of arguments was given
                     if train_args_needed:
                         if len(train_arg_keys) != len(arg):
@@ -172,9 +197,6 @@ def _train_node(self, data_iterable, nodenr):
                                    "List of required argument keys: " +
                                    str(train_arg_keys))
                             raise FlowException(err)
-                    # filter x through the previous nodes
-                    if nodenr > 0:
-                        x = self._execute_seq(x, nodenr-1)
                     # train current node
                     node.train(x, *arg)
                 if empty_iterator:
@@ -189,6 +211,7 @@ def _train_node(self, data_iterable, nodenr):
                         err_str = ("The training data iterator for node "
                                    "no. %d is empty." % (nodenr+1))
                         raise FlowException(err_str)
+                self._reset_streams(nodenr)
                 self._stop_training_hook()
                 if node.get_remaining_train_phase() > 1:
                     # close the previous training phase
@@ -215,6 +238,65 @@ def _train_node(self, data_iterable, nodenr):
             # capture any other exception occured during training.
             self._propagate_exception(e, nodenr)
 
+    def _train_data(self, data_iterable, nodenr):
+        """Return an iterator over the training data for node nodenr.
+
+        The iterator returns (x, arg) tuples, where x has already been
+        filtered through the previous nodes. If the training cache is
+        enabled the filtered data is stored and reused for the following
+        training phases and nodes with the same data iterable.
+        """
+        cache = self._train_cache
+        if (cache is not None and cache.iterable is data_iterable and
+            cache.nodenr == nodenr-1):
+            return iter(cache)
+        return self._filter_train_data(data_iterable, nodenr)
+
+    def _filter_train_data(self, data_iterable, nodenr):
+        # generator for the data that is not yet cached
+        cache = self._train_cache
+        if (cache is not None and cache.iterable is data_iterable and
+            cache.nodenr < nodenr-1):
+            # start from the cached results of an earlier node
+            first = cache.nodenr+1
+            items = iter(cache)
+        else:
+            first = 0
+            items = (_split_train_item(item) for item in data_iterable)
+        new_cache = None
+        if self._train_cache_args is not None and nodenr > 0:
+            max_bytes, dirname = self._train_cache_args
+            new_cache = _ActivationCache(data_iterable, nodenr-1,
+                                         max_bytes, dirname)
+        for x, arg in items:
+            # filter x through the previous nodes
+            if first == 0:
+                if nodenr > 0:
+                    x = self._execute_seq(x, nodenr-1)
+            else:
+                for i in range(first, nodenr):
+                    try:
+                        x = self.flow[i].execute(x)
+                    except Exception, e:
+                        self._propagate_exception(e, i)
+            if new_cache is not None:
+                new_cache.append(x, arg)
+            yield x, arg
+        if new_cache is not None:
+            # only a complete pass through the data replaces the cache
+            new_cache.close()
+            self._train_cache = new_cache
+
+    def _reset_streams(self, nodenr):
+        """Reset the streaming history of the nodes before node nodenr.
+
+        This is done after every pass through the training data, so that
+        no samples are carried over into the next pass or the execution.
+        """
+        for node in self.flow[:nodenr]:
+            if hasattr(node, "reset_stream"):
+                node.reset_stream()
+
     def _stop_training_hook(self):
         """Hook method that is called before stop_training is called."""
         pass
@@ -296,6 +378,151 @@ def set_crash_recovery(self, state = True):
         """
         self._crash_recovery = state
 
+    def set_train_cache(self, state=True, max_bytes=2**28, dirname=None):
+        """Enable or disable the caching of intermediate training results.
+
+        If enabled, the input data of a trained node (i.e., the data after
+        being filtered by the previous nodes) is stored during the first
+        pass through the data iterable. The stored data is then reused for
+        the remaining training phases of the node and, after executing only
+        the trained node, for the next node if it has the same data iterable
+        (e.g. if a single array is given to 'train'). The cache is discarded
+        at the end of 'train'.
+
+        max_bytes -- Maximum number of bytes that are kept in memory, the
+            rest of the data is stored in a memory mapped file.
+        dirname -- Directory for the memory mapped file. If None (default
+            value) then the default temporary directory is used.
+
+        Note that the cache assumes that the data iterables return the same
+        data in every iteration.
+        """
+        if state:
+            self._train_cache_args = (max_bytes, dirname)
+        else:
+            self._train_cache_args = None
+            self._train_cache = None
+
+    def set_prefetch(self, n_chunks=2):
+        """Fetch the data chunks from the iterables in a background thread.
+
+        n_chunks -- Maximum number of chunks that are fetched ahead of the
+            processing, 0 disables the prefetching.
+
+        This applies to the iterables in 'train' and 'execute', so that
+        loading or generating the data overlaps with the node computations.
+        Arrays, lists and tuples are used directly, since their items are
+        already available. Exceptions in the iterables are re-raised in the
+        main thread.
+        """
+        self._prefetch = n_chunks
+
+    def _prefetch_iterable(self, iterable):
+        """Return the iterable wrapped for prefetching (if enabled)."""
+        if (not self._prefetch or iterable is None or
+            isinstance(iterable, (numx.ndarray, list, tuple))):
+            return iterable
+        return mdp.utils.PrefetchIterable(iterable, self._prefetch)
+
+    def _prefetch_iterables(self, iterables):
+        """Return the list of iterables wrapped for prefetching.
+
+        The same iterable always gets the same wrapper, so that the training
+        cache can recognize it.
+        """
+        if not self._prefetch:
+            return iterables
+        wrappers = {}
+        for iterable in iterables:
+            if id(iterable) not in wrappers:
+                wrappers[id(iterable)] = self._prefetch_iterable(iterable)
+        return [wrappers[id(iterable)] for iterable in iterables]
+
+    def set_execute_buffers(self, state=True):
+        """Enable or disable the reuse of intermediate execute arrays.
+
+        If enabled, the output arrays of nodes which support it (see
+        'Node.has_execute_out') are allocated once and reused in subsequent
+        calls to 'execute' (as long as the number of data points does not
+        change). The result of the last node is never a reused array.
+
+        Every thread executing the flow gets its own buffers, so a flow can
+        be executed from several threads at once. Note that the buffers take
+        up memory until they are disabled again.
+        """
+        self._use_execute_buffers = bool(state)
+        if not state:
+            self._execute_buffers = None
+
+    def _get_execute_buffer(self, nodenr, n):
+        """Return the reused output array of node nodenr for n data points.
+
+        Returns None if the node does not support this.
+        """
+        node = self.flow[nodenr]
+        if (node.output_dim is None or node.dtype is None or
+            not node.has_execute_out()):
+            return None
+        shape = (n, node.output_dim)
+        buffers = self._get_thread_execute_buffers()
+        buffer_ = buffers.get(nodenr)
+        if (buffer_ is None or buffer_.shape != shape or
+            buffer_.dtype != node.dtype):
+            buffer_ = numx.empty(shape, dtype=node.dtype)
+            buffers[nodenr] = buffer_
+        return buffer_
+
+    def _get_thread_execute_buffers(self):
+        """Return the dict of execute buffers for the current thread."""
+        local = self._execute_buffers
+        if local is None:
+            # if another thread does the same, then only the buffers
+            # allocated so far are lost
+            local = self._execute_buffers = _threading.local()
+        try:
+            return local.buffers
+        except AttributeError:
+            local.buffers = {}
+            return local.buffers
+
+    def fuse_affine_nodes(self, keep_nodes=False):
+        """Return a new flow in which chains of affine nodes are fused.
+
+        Each sequence of at least two consecutive trained nodes with an
+        affine execution (see 'Node.get_affine_map', e.g. PCANode, SFANode
+        or Switchboard) is replaced by a single AffineNode, so the chain is
+        executed with one matrix multiplication. The other nodes are kept.
+
+        keep_nodes -- If True then the AffineNode keeps references to the
+            original nodes, which are then used for the inverse.
+        """
+        nodes = []
+        chain = []
+        for node in self.flow:
+            affine_map = node.get_affine_map()
+            if affine_map is not None:
+                chain.append((node, affine_map))
+                continue
+            nodes += _fuse_affine_chain(chain, keep_nodes)
+            chain = []
+            nodes.append(node)
+        nodes += _fuse_affine_chain(chain, keep_nodes)
+        return Flow(nodes, crash_recovery=self._crash_recovery,
+                    verbose=self.verbose)
+
+    def freeze(self, x=None):
+        """Return a FrozenFlow for the fast execution of this trained flow.
+
+        x -- Optional data array which is executed once before the flow is
+            frozen, to set up the dimensions of nodes that are not trainable.
+
+        All nodes must have finished their training and their dimensions
+        and dtype must be known.
+        """
+        if x is not None:
+            self.execute(x)
+        return FrozenFlow(self)
+
     def train(self, data_iterables):
         """Train all trainable nodes in the flow.
 
@@ -322,30 +549,50 @@ def train(self, data_iterables):
         """
 
         data_iterables = self._train_check_iterables(data_iterables)
+        data_iterables = self._prefetch_iterables(data_iterables)
 
         # train each Node successively
-        for i in range(len(self.flow)):
-            if self.verbose:
-                print "Training node #%d (%s)" % (i, str(self.flow[i]))
-            self._train_node(data_iterables[i], i)
-            if self.verbose:
-                print "Training finished"
+        try:
+            for i in range(len(self.flow)):
+                if self.verbose:
+                    print "Training node #%d (%s)" % (i, str(self.flow[i]))
+                self._train_node(data_iterables[i], i)
+                if self.verbose:
+                    print "Training finished"
+        finally:
+            self._train_cache = None
 
         self._close_last_node()
 
-    def _execute_seq(self, x, nodenr = None):
+    def _execute_seq(self, x, nodenr = None, out = None):
         # Filters input data 'x' through the nodes 0..'node_nr' included
+        # (the result of the last node is stored in 'out' if given)
         flow = self.flow
         if nodenr is None:
             nodenr = len(flow)-1
+        use_buffers = self._use_execute_buffers
         for i in range(nodenr+1):
             try:
-                x = flow[i].execute(x)
+                if i == nodenr and out is not None:
+                    x = flow[i].execute_out(x, out)
+                elif i < nodenr and use_buffers:
+                    buffer_ = self._get_execute_buffer(i, x.shape[0])
+                    if buffer_ is None:
+                        x = flow[i].execute(x)
+                    else:
+                        x = flow[i].execute_out(x, buffer_)
+                else:
+                    x = flow[i].execute(x)
             except Exception, e:
                 self._propagate_exception(e, i)
+        if out is None and use_buffers:
+            # the last node might have returned a view on a reused array
+            for buffer_ in self._get_thread_execute_buffers().itervalues():
+                if numx.may_share_memory(x, buffer_):
+                    return x.copy()
         return x
 
-    def execute(self, iterable, nodenr = None):
+    def execute(self, iterable, nodenr = None, out = None):
         """Process the data through all nodes in the flow.
 
         'iterable' is an iterable or iterator (note that a list is also an
@@ -354,17 +601,37 @@ def execute(self, iterable, nodenr = None):
 
         If 'nodenr' is specified, the flow is executed only up to
         node nr. 'nodenr'. This is equivalent to 'flow[:nodenr+1](iterable)'.
+
+        If 'out' is specified, the result is stored in this preallocated
+        array (which is then returned). For an iterable the results are
+        stored consecutively, so 'out' must have as many rows as the total
+        number of data points.
         """
         if isinstance(iterable, numx.ndarray):
-            return self._execute_seq(iterable, nodenr)
+            return self._execute_seq(iterable, nodenr, out)
         res = []
+        n_out = 0
         empty_iterator = True
-        for x in iterable:
+        for x in self._prefetch_iterable(iterable):
             empty_iterator = False
-            res.append(self._execute_seq(x, nodenr))
+            if out is None:
+                res.append(self._execute_seq(x, nodenr))
+            else:
+                if n_out + x.shape[0] > out.shape[0]:
+                    errstr = ("The execute data has more data points than "
+                              "the out array (%d)." % out.shape[0])
+                    raise FlowException(errstr)
+                self._execute_seq(x, nodenr, out[n_out:n_out+x.shape[0]])
+                n_out += x.shape[0]
         if empty_iterator:
             errstr = ("The execute data iterator is empty.")
             raise FlowException(errstr)
+        if out is not None:
+            if n_out != out.shape[0]:
+                errstr = ("The execute data has %d data points, but the out "
+                          "array has %d rows." % (n_out, out.shape[0]))
+                raise FlowException(errstr)
+            return out
         return numx.concatenate(res)
 
     def _inverse_seq(self, x):
@@ -568,6 +835,173 @@ def pop(self, i = -1):
         del self[i]
         return x
 
+def _split_train_item(x):
+    """Split an item of a training data iterable into x and the arguments."""
+    # the arguments following the first are passed only to the
+    # currently trained node, allowing the implementation of
+    # supervised nodes
+    if (type(x) is tuple) or (type(x) is list):
+        return x[0], x[1:]
+    return x, ()
+
+
+class _ActivationCache(object):
+    """Storage for the intermediate results during the training of a flow.
+
+    The cache stores the output of the nodes up to 'nodenr' for each data
+    chunk of 'iterable', together with the additional training arguments.
+    The chunks are kept in memory until 'max_bytes' is reached, the
+    following chunks are written to a memory mapped file.
+    """
+
+    def __init__(self, iterable, nodenr, max_bytes, dirname=None):
+        self.iterable = iterable
+        self.nodenr = nodenr
+        self.max_bytes = max_bytes
+        self.dirname = dirname
+        self.nbytes = 0
+        # list of (x, arg) tuples, for chunks stored in the file x is
+        # the (start, stop) range of rows
+        self._chunks = []
+        self._file_buffer = None
+        self._file_array = None
+
+    def append(self, x, arg):
+        """Store a data chunk."""
+        if self.nbytes + x.nbytes <= self.max_bytes:
+            self._chunks.append((x, arg))
+            self.nbytes += x.nbytes
+            return
+        if self._file_buffer is None:
+            self._file_buffer = mdp.utils.MemmapArrayBuffer(
+                                    dirname=self.dirname,
+                                    prefix="mdp_train_cache_")
+        start = self._file_buffer.tlen
+        self._file_buffer.append(x)
+        self._chunks.append(((start, self._file_buffer.tlen), arg))
+
+    def close(self):
+        """Finish storing, the data can then be iterated over."""
+        if self._file_buffer is not None:
+            self._file_array = self._file_buffer.get_array()
+            self._file_buffer = None
+
+    def __iter__(self):
+        for x, arg in self._chunks:
+            if type(x) is tuple:
+                x = self._file_array[x[0]:x[1]]
+            yield x, arg
+
+
+def _fuse_affine_chain(chain, keep_nodes):
+    """Return a list with a single AffineNode for a chain of affine nodes.
+
+    chain -- List of (node, affine map) tuples. For less than two nodes the
+        nodes are returned unchanged.
+    """
+    if len(chain) < 2:
+        return [node for node, _ in chain]
+    A, b = chain[0][1]
+    for _, (A_next, b_next) in chain[1:]:
+        # (x A + b) A_next + b_next
+        A = mdp.utils.mult(A, A_next)
+        b = mdp.utils.mult(b, A_next) + b_next
+    if keep_nodes:
+        nodes = [node for node, _ in chain]
+    else:
+        nodes = None
+    return [mdp.nodes.AffineNode(A, b, nodes=nodes, dtype=chain[0][0].dtype)]
+
+
+class FrozenFlow(object):
+    """Execution-only version of a trained flow with minimal overhead.
+
+    A FrozenFlow is created with 'Flow.freeze'. The training state,
+    dimensions and dtypes of the nodes are checked only once when the
+    FrozenFlow is created. An execution then only checks the input array
+    and directly calls the '_execute' method of each node (casting the data
+    if it does not have the node dtype). For small data chunks this is much
+    faster than 'Flow.execute', where each node repeats all the checks.
+
+    Nodes which overwrite 'execute' itself are still executed via 'execute'.
+
+    The FrozenFlow uses the nodes of the original flow, so it has to be
+    recreated when the nodes are changed or extensions are (de)activated.
+    """
+
+    def __init__(self, flow):
+        """Check the flow and prepare the execution.
+
+        flow -- Trained Flow instance.
+        """
+        if not len(flow):
+            err = "An empty flow can not be frozen."
+            raise FlowException(err)
+        self.flow = flow
+        # list of (execute method, input dtype) tuples
+        self._steps = []
+        dim = flow[0].input_dim
+        for i, node in enumerate(flow):
+            if node.is_training():
+                err = ("Node #%d (%s) is still in the training phase." %
+                       (i, str(node)))
+                raise FlowException(err)
+            if (node.input_dim is None or node.output_dim is None or
+                node.dtype is None):
+                err = ("The dimensions or the dtype of node #%d (%s) are "
+                       "not set, provide example data to freeze." %
+                       (i, str(node)))
+                raise FlowException(err)
+            if node.input_dim != dim:
+                err = ("Node #%d (%s) has input_dim %d, but the previous "
+                       "output_dim is %d." % (i, str(node), node.input_dim,
+                                              dim))
+                raise FlowException(err)
+            dim = node.output_dim
+            if node._get_execute_class() is None:
+                self._steps.append((node.execute, node.dtype))
+            else:
+                self._steps.append((node._execute, node.dtype))
+        self.input_dim = flow[0].input_dim
+        self.output_dim = dim
+
+    def execute(self, iterable):
+        """Process the data through all nodes in the flow.
+
+        'iterable' is a data array or an iterable of data arrays (like for
+        'Flow.execute').
+        """
+        if not isinstance(iterable, numx.ndarray):
+            res = [self.execute(x) for x in iterable]
+            if not res:
+                errstr = ("The execute data iterator is empty.")
+                raise FlowException(errstr)
+            return numx.concatenate(res)
+        x = iterable
+        if x.ndim != 2 or x.shape[1] != self.input_dim:
+            err = ("x has shape %s, should be (n, %d)" %
+                   (str(x.shape), self.input_dim))
+            raise FlowException(err)
+        i = 0
+        try:
+            for execute, dtype in self._steps:
+                if x.dtype != dtype:
+                    x = x.astype(dtype)
+                x = execute(x)
+                i += 1
+        except Exception, e:
+            self.flow._propagate_exception(e, i)
+        return x
+
+    def __call__(self, iterable):
+        """Calling an instance is equivalent to call its 'execute' method."""
+        return self.execute(iterable)
+
+    def __reduce__(self):
+        # bound methods can not be pickled, so freeze again
+        return (self.__class__, (self.flow,))
+
+
 class CheckpointFlow(Flow):
     """Subclass of Flow class that allows user-supplied checkpoint functions
     to be executed at the end of each phase, for example to
@@ -601,20 +1035,24 @@ def train(self, data_iterables, checkpoints):
         """
 
         data_iterables = self._train_check_iterables(data_iterables)
+        data_iterables = self._prefetch_iterables(data_iterables)
         checkpoints = self._train_check_checkpoints(checkpoints)
 
         # train each Node successively
-        for i in range(len(self.flow)):
-            node = self.flow[i]
-            if self.verbose:
-                print "Training node #%d (%s)" % (i, type(node).__name__)
-            self._train_node(data_iterables[i], i)
-            if (i <= len(checkpoints)) and (checkpoints[i] is not None):
-                dic = checkpoints[i](node)
-                if dic:
-                    self.__dict__.update(dic)
-            if self.verbose:
-                print "Training finished"
+        try:
+            for i in range(len(self.flow)):
+                node = self.flow[i]
+                if self.verbose:
+                    print "Training node #%d (%s)" % (i, type(node).__name__)
+                self._train_node(data_iterables[i], i)
+                if (i <= len(checkpoints)) and (checkpoints[i] is not None):
+                    dic = checkpoints[i](node)
+                    if dic:
+                        self.__dict__.update(dic)
+                if self.verbose:
+                    print "Training finished"
+        finally:
+            self._train_cache = None
 
         self._close_last_node()
 
@@ -10,7 +10,8 @@
                              GeneralExpansionNode)
 from fda_nodes import FDANode
 from em_nodes import FANode
-from misc_nodes import (IdentityNode, HitParadeNode, TimeFramesNode,
+from misc_nodes import (IdentityNode, AffineNode, HitParadeNode,
+                        TimeFramesNode,
                         TimeDelayNode, TimeDelaySlidingWindowNode,
                         EtaComputerNode, NoiseNode, NormalNoiseNode,
                         CutoffNode, HistogramNode, AdaptiveCutoffNode)
@@ -45,7 +46,7 @@
            'EtaComputerNode', 'HitParadeNode', 'NoiseNode', 'NormalNoiseNode',
            'TimeFramesNode', 'TimeDelayNode', 'TimeDelaySlidingWindowNode',
            'CutoffNode', 'AdaptiveCutoffNode', 'HistogramNode',
-           'IdentityNode', '_OneDimensionalHitParade']
+           'IdentityNode', 'AffineNode', '_OneDimensionalHitParade']
 
 # nodes with external dependencies
 from mdp import config, numx_description, MDPException
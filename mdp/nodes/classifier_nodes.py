@@ -5,6 +5,15 @@
 
 # TODO: The GaussianClassifier and NearestMeanClassifier could be parallelized.
 
+# check if the scipy KD-tree is available
+_HAS_KDTREE = False
+if mdp.numx_description == 'scipy':
+    try:
+        from scipy.spatial import cKDTree as _cKDTree
+        _HAS_KDTREE = True
+    except ImportError:
+        pass
+
 
 class SignumClassifier(ClassifierNode):
     """This classifier node classifies as ``1`` if the sum of the data points
@@ -549,25 +558,53 @@ def _label(self, x):
     
     
 class KNNClassifier(ClassifierNode):
-    """K-Nearest-Neighbour Classifier."""
+    """K-Nearest-Neighbour Classifier.
+
+    The nearest neighbours are either found with a KD-tree (if
+    scipy.spatial is available) or by brute force. The queries are processed
+    in blocks, so that the distance matrix of a block has at most
+    max_block_elements elements.
+    """
+
+    # maximum number of elements in the distance matrix of a query block
+    max_block_elements = 2**22
+    # maximum input dimension for which 'auto' chooses the KD-tree
+    kdtree_max_dim = 16
+    # defaults for nodes pickled by older versions
+    algorithm = "auto"
+    _kdtree = None
+    _sample_square_norms = None
     
-    def __init__(self, k=1, execute_method=None,
+    def __init__(self, k=1, execute_method=None, algorithm="auto",
                  input_dim=None, output_dim=None, dtype=None):
         """Initialize classifier.
         
         k -- Number of closest sample points that are taken into account.
+        algorithm -- Nearest neighbour search method, either 'kdtree',
+            'brute' or 'auto' (default). 'auto' uses the KD-tree if it is
+            available and the input dimension is at most kdtree_max_dim
+            (in high dimensions KD-trees are not faster than brute force).
         """
         super(KNNClassifier, self).__init__(execute_method=execute_method,
                                             input_dim=input_dim,
                                             output_dim=output_dim,
                                             dtype=dtype)
+        if algorithm not in ("auto", "kdtree", "brute"):
+            err = "Unknown nearest neighbour algorithm: %s" % str(algorithm)
+            raise mdp.NodeException(err)
+        if algorithm == "kdtree" and not _HAS_KDTREE:
+            err = "The KD-tree requires scipy.spatial."
+            raise mdp.NodeException(err)
         self.k = k
+        self.algorithm = algorithm
+        self._kdtree = None
         self._label_samples = {}  # temporary variable during training
         self.n_samples = None
         # initialized after training:
         self.samples = None  # 2d array with all samples
         self.sample_label_indices = None  # 1d array for label indices
         self.ordered_labels = []
+        self._sample_square_norms = None
         
     def _train(self, x, labels):
         """Add the sampel points to the classes.
@@ -611,14 +648,60 @@ def _stop_training(self):
                                 [numx.ones(len(ordered_samples[i]),
                                            dtype="int32") * i
                                  for i in range(len(self.ordered_labels))])
+        self._sample_square_norms = (self.samples*self.samples).sum(1)
+        if self._use_kdtree():
+            self._kdtree = _cKDTree(self.samples)
+
+    def _use_kdtree(self):
+        """Return True if the KD-tree should be used for the search."""
+        if self.algorithm == "auto":
+            return _HAS_KDTREE and self.input_dim <= self.kdtree_max_dim
+        return self.algorithm == "kdtree"
+
+    def __getstate__(self):
+        # the scipy KD-tree can not be pickled, it is rebuilt when needed
+        state = self.__dict__.copy()
+        state["_kdtree"] = None
+        return state
+
+    def _nearest_indices(self, x, k):
+        """Return the indices of the k nearest samples for each point in x.
+
+        The result is an array of shape (len(x), k), the indices in each row
+        are not necessarily sorted by distance.
+        """
+        if self._use_kdtree():
+            if self._kdtree is None:
+                self._kdtree = _cKDTree(self.samples)
+            indices = self._kdtree.query(x, k=k)[1]
+            return indices.reshape((x.shape[0], k))
+        if self._sample_square_norms is None:
+            self._sample_square_norms = (self.samples*self.samples).sum(1)
+        square_distances = utils.mult(x, -2*self.samples.T)
+        square_distances += (x*x).sum(1)[:, numx.newaxis]
+        square_distances += self._sample_square_norms
+        if k == self.n_samples:
+            return numx.arange(k)[numx.newaxis, :].repeat(x.shape[0], axis=0)
+        if hasattr(numx, "argpartition"):
+            # only separate the k smallest distances, O(n) instead of sorting
+            return numx.argpartition(square_distances, k-1, axis=1)[:, :k]
+        return square_distances.argsort(axis=1)[:, :k]
 
     def _label(self, x):
         """Label the data by comparison with the reference points."""
-        square_distances = (x*x).sum(1)[:, numx.newaxis] \
-                      + (self.samples*self.samples).sum(1)
-        square_distances -= 2 * numx.dot(x, self.samples.T)
-        min_inds = square_distances.argsort()
-        win_inds = [numx.bincount(self.sample_label_indices[indices[0:self.k]]).
-                    argmax(0) for indices in min_inds]
+        k = min(self.k, self.n_samples)
+        n_labels = len(self.ordered_labels)
+        block_size = max(1, self.max_block_elements // self.n_samples)
+        win_inds = numx.empty(x.shape[0], dtype="int32")
+        for start in range(0, x.shape[0], block_size):
+            x_block = x[start:start+block_size]
+            label_inds = self.sample_label_indices[
+                                            self._nearest_indices(x_block, k)]
+            # count the votes for each label
+            votes = numx.zeros((x_block.shape[0], n_labels), dtype="int32")
+            rows = numx.arange(x_block.shape[0])
+            for i in range(k):
+                votes[rows, label_inds[:, i]] += 1
+            win_inds[start:start+block_size] = votes.argmax(1)
         labels = [self.ordered_labels[i] for i in win_inds]
         return labels
@@ -1,9 +1,16 @@
 __docformat__ = "restructuredtext en"
 
-from mdp import numx, numx_linalg, utils, NodeException
+from mdp import numx, numx_linalg, numx_fft, utils, NodeException
 import mdp
+import threading
+import numpy.fft
 import scipy.signal as signal
 
+# the transforms for real data are taken from numpy, since they are
+# not available in scipy.fftpack
+_rfft2 = numpy.fft.rfft2
+_irfft2 = numpy.fft.irfft2
+
 # TODO automatic selection of convolution
 
 # TODO provide generators for standard filters
@@ -22,13 +29,24 @@ class Convolution2DNode(mdp.Node):
     to be convolved with the filters, or as 2D data, in which case
     the ``input_shape`` argument must be specified.
 
+    With the 'fft' approach the Fourier transforms of the filters are
+    computed only once for a given input shape, and blocks of images are
+    convolved with all the filters at once.
+
     This node depends on ``scipy``.
     """
 
+    # approximate number of elements of the spectra computed at once
+    max_block_elements = 2**22
+    # defaults for nodes pickled by older versions
+    n_threads = 1
+    # (fft_shape, spectra) of the filters, computed when needed
+    _filter_spectra = None
+
     def __init__(self, filters, input_shape = None,
                  approach = 'fft',
                  mode = 'full', boundary = 'fill', fillvalue = 0,
-                 output_2d = True,
+                 output_2d = True, n_threads = 1,
                  input_dim = None, dtype = None):
         """
         Input arguments:
@@ -66,6 +84,12 @@ def __init__(self, filters, input_shape = None,
                      filter_nr: index of convolution filter
                      idx: data point index
                      x, y: 2D coordinates
+
+        n_threads -- Number of threads used to convolve the blocks of
+                     images if 'approach' is 'fft'. The threads are
+                     started for every call of 'execute' (at most one
+                     per block), so this only pays off for large inputs.
+                     (*Default* = 1)
         """
         super(Convolution2DNode, self).__init__(input_dim=input_dim,
                                               dtype=dtype)
@@ -85,6 +109,7 @@ def __init__(self, filters, input_shape = None,
         self.boundary = boundary
         self.fillvalue = fillvalue
         self.output_2d = output_2d
+        self.n_threads = n_threads
         self._output_shape = None
 
     # ------- class properties
@@ -98,6 +123,7 @@ def set_filters(self, filters):
             raise NodeException('Filters must be specified in a 3-dim array, with each '+
                                 'filter on a different row')
         self._filters = filters
+        self._filter_spectra = None
 
     filters = property(get_filters, set_filters)
 
@@ -199,6 +225,71 @@ def _pre_execution_checks(self, x):
             error_str = "x must have at least one observation (zero given)"
             raise NodeException(error_str)
 
+    def _get_filter_spectra(self, fft_shape):
+        """Return the Fourier transforms of the filters for the given shape.
+
+        The spectra are cached, they are only recomputed if the shape or
+        the filters change.
+        """
+        if (self._filter_spectra is None or
+            self._filter_spectra[0] != fft_shape):
+            if numx.iscomplexobj(self.filters):
+                spectra = numx_fft.fft2(self.filters, fft_shape)
+            else:
+                spectra = _rfft2(self.filters, fft_shape)
+            self._filter_spectra = (fft_shape, spectra)
+        return self._filter_spectra[1]
+
+    def _fft_convolve(self, x, y):
+        """Convolve the 3D images x with all the filters in the frequency
+        domain and store the result in y."""
+        filters = self.filters
+        output_shape = self._output_shape
+        fft_shape = (x.shape[1]+filters.shape[1]-1,
+                     x.shape[2]+filters.shape[2]-1)
+        spectra = self._get_filter_spectra(fft_shape)
+        if numx.iscomplexobj(filters):
+            forward = numx_fft.fft2
+            backward = lambda a, shape: numx_fft.ifft2(a, shape).real
+        else:
+            forward, backward = _rfft2, _irfft2
+        # position of the output in the full convolution
+        start = [(fft_shape[i]-output_shape[i])//2 for i in (0, 1)]
+        stop = [start[i]+output_shape[i] for i in (0, 1)]
+
+        n_images = x.shape[0]
+        n_threads = max(1, min(self.n_threads, n_images))
+        block_size = max(1, min(self.max_block_elements // spectra.size,
+                                -(-n_images // n_threads)))
+        blocks = [(first, first+block_size)
+                  for first in range(0, n_images, block_size)]
+        n_threads = min(n_threads, len(blocks))
+
+        errors = []
+        def convolve_blocks(blocks):
+            try:
+                for first, last in blocks:
+                    spectrum = forward(x[first:last], fft_shape)
+                    full = backward(spectrum[:, numx.newaxis] * spectra,
+                                    fft_shape)
+                    y[first:last] = full[:, :, start[0]:stop[0],
+                                         start[1]:stop[1]]
+            except Exception, exception:
+                errors.append(exception)
+
+        if n_threads == 1:
+            convolve_blocks(blocks)
+        else:
+            threads = [threading.Thread(target=convolve_blocks,
+                                        args=(blocks[i::n_threads],))
+                       for i in range(n_threads)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        if errors:
+            raise errors[0]
+
     def _execute(self, x):
         is_2d = x.ndim==2
         output_shape, input_shape = self._output_shape, self._input_shape
@@ -208,13 +299,13 @@ def _execute(self, x):
         # XXX depends on convolution
         y = numx.empty((x.shape[0], nfilters,
                         output_shape[0], output_shape[1]), dtype=self.dtype)
-        for n_im, im in enumerate(x):
-            if is_2d:
-                im = im.reshape(input_shape)
-            for n_flt, flt in enumerate(filters):
-                if self.approach == 'fft':
-                    y[n_im,n_flt,:,:] = signal.fftconvolve(im, flt, mode=self.mode)
-                elif self.approach == 'linear':
+        if is_2d:
+            x = x.reshape((x.shape[0],) + tuple(input_shape))
+        if self.approach == 'fft':
+            self._fft_convolve(x, y)
+        elif self.approach == 'linear':
+            for n_im, im in enumerate(x):
+                for n_flt, flt in enumerate(filters):
                     y[n_im,n_flt,:,:] = signal.convolve2d(im, flt,
                                                           mode=self.mode,
                                                           boundary=self.boundary,
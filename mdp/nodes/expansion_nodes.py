@@ -1,8 +1,8 @@
 __docformat__ = "restructuredtext en"
 
 import mdp
-from mdp import numx
-from mdp.utils import mult, matmult, invert_exp_funcs2
+from mdp import numx, numx_linalg
+from mdp.utils import mult, invert_exp_funcs2
 from mdp.nodes import GrowingNeuralGasNode
 
 def nmonomials(degree, nvariables):
@@ -15,6 +15,44 @@ def expanded_dim(degree, nvariables):
     a polynomial expansion of degree ``degree``."""
     return int(mdp.utils.comb(nvariables+degree, degree))-1
 
+# cache for the polynomial expansion plans, keys are (degree, dim)
+_polynomial_plans = {}
+
+def _get_polynomial_plan(degree, dim):
+    """Return the steps to compute the monomials of degree 2 to 'degree'.
+
+    The monomials of degree 1 are the first 'dim' columns of the expansion.
+    The monomials of degree i are then computed by multiplying each input
+    variable j with a range of the monomials of degree i-1. The result is a
+    list of (j, src_start, src_stop, dst_start) tuples, the product of
+    variable j with the columns src_start:src_stop is stored in the columns
+    starting with dst_start.
+
+    The plans are cached, since they only depend on degree and dim.
+    """
+    key = (degree, dim)
+    if key in _polynomial_plans:
+        return _polynomial_plans[key]
+    plan = []
+    k = dim
+    prec_end = 0
+    # number of monomials of the previous degree that end with variable j
+    next_lens = [0] + [1]*dim
+    for i in range(2, degree+1):
+        prec_start = prec_end
+        prec_end += nmonomials(i-1, dim)
+        lens = numx.cumsum(next_lens[:-1])
+        next_lens = [0]*(dim+1)
+        for j in range(dim):
+            src_start = prec_start + int(lens[j])
+            len_ = prec_end - src_start
+            if len_ > 0:
+                plan.append((j, src_start, prec_end, k))
+            next_lens[j+1] = len_
+            k += len_
+    _polynomial_plans[key] = plan
+    return plan
+
 class _ExpansionNode(mdp.Node):
 
     def __init__(self, input_dim = None, dtype = None):
@@ -40,7 +78,16 @@ def _set_output_dim(self, n):
         raise mdp.NodeException(msg)
 
 class PolynomialExpansionNode(_ExpansionNode):
-    """Perform expansion in a polynomial space."""
+    """Perform expansion in a polynomial space.
+
+    The expansion is computed in blocks of rows, directly in the C contiguous
+    output array and without temporary arrays.
+    """
+
+    # approximate number of output elements that are computed in one block
+    block_elements = 2**21
+    # minimal number of rows in a block
+    min_block_rows = 32
 
     def __init__(self, degree, input_dim = None, dtype = None):
         """
@@ -61,34 +108,23 @@ def expanded_dim(self, dim):
         return expanded_dim(self._degree, dim)
 
     def _execute(self, x):
-        degree = self._degree
-        dim = self.input_dim
-        n = x.shape[1]
-
-        # preallocate memory
-        dexp = numx.zeros((self.output_dim, x.shape[0]), dtype=self.dtype)
-        # copy monomials of degree 1
-        dexp[0:n, :] = x.T
-
-        k = n
-        prec_end = 0
-        next_lens = numx.ones((dim+1, ))
-        next_lens[0] = 0
-        for i in range(2, degree+1):
-            prec_start = prec_end
-            prec_end += nmonomials(i-1, dim)
-            prec = dexp[prec_start:prec_end, :]
-
-            lens = next_lens[:-1].cumsum(axis=0)
-            next_lens = numx.zeros((dim+1, ))
-            for j in range(dim):
-                factor = prec[lens[j]:, :]
-                len_ = factor.shape[0]
-                dexp[k:k+len_, :] = x[:, j] * factor
-                next_lens[j+1] = len_
-                k = k+len_
-
-        return dexp.T
+        plan = _get_polynomial_plan(self._degree, self.input_dim)
+        n = self.input_dim
+        rows = x.shape[0]
+        dexp = numx.empty((rows, self.output_dim), dtype=self.dtype)
+        block_rows = max(self.min_block_rows,
+                         self.block_elements // self.output_dim)
+        for start in range(0, rows, block_rows):
+            x_block = x[start:start+block_rows]
+            dexp_block = dexp[start:start+block_rows]
+            # copy monomials of degree 1
+            dexp_block[:, :n] = x_block
+            for j, src_start, src_stop, dst_start in plan:
+                numx.multiply(x_block[:, j:j+1],
+                              dexp_block[:, src_start:src_stop],
+                              dexp_block[:, dst_start:
+                                            dst_start+src_stop-src_start])
+        return dexp
 
 class QuadraticExpansionNode(PolynomialExpansionNode):
     """Perform expansion in the space formed by all linear and quadratic
@@ -113,8 +149,18 @@ class RBFExpansionNode(mdp.Node):
        y_j = exp(-0.5 * (x-c_j)^T S^-1 (x-c_j))
 
     for anisotropic RBFs.
+
+    The squared distances to all the centers are computed at once with
+    matrix products, in blocks of rows to limit the memory consumption.
+    For anisotropic RBFs the input is projected with the Cholesky factors
+    of all the inverse covariance matrices in a single matrix product.
     """
 
+    # approximate number of elements of the temporary arrays in a block
+    block_elements = 2**22
+    # default for nodes pickled by older versions
+    _whitening = None
+
     def __init__(self, centers, sizes, dtype = None):
         """
         :Arguments:
@@ -182,19 +228,74 @@ def _init_RBF(self, centers, sizes):
 
         self._centers = centers
         self._sizes = sizes
+        if not self._isotropic:
+            self._init_whitening()
+
+    def _init_whitening(self):
+        """Compute the joint projection matrix for the anisotropic RBFs.
+
+        With the Cholesky decomposition S_j^-1 = L_j L_j^T the exponent
+        becomes ||x L_j - c_j L_j||^2, so the input can be projected on all
+        the L_j with a single matrix product.
+        """
+        n, dim = self._centers.shape
+        if mdp.numx_description == 'scipy':
+            # scipy returns the upper triangular factor by default
+            kwargs = {'lower': True}
+        else:
+            kwargs = {}
+        try:
+            chol = numx.array([numx_linalg.cholesky(s, **kwargs)
+                               for s in self._sizes])
+        except numx_linalg.LinAlgError, exception:
+            msg = ("The covariance matrices of the RBFs must be positive "
+                   "definite (%s)" % str(exception))
+            raise mdp.NodeException(msg)
+        chol = chol.astype(self.dtype)
+        # _whitening[:, j*dim:(j+1)*dim] is L_j
+        self._whitening = chol.transpose(1, 0, 2).reshape(dim, n*dim).copy()
+        self._centers_white = (self._centers[:, :, numx.newaxis] *
+                               chol).sum(axis=1).reshape(n*dim)
 
     def _execute(self, x):
-        y = numx.zeros((x.shape[0], self._output_dim), dtype = self.dtype)
-        c, s = self._centers, self._sizes
-        for i in range(self._output_dim):
-            dist = x - c[i,:]
+        y = numx.empty((x.shape[0], self._output_dim), dtype = self.dtype)
+        if self._isotropic:
+            block_cols = self._output_dim
+        else:
+            block_cols = self._output_dim * self._input_dim
+        block_rows = max(1, self.block_elements // block_cols)
+        for start in range(0, x.shape[0], block_rows):
+            stop = start + block_rows
             if self._isotropic:
-                tmp = (dist**2.).sum(axis=1) / s[i]
+                tmp = self._isotropic_exponent(x[start:stop])
             else:
-                tmp = (dist*matmult(dist, s[i,:,:])).sum(axis=1)
-            y[:,i] = numx.exp(-0.5*tmp)
+                tmp = self._anisotropic_exponent(x[start:stop])
+            numx.exp(tmp, y[start:stop])
         return y
 
+    def _isotropic_exponent(self, x):
+        c = self._centers
+        # ||x-c||^2 = ||x||^2 + ||c||^2 - 2 x.c
+        tmp = mult(x, c.T)
+        tmp *= -2.
+        tmp += (x*x).sum(axis=1)[:, numx.newaxis]
+        tmp += (c*c).sum(axis=1)
+        # rounding errors can lead to small negative distances
+        numx.maximum(tmp, 0., tmp)
+        tmp *= -0.5 / self._sizes
+        return tmp
+
+    def _anisotropic_exponent(self, x):
+        if self._whitening is None:
+            self._init_whitening()
+        proj = mult(x, self._whitening)
+        proj -= self._centers_white
+        proj *= proj
+        tmp = proj.reshape(x.shape[0], self._output_dim,
+                           self._input_dim).sum(axis=2)
+        tmp *= -0.5
+        return tmp
+
 class GrowingNeuralGasExpansionNode(GrowingNeuralGasNode):
     """
     Perform a trainable radial basis expansion, where the centers and
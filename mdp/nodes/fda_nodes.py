@@ -161,5 +161,8 @@ def _execute(self, x, n=None):
             v = self.v
         return mdp.utils.mult(x-self.avg, v)
 
+    def _get_affine_map(self):
+        return self.v, -numx.ravel(mdp.utils.mult(self.avg, self.v))
+
     def _inverse(self, y):
         return mdp.utils.mult(y, mdp.utils.pinv(self.v))+self.avg
@@ -155,6 +155,16 @@ def _execute(self, x):
         # defining the linear transformation.
         return mult(x, self.filters)
 
+    def _get_affine_map(self):
+        if self.whitened:
+            return self.filters, numx.zeros(self.filters.shape[1],
+                                            dtype=self.filters.dtype)
+        affine_map = self.white.get_affine_map()
+        if affine_map is None:
+            return None
+        A, b = affine_map
+        return mult(A, self.filters), mult(b, self.filters)
+
     def _inverse(self, y):
         y = mult(y, self.filters.T)
         if not self.whitened:
@@ -291,6 +301,12 @@ class FastICANode(ICANode):
     actually accumulates all inputs it receives. Remember that to avoid
     running out of memory when you have many components and many time samples.
 
+    Alternatively the node can be trained in mini-batch mode (see the
+    ``batch_size`` argument). The input data is then not accumulated,
+    instead the filters are updated with mini-batches of each chunk of
+    data and the node has one training phase for each pass through the
+    data (plus one for the whitening if needed).
+
     FastICA does not support the telescope mode (the convergence
     criterium is not robust in telescope mode).
 
@@ -321,15 +337,24 @@ class FastICANode(ICANode):
     - 26.6.2006 converted to numpy
     - 14.9.2007 updated to Matlab version 2.5
     - 26.6.2012 added ability to run two stages of optimization [PK]
+    - 16.10.2026 vectorized the fixed-point iterations, added mini-batch mode
     """
 
+    # approximate number of elements of the temporary arrays in a block
+    # of samples during the fixed-point iterations
+    block_elements = 2**22
+    # defaults for nodes pickled by older versions
+    batch_size = None
+    max_epochs = 20
+
     def __init__(self, approach = 'defl', g = 'pow3', guess = None,
                  fine_g = 'pow3', mu = 1,
                  sample_size = 1, fine_tanh = 1, fine_gaus = 1,
                  max_it = 5000, max_it_fine = 100,
                  failures = 5, coarse_limit=None, limit = 0.001,  verbose = False,
                  whitened = False, white_comp = None, white_parm = None,
-                 input_dim = None, dtype=None):
+                 input_dim = None, dtype=None, batch_size = None,
+                 max_epochs = 20):
         """
         Input arguments:
 
@@ -391,6 +416,16 @@ def __init__(self, approach = 'defl', g = 'pow3', guess = None,
 
          failures -- maximum number of failures to allow in deflation mode
 
+       batch_size -- If not None, train in mini-batch mode: each chunk of
+                     training data is split in mini-batches of about
+                     batch_size samples, and a fixed-point step is done for
+                     every mini-batch. Only the symmetric approach is
+                     supported in this mode.
+
+       max_epochs -- number of passes through the data in mini-batch mode,
+                     i.e. the number of ICA training phases. After
+                     convergence the remaining passes are skipped.
+
         """
         super(FastICANode, self).__init__(limit, False, verbose, whitened,
                                           white_comp, white_parm, input_dim,
@@ -427,510 +462,439 @@ def __init__(self, approach = 'defl', g = 'pow3', guess = None,
         self.failures = failures
         self.guess = guess
 
-    def _get_rsamples(self, X):
-        tlen = X.shape[1]
+        if batch_size is not None:
+            if approach != 'symm':
+                errmsg = "The mini-batch mode requires approach='symm'"
+                raise mdp.NodeException(errmsg)
+            if not self.whitened:
+                self.white = None
+            self.filters = None
+            self.convergence = []
+            self._converged = False
+            self._fine_tuned = False
+            self._epoch_filters = None
+            self._used_g = None
+            self._mu = None
+        self.batch_size = batch_size
+        self.max_epochs = max_epochs
+
+    def _get_rsamples(self, x):
+        tlen = x.shape[0]
         mask = numx.where(numx_rand.random(tlen) < self.sample_size)[0]
-        return X[:, mask]
+        return x[mask]
 
-    def core(self, data):
-        # this is a more or less line per line translation of the original
-        # matlab code.
-        # Everything could be done better and more efficiently.
-        # I just had no time at the moment to do it.
-        # The logic behind the used_g hell is beyond my understanding :-)))
+    def _get_train_seq(self):
+        if self.batch_size is None:
+            return [(self._train, self._stop_training)]
+        train_seq = []
+        if not self.whitened:
+            train_seq.append((self._train_whitening,
+                              self._stop_whitening))
+        train_seq += [(self._train_batches,
+                       self._stop_epoch)] * self.max_epochs
+        return train_seq
 
-        X = data.T
+    def _nonlinearity(self, g, u):
+        """Return g(u) and the sum of g'(u) over the samples.
 
-        # casted constants
-        comp = X.shape[0]
-        tlen = X.shape[1]
-        dtype = self.dtype
+        The array u is overwritten.
+        """
+        if g == 'pow3':
+            G = u*u
+            G *= u
+            dG = 3.*u.shape[0]
+        elif g == 'tanh':
+            fine_tanh = self.fine_tanh
+            u *= fine_tanh
+            G = numx.tanh(u, u)
+            dG = fine_tanh * (u.shape[0] - (G*G).sum(axis=0))
+        elif g == 'gaus':
+            u2 = u*u
+            ex = u2 * (-0.5*self.fine_gaus)
+            numx.exp(ex, ex)
+            u2 *= ex
+            dG = ex.sum(axis=0) - self.fine_gaus * u2.sum(axis=0)
+            G = u
+            G *= ex
+        elif g == 'skew':
+            G = u
+            G *= u
+            dG = 0.
+        else:
+            errstr = 'Nonlinearity not found: %s' % g
+            raise mdp.NodeException(errstr)
+        return G, dG
 
-        # Default values and initial definitions
-        fine_tanh = self.fine_tanh
-        fine_gaus = self.fine_gaus
-        approach = self.approach
-        g = self.g
-        fine_g = self.fine_g
-        stabilization = self.stabilization
-        mu = self.mu
-        sample_size = self.sample_size
+    def _fixed_point_stats(self, x, Q, g):
+        """Return E{x g(x Q)} and E{g'(x Q)} for all the columns of Q.
+
+        The samples are processed in blocks of rows, so that the
+        temporary arrays stay small.
+        """
+        tlen = x.shape[0]
+        block_rows = max(1, self.block_elements // max(1, Q.shape[1]))
+        EXG = numx.zeros(Q.shape, dtype=x.dtype)
+        dG = 0.
+        for start in range(0, tlen, block_rows):
+            x_block = x[start:start+block_rows]
+            G, dG_block = self._nonlinearity(g, mult(x_block, Q))
+            EXG += mult(x_block.T, G)
+            dG += dG_block
+        EXG /= tlen
+        return EXG, dG / tlen
+
+    def _symm_orthogonalize(self, Q):
+        """Symmetric orthogonalization, Q (Q^T Q)^(-1/2)."""
+        d, V = utils.symeig(mult(Q.T, Q))
+        return mult(Q, mult(V / numx.sqrt(d), V.T)).astype(Q.dtype)
+
+    def _symm_step(self, x, Q, used_g, mu):
+        """Perform a fixed-point step for all the columns of Q at once."""
+        g, subsample, stabilized = used_g
+        if subsample:
+            x = self._get_rsamples(x)
+        EXG, EdG = self._fixed_point_stats(x, Q, g)
+        if not stabilized:
+            return EXG - EdG * Q
+        # Beta_i = E{u_i g(u_i)}
+        Beta = (Q * EXG).sum(axis=0)
+        step = (mult(Q.T, EXG) - numx.diag(Beta)) / (Beta - EdG)
+        return Q + mu * mult(Q, step)
+
+    def _defl_step(self, x, w, used_g, mu):
+        """Perform a fixed-point step for the single vector w."""
+        g, subsample, stabilized = used_g
+        if subsample:
+            x = self._get_rsamples(x)
+        EXG, EdG = self._fixed_point_stats(x, w[:, numx.newaxis], g)
+        EXG = EXG[:, 0]
+        if not stabilized:
+            return EXG - EdG * w
+        Beta = mult(w, EXG)
+        return w - mu * (EXG - Beta*w) / (EdG - Beta)
+
+    def _get_guess(self, comp):
         if self.guess is None:
             # Take random orthonormal initial vectors.
-            guess = utils.random_rot(comp, dtype)
+            return utils.random_rot(comp, self.dtype)
+        # Use user supplied mixing matrix
+        guess = self._refcast(self.guess)
+        if not self.whitened:
+            guess = mult(guess, self.white.get_recmatrix(transposed=1))
+        return guess
+
+    def _get_nonlinearities(self):
+        """Return the initial and the fine tuning nonlinearity.
+
+        A nonlinearity is given as a (g, subsample, stabilized) tuple,
+        where stabilized is True if the step size mu is used.
+        """
+        g_orig = (self.g, self.sample_size != 1, self.mu != 1)
+        if self.fine_g is not None:
+            g_fine = (self.fine_g, False, True)
         else:
-            # Use user supplied mixing matrix
-            guess = self._refcast(self.guess)
-            if not self.whitened:
-                guess = mult(guess, self.white.get_recmatrix(transposed=1))
+            g_fine = (self.g, self.sample_size != 1, True)
+        return g_orig, g_fine
 
+    def core(self, data):
+        if self.approach == 'symm':
+            return self._core_symm(data)
+        else:
+            return self._core_defl(data)
+
+    def _core_symm(self, x):
+        dtype = self.dtype
         limit = self.limit
         coarse_limit = self.coarse_limit
         max_it = self.max_it
-        max_it_fine = self.max_it_fine
-        failures = self.failures
         verbose = self.verbose
+        g_orig, g_fine = self._get_nonlinearities()
+        fine_tuning = self.fine_g is not None
+        stabilization = self.stabilization
 
-        # set non linearities. don't blame me for the awful logic: it comes
-        # from the matlab program. I didn't dare to understand it and change
-        # it.
-        if g == 'pow3':
-            gOrig = 10
-        elif g == 'tanh':
-            gOrig = 20
-        elif g == 'gaus':
-            gOrig = 30
-        else:
-            gOrig = 40
-
-        if sample_size != 1:
-            gOrig += 2
-        if mu != 1:
-            gOrig += 1
-
-        fine_tuning = True
-        if fine_g == 'pow3':
-            gFine = 11
-        elif fine_g == 'tanh':
-            gFine = 21
-        elif fine_g == 'gaus':
-            gFine = 31
-        elif fine_g == 'skew':
-            gFine = 41
-        else:
-            if mu == 1:
-                gFine = gOrig + 1
-            else:
-                stabilization = True
-                gFine = gOrig
-            fine_tuning = False
-
+        mu = self.mu
         muK = 0.01
-        used_g = gOrig
+        used_g = g_orig
         stroke = 0
         fine_tuned = False
         coarse_limit_reached = False
         lng = False
 
-        # SYMMETRIC APPROACH
-        if approach == 'symm':
-            # create list to store convergence
-            convergence = []
-            convergence_fine = []
-            # orthonormal initial vectors.
-            Q = guess
-            QOld = numx.zeros(Q.shape, dtype)
-            QOldF = numx.zeros(Q.shape, dtype)
-            # This is the actual fixed-point iteration loop.
-            for round in range(max_it + 1):
-                if round == max_it:
-                    errstr = 'No convergence after %d steps\n' % max_it
-                    raise mdp.NodeException(errstr)
-
-
-                # Symmetric orthogonalization. Q = Q * real(inv(Q' * Q)^(1/2));
-                Q = mult(Q, utils.sqrtm(utils.inv(mult(Q.T, Q))))
-
-                # Test for termination condition. Note that we consider
-                # opposite directions here as well.
-                v1 = 1.-abs((mult(Q.T, QOld)).diagonal()).min(axis=0)
-                convergence.append(v1)
-                v2 = 1.-abs((mult(Q.T, QOldF)).diagonal()).min(axis=0)
-                convergence_fine.append(v2)
-
-                if self.g != self.fine_g \
-                   and coarse_limit is not None \
-                   and convergence[round] < coarse_limit \
-                   and not coarse_limit_reached:
+        # create list to store convergence
+        convergence = []
+        convergence_fine = []
+        # orthonormal initial vectors.
+        Q = self._get_guess(x.shape[1])
+        QOld = numx.zeros(Q.shape, dtype)
+        QOldF = numx.zeros(Q.shape, dtype)
+        # This is the actual fixed-point iteration loop.
+        for round in range(max_it + 1):
+            if round == max_it:
+                errstr = 'No convergence after %d steps\n' % max_it
+                raise mdp.NodeException(errstr)
+
+            Q = self._symm_orthogonalize(Q)
+
+            # Test for termination condition. Note that we consider
+            # opposite directions here as well.
+            v1 = 1.-abs((mult(Q.T, QOld)).diagonal()).min(axis=0)
+            convergence.append(v1)
+            v2 = 1.-abs((mult(Q.T, QOldF)).diagonal()).min(axis=0)
+            convergence_fine.append(v2)
+
+            if self.g != self.fine_g \
+               and coarse_limit is not None \
+               and convergence[round] < coarse_limit \
+               and not coarse_limit_reached:
+                if verbose:
+                    print 'Coarse convergence, switching to fine cost...'
+                used_g = g_fine
+                coarse_limit_reached = True
+
+            if convergence[round] < limit:
+                if fine_tuning and (not fine_tuned):
+                    if verbose:
+                        print 'Initial convergence, fine-tuning...'
+                    fine_tuned = True
+                    used_g = g_fine
+                    mu = muK * self.mu
+                    QOld = numx.zeros(Q.shape, dtype)
+                    QOldF = numx.zeros(Q.shape, dtype)
+                else:
                     if verbose:
-                        print 'Coarse convergence, switching to fine cost...'
-                    used_g = gFine
-                    coarse_limit_reached = True
+                        print 'Convergence after %d steps\n' % round
+                    break
+            if stabilization:
+                if (stroke == 0) and (convergence_fine[round] < limit):
+                    if verbose:
+                        print 'Stroke!\n'
+                    stroke = mu
+                    mu = 0.5*mu
+                    used_g = used_g[:2] + (True,)
+                elif (stroke != 0):
+                    mu = stroke
+                    stroke = 0
+                    if mu == 1:
+                        used_g = used_g[:2] + (False,)
+                elif (not lng) and (round > max_it//2):
+                    if verbose:
+                        print 'Taking long (reducing step size)...'
+                    lng = True
+                    mu = 0.5*mu
+                    used_g = used_g[:2] + (True,)
+
+            QOldF = QOld
+            QOld = Q
+
+            # Show the progress...
+            if verbose:
+                msg = ('Step no. %d,'
+                       ' convergence: %.7f' % (round+1,convergence[round]))
+                print msg
 
-                if convergence[round] < limit:
+            Q = self._symm_step(x, Q, used_g, mu)
+
+        self.convergence = numx.array(convergence)
+        self.convergence_fine = numx.array(convergence_fine)
+        self.filters = Q
+        return convergence[-1]
+
+    def _core_defl(self, x):
+        dtype = self.dtype
+        comp = x.shape[1]
+        limit = self.limit
+        max_it = self.max_it
+        max_it_fine = self.max_it_fine
+        failures = self.failures
+        verbose = self.verbose
+        g_orig, g_fine = self._get_nonlinearities()
+        fine_tuning = self.fine_g is not None
+        stabilization = self.stabilization
+        muK = 0.01
+        guess = self._get_guess(comp)
+
+        # create array to store convergence
+        convergence = []
+        convergence_fine = []
+        Q = numx.zeros((comp, comp), dtype=dtype)
+        round = 0
+        nfail = 0
+        while round < comp:
+            mu = self.mu
+            used_g = g_orig
+            stroke = 0
+            fine_tuned = False
+            lng = False
+            end_finetuning = 0
+
+            # Take a random initial vector of lenght 1 and orthogonalize it
+            # with respect to the other vectors.
+            w = guess[:, round].copy()
+            w -= mult(Q, mult(Q.T, w))
+            w /= utils.norm2(w)
+
+            wOld = numx.zeros(w.shape, dtype)
+            wOldF = numx.zeros(w.shape, dtype)
+            # This is the actual fixed-point iteration loop.
+            i = 1
+            gabba = 1
+            while i <= max_it + gabba:
+                # Project the vector into the space orthogonal to the space
+                # spanned by the earlier found basis vectors. Note that
+                # we can do the projection with matrix Q, since the zero
+                # entries do not contribute to the projection.
+                w -= mult(Q, mult(Q.T, w))
+                w /= utils.norm2(w)
+
+                if not fine_tuned:
+                    if i == max_it + 1:
+                        err_msg = ('Component number %d did not'
+                                   'converge in %d iterations.' % (round,
+                                                                   max_it))
+                        if verbose:
+                            print err_msg
+                        if round == 0:
+                            raise mdp.NodeException(err_msg)
+                        nfail += 1
+                        if nfail > failures:
+                            err = ('Too many failures to '
+                                   'converge (%d). Giving up.' % nfail)
+                            raise mdp.NodeException(err)
+                        break
+                else:
+                    if i >= end_finetuning:
+                        wOld = w
+
+                # Test for termination condition. Note that the algorithm
+                # has converged if the direction of w and wOld is the same.
+                conv = min(utils.norm2(w-wOld), utils.norm2(w+wOld))
+                convergence.append(conv)
+                if conv < limit:
                     if fine_tuning and (not fine_tuned):
                         if verbose:
                             print 'Initial convergence, fine-tuning...'
                         fine_tuned = True
-                        used_g = gFine
+                        gabba = max_it_fine
+                        wOld = numx.zeros(w.shape, dtype)
+                        wOldF = numx.zeros(w.shape, dtype)
+                        used_g = g_fine
                         mu = muK * self.mu
-                        QOld = numx.zeros(Q.shape, dtype)
-                        QoldF = numx.zeros(Q.shape, dtype)
+                        end_finetuning = max_it_fine + i
                     else:
+                        nfail = 0
+                        convergence[round] = conv
+                        # Calculate ICA filter.
+                        Q[:, round] = w
+                        # Show the progress...
                         if verbose:
-                            print 'Convergence after %d steps\n' % round
+                            print 'IC %d computed ( %d steps )' % (round+1,
+                                                                   i+1)
                         break
-                if stabilization:
-                    if (stroke == 0) and (convergence_fine[round] < limit):
+                elif stabilization:
+                    conv_fine = min(utils.norm2(w-wOldF),
+                                    utils.norm2(w+wOldF))
+                    convergence_fine.append(conv_fine)
+                    if  (stroke == 0) and conv_fine < limit:
                         if verbose:
-                            print 'Stroke!\n'
+                            print 'Stroke!'
                         stroke = mu
                         mu = 0.5*mu
-                        if used_g % 2 == 0:
-                            used_g += 1
+                        used_g = used_g[:2] + (True,)
                     elif (stroke != 0):
                         mu = stroke
                         stroke = 0
-                        if (mu == 1) and (used_g % 2 != 0):
-                            used_g -= 1
-                    elif (not lng) and (round > max_it//2):
+                        if mu == 1:
+                            used_g = used_g[:2] + (False,)
+                    elif (not lng) and (i > max_it//2):
                         if verbose:
                             print 'Taking long (reducing step size)...'
                         lng = True
                         mu = 0.5*mu
-                        if used_g % 2 == 0:
-                            used_g += 1
+                        used_g = used_g[:2] + (True,)
 
-                QOldF = QOld
-                QOld = Q
+                wOldF = wOld
+                wOld = w
+                w = self._defl_step(x, w, used_g, mu)
 
-                # Show the progress...
-                if verbose:
-                    msg = ('Step no. %d,'
-                           ' convergence: %.7f' % (round+1,convergence[round]))
-                    print msg
-
-
-                # First calculate the independent components (u_i's).
-                # u_i = b_i' x = x' b_i. For all x:s simultaneously this is
-                # non linearity
-                if used_g == 10:
-                    u = mult(X.T, Q)
-                    Q = mult(X, u*u*u)/tlen - 3.*Q
-                elif used_g == 11:
-                    u = mult(X.T, Q)
-                    Gpow3 = u*u*u
-                    Beta = (u*Gpow3).sum(axis=0)
-                    D = numx.diag((1/(Beta - 3*tlen)))
-                    Q = Q + mu * mult(Q, mult((mult(u.T, Gpow3) -
-                                               numx.diag(Beta)), D))
-                elif used_g == 12:
-                    Xsub = self._get_rsamples(X)
-                    u = mult(Xsub.T, Q)
-                    Q = mult(Xsub, u*u*u)/Xsub.shape[1] - 3.*Q
-                elif used_g == 13:
-                    Xsub = self._get_rsamples(X)
-                    u = mult(Xsub.T, Q)
-                    Gpow3 = u*u*u
-                    Beta = (u*Gpow3).sum(axis=0)
-                    D = numx.diag((1/(Beta - 3*Xsub.shape[1])))
-                    Q = Q + mu * mult(Q, mult((mult(u.T, Gpow3) -
-                                               numx.diag(Beta)), D))
-                elif used_g == 20:
-                    u = mult(X.T, Q)
-                    tang = numx.tanh(fine_tanh * u)
-                    temp = (1.-tang*tang).sum(axis=0)/tlen
-                    Q = mult(X, tang)/tlen - temp * Q * fine_tanh
-                elif used_g == 21:
-                    u = mult(X.T, Q)
-                    tang = numx.tanh(fine_tanh * u)
-                    Beta = (u*tang).sum(axis=0)
-                    D = numx.diag(1/(Beta -
-                                     fine_tanh*(1.-tang*tang).sum(axis=0)))
-                    Q = Q + mu * mult(Q,
-                                 mult((mult(u.T, tang)-
-                                       numx.diag(Beta)), D))
-                elif used_g == 22:
-                    Xsub = self._get_rsamples(X)
-                    u = mult(Xsub.T, Q)
-                    tang = numx.tanh(fine_tanh * u)
-                    temp = (1.-tang*tang).sum(axis=0)/Xsub.shape[1]
-                    Q = mult(Xsub, tang)/Xsub.shape[1] - temp * Q * fine_tanh
-                elif used_g == 23:
-                    Xsub = self._get_rsamples(X)
-                    u = mult(Xsub.T, Q)
-                    tang = numx.tanh(fine_tanh * u)
-                    Beta = (u*tang).sum(axis=0)
-                    D = numx.diag(1/(Beta -
-                                     fine_tanh*(1.-tang*tang).sum(axis=0)))
-                    Q = Q + mu * mult(Q,
-                                 mult((mult(u.T, tang)-
-                                       numx.diag(Beta)), D))
-                elif used_g == 30:
-                    u = mult(X.T, Q)
-                    u2 = u*u
-                    ex = numx.exp(-fine_gaus*u2*0.5)
-                    gauss =  u*ex
-                    dgauss = (1. - fine_gaus*u2)*ex
-                    Q = (mult(X, gauss)-dgauss.sum(axis=0)*Q)/tlen
-                elif used_g == 31:
-                    u = mult(X.T, Q)
-                    u2 = u*u
-                    ex = numx.exp(-fine_gaus*u2*0.5)
-                    gaus =  u*ex
-                    Beta = (u*gaus).sum(axis=0)
-                    D = numx.diag(1/(Beta -
-                                     ((1-fine_gaus*u2)*ex).sum(axis=0)))
-                    Q = Q + mu * mult(Q,
-                                 mult((mult(u.T, gaus)-
-                                       numx.diag(Beta)), D))
-                elif used_g == 32:
-                    Xsub = self._get_rsamples(X)
-                    u = mult(Xsub.T, Q)
-                    u2 = u*u
-                    ex = numx.exp(-fine_gaus*u2*0.5)
-                    gauss =  u*ex
-                    dgauss = (1. - fine_gaus*u2)*ex
-                    Q = (mult(Xsub, gauss)-dgauss.sum(axis=0)*Q)/Xsub.shape[1]
-                elif used_g == 33:
-                    Xsub = self._get_rsamples(X)
-                    u = mult(Xsub.T, Q)
-                    u2 = u*u
-                    ex = numx.exp(-fine_gaus*u2*0.5)
-                    gaus = u*ex
-                    Beta = (u*gaus).sum(axis=0)
-                    D = numx.diag(1/(Beta -
-                                     ((1-fine_gaus*u2)*ex).sum(axis=0)))
-                    Q = Q + mu * mult(Q, mult((mult(u.T, gaus)-
-                                               numx.diag(Beta)), D))
-                elif used_g == 40:
-                    u = mult(X.T, Q)
-                    Q = mult(X, u*u)/tlen
-                elif used_g == 41:
-                    u = mult(X.T, Q)
-                    Gskew = u*u
-                    Beta = (u*Gskew).sum(axis=0)
-                    D = numx.diag(1/Beta)
-                    Q =  Q + mu * mult(Q, mult((mult(u.T, Gskew)-
-                                                numx.diag(Beta)), D))
-                elif used_g == 42:
-                    Xsub = self._get_rsamples(X)
-                    u = mult(Xsub.T, Q)
-                    Q = mult(Xsub, u*u)/Xsub.shape[1]
-                elif used_g == 43:
-                    Xsub = self._get_rsamples(X)
-                    u = mult(Xsub.T, Q)
-                    Gskew = u*u
-                    Beta = (u*Gskew).sum(axis=0)
-                    D = numx.diag(1/Beta)
-                    Q =  Q + mu * mult(Q, mult((mult(u.T, Gskew)-
-                                                numx.diag(Beta)), D))
-                else:
-                    errstr = 'Nonlinearity not found: %i' % used_g
-                    raise mdp.NodeException(errstr)
-
-            self.convergence = numx.array(convergence)
-            self.convergence_fine = numx.array(convergence_fine)
-            ret = convergence[-1]
-        # DEFLATION APPROACH
-        elif approach == 'defl':
-            # adjust limit!
-            #limit = 1 - limit*limit*0.5
-            # create array to store convergence
-            convergence = []
-            convergence_fine = []
-            Q = numx.zeros((comp, comp), dtype=dtype)
-            round = 0
-            nfail = 0
-            while round < comp:
-                mu = self.mu
-                used_g = gOrig
-                stroke = 0
-                fine_tuned = False
-                lng = False
-                end_finetuning = 0
-
-                # Take a random initial vector of lenght 1 and orthogonalize it
-                # with respect to the other vectors.
-                w  = guess[:, round]
-                w -= mult(mult(Q, Q.T), w)
+                # Normalize the new w.
                 w /= utils.norm2(w)
+                i += 1
 
-                wOld = numx.zeros(w.shape, dtype)
-                wOldF = numx.zeros(w.shape, dtype)
-                # This is the actual fixed-point iteration loop.
-                i = 1
-                gabba = 1
-                #for i in range(max_it + 1):
-                while i <= max_it + gabba:
-                    # Project the vector into the space orthogonal to the space
-                    # spanned by the earlier found basis vectors. Note that
-                    # we can do the projection with matrix Q, since the zero
-                    # entries do not contribute to the projection.
-                    w -= mult(mult(Q, Q.T), w)
-                    w /= utils.norm2(w)
-
-                    if not fine_tuned:
-                        if i == max_it + 1:
-                            err_msg = ('Component number %d did not'
-                                       'converge in %d iterations.' % (round,
-                                                                       max_it))
-                            if verbose:
-                                print err_msg
-                            if round == 0:
-                                raise mdp.NodeException(err_msg)
-                            nfail += 1
-                            if nfail > failures:
-                                err = ('Too many failures to '
-                                       'converge (%d). Giving up.' % nfail)
-                                raise mdp.NodeException(err)
-                            break
-                    else:
-                        if i >= end_finetuning:
-                            wOld = w
-
-                    # Test for termination condition. Note that the algorithm
-                    # has converged if the direction of w and wOld is the same.
-                    #conv = float(abs((w*wOld).sum()))
-                    conv = min(utils.norm2(w-wOld), utils.norm2(w+wOld))
-                    convergence.append(conv)
-                    if conv < limit:
-                        if fine_tuning and (not fine_tuned):
-                            if verbose:
-                                print 'Initial convergence, fine-tuning...'
-                            fine_tuned = True
-                            gabba = max_it_fine
-                            wOld = numx.zeros(w.shape, dtype)
-                            wOldF = numx.zeros(w.shape, dtype)
-                            used_g = gFine
-                            mu = muK * self.mu
-                            end_finetuning = max_it_fine + i
-                        else:
-                            nfail = 0
-                            convergence[round] = conv
-                            # Calculate ICA filter.
-                            Q[:, round] = w.copy()
-                            # Show the progress...
-                            if verbose:
-                                print 'IC %d computed ( %d steps )' % (round+1,
-                                                                       i+1)
-                            break
-                    elif stabilization:
-                        conv_fine = min(utils.norm2(w-wOldF),
-                                        utils.norm2(w+wOldF))
-                        convergence_fine.append(conv_fine)
-                        if  (stroke == 0) and conv_fine < limit:
-                            if verbose:
-                                print 'Stroke!'
-                            stroke = mu
-                            mu = 0.5*mu
-                            if used_g % 2 == 0:
-                                used_g += 1
-                        elif (stroke != 0):
-                            mu = stroke
-                            stroke = 0
-                            if (mu == 1) and (used_g % 2 != 0):
-                                used_g -= 1
-                        elif (not lng) and (i > max_it//2):
-                            if verbose:
-                                print 'Taking long (reducing step size)...'
-                            lng = True
-                            mu = 0.5*mu
-                            if used_g % 2 == 0:
-                                used_g += 1
-
-                    wOldF = wOld
-                    wOld = w
-                    if used_g == 10:
-                        u = mult(X.T, w)
-                        w = mult(X, u*u*u)/tlen - 3.*w
-                    elif used_g == 11:
-                        u = mult(X.T, w)
-                        EXGpow3 = mult(X, u*u*u)/tlen
-                        Beta = mult(w.T, EXGpow3)
-                        w = w - mu * (EXGpow3 - Beta*w)/(3-Beta)
-                    elif used_g == 12:
-                        Xsub = self._get_rsamples(X)
-                        u = mult(Xsub.T, w)
-                        w = mult(Xsub, u*u*u)/Xsub.shape[1] - 3.*w
-                    elif used_g == 13:
-                        Xsub = self._get_rsamples(X)
-                        u = mult(Xsub.T, w)
-                        EXGpow3 = mult(Xsub, u*u*u)/Xsub.shape[1]
-                        Beta = mult(w.T, EXGpow3)
-                        w = w - mu * (EXGpow3 - Beta*w)/(3-Beta)
-                    elif used_g == 20:
-                        u = mult(X.T, w)
-                        tang = numx.tanh(fine_tanh * u)
-                        temp = mult((1. - tang*tang).sum(axis=0), w)
-                        w = (mult(X, tang) - fine_tanh*temp)/tlen
-                    elif used_g == 21:
-                        u = mult(X.T, w)
-                        tang = numx.tanh(fine_tanh * u)
-                        Beta = mult(u.T, tang)
-                        temp = (1. - tang*tang).sum(axis=0)
-                        w = w-mu*((mult(X, tang)-Beta*w)/(fine_tanh*temp-Beta))
-                    elif used_g == 22:
-                        Xsub = self._get_rsamples(X)
-                        u = mult(Xsub.T, w)
-                        tang = numx.tanh(fine_tanh * u)
-                        temp = mult((1. - tang*tang).sum(axis=0), w)
-                        w = (mult(Xsub, tang) - fine_tanh*temp)/Xsub.shape[1]
-                    elif used_g == 23:
-                        Xsub = self._get_rsamples(X)
-                        u = mult(Xsub.T, w)
-                        tang = numx.tanh(fine_tanh * u)
-                        Beta = mult(u.T, tang)
-                        w = w - mu * ((mult(Xsub, tang)-Beta*w) /
-                                      (fine_tanh*(1. - tang*tang).sum(axis=0) -
-                                       Beta))
-                    elif used_g == 30:
-                        u = mult(X.T, w)
-                        u2 = u*u
-                        ex = numx.exp(-fine_gaus*u2*0.5)
-                        gauss =  u*ex
-                        dgauss = (1. - fine_gaus *u2)*ex
-                        w = (mult(X, gauss)-mult(dgauss.sum(axis=0), w))/tlen
-                    elif used_g == 31:
-                        u = mult(X.T, w)
-                        u2 = u*u
-                        ex = numx.exp(-fine_gaus*u2*0.5)
-                        gauss =  u*ex
-                        dgauss = (1. - fine_gaus *u2)*ex
-                        Beta = mult(u.T, gauss)
-                        w = w - mu*((mult(X, gauss)-Beta*w)/
-                                    (dgauss.sum(axis=0)-Beta))
-                    elif used_g == 32:
-                        Xsub = self._get_rsamples(X)
-                        u = mult(Xsub.T, w)
-                        u2 = u*u
-                        ex = numx.exp(-fine_gaus*u2*0.5)
-                        gauss =  u*ex
-                        dgauss = (1. - fine_gaus *u2)*ex
-                        w = (mult(Xsub, gauss)-
-                             mult(dgauss.sum(axis=0), w))/Xsub.shape[1]
-                    elif used_g == 33:
-                        Xsub = self._get_rsamples(X)
-                        u = mult(Xsub.T, w)
-                        u2 = u*u
-                        ex = numx.exp(-fine_gaus*u2*0.5)
-                        gauss =  u*ex
-                        dgauss = (1. - fine_gaus *u2)*ex
-                        Beta = mult(u.T, gauss)
-                        w = w - mu*((mult(Xsub, gauss)-Beta*w)/
-                                    (dgauss.sum(axis=0)-Beta))
-                    elif used_g == 40:
-                        u = mult(X.T, w)
-                        w = mult(X, u*u)/tlen
-                    elif used_g == 41:
-                        u = mult(X.T, w)
-                        EXGskew = mult(X, u*u) / tlen
-                        Beta = mult(w.T, EXGskew)
-                        w = w - mu * (EXGskew - mult(Beta, w))/(-Beta)
-                    elif used_g == 42:
-                        Xsub = self._get_rsamples(X)
-                        u = mult(Xsub.T, w)
-                        w = mult(Xsub, u*u)/Xsub.shape[1]
-                    elif used_g == 43:
-                        Xsub = self._get_rsamples(X)
-                        u = mult(Xsub.T, w)
-                        EXGskew = mult(Xsub, u*u) / Xsub.shape[1]
-                        Beta = mult(w.T, EXGskew)
-                        w = w - mu * (EXGskew - Beta*w)/(-Beta)
-                    else:
-                        errstr = 'Nonlinearity not found: %i' % used_g
-                        raise mdp.NodeException(errstr)
+            round += 1
+        self.convergence = numx.array(convergence)
+        self.convergence_fine = numx.array(convergence_fine)
+        self.filters = Q
+        return convergence[-1]
+
+    ## mini-batch mode ##
+
+    def _train_whitening(self, x):
+        if self.white is None:
+            self.white = mdp.nodes.WhiteningNode(output_dim=self.white_comp,
+                                                 dtype=self.dtype,
+                                                 **self.white_parm)
+        self.white.train(x)
 
-                    # Normalize the new w.
-                    w /= utils.norm2(w)
-                    i += 1
+    def _stop_whitening(self):
+        self.white.stop_training()
+        self.output_dim = self.white.output_dim
 
-                round += 1
-            self.convergence = numx.array(convergence)
-            self.convergence_fine = numx.array(convergence_fine)
-            ret = convergence[-1]
+    def _train_batches(self, x):
+        """Update the filters with the mini-batches contained in x."""
+        if self._converged:
+            return
+        if not self.whitened:
+            x = self.white.execute(x)
+        if self.filters is None:
+            # first epoch
+            self.filters = self._symm_orthogonalize(
+                                            self._get_guess(x.shape[1]))
+            self._used_g = self._get_nonlinearities()[0]
+            self._mu = self.mu
+        if self._epoch_filters is None:
+            self._epoch_filters = self.filters
+        # split x in batches of almost equal size
+        n_batches = max(1, x.shape[0] // self.batch_size)
+        bounds = [(i * x.shape[0]) // n_batches
+                  for i in range(n_batches + 1)]
+        Q = self.filters
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            Q = self._symm_step(x[start:stop], Q, self._used_g, self._mu)
+            Q = self._symm_orthogonalize(Q)
         self.filters = Q
-        return ret
+
+    def _stop_epoch(self):
+        """Check the convergence after a full pass through the data."""
+        if not self._converged and self._epoch_filters is not None:
+            Q, QOld = self.filters, self._epoch_filters
+            conv = 1.-abs((mult(Q.T, QOld)).diagonal()).min(axis=0)
+            self.convergence.append(conv)
+            self._epoch_filters = None
+            if self.verbose:
+                print ('Epoch no. %d, convergence: %.7f' %
+                       (len(self.convergence), conv))
+            if (self.g != self.fine_g and self.coarse_limit is not None
+                and conv < self.coarse_limit):
+                self._used_g = self._get_nonlinearities()[1]
+            if conv < self.limit:
+                if self.fine_g is not None and not self._fine_tuned:
+                    if self.verbose:
+                        print 'Initial convergence, fine-tuning...'
+                    self._fine_tuned = True
+                    self._used_g = self._get_nonlinearities()[1]
+                    self._mu = 0.01 * self.mu
+                else:
+                    if self.verbose:
+                        print ('Convergence after %d epochs' %
+                               len(self.convergence))
+                    self._converged = True
+        if self.get_remaining_train_phase() == 1:
+            # this is the last epoch
+            if not self._converged and self.verbose:
+                print 'No convergence after %d epochs' % self.max_epochs
+            self.convergence = numx.array(self.convergence)
+            self.convergence_fine = numx.array([])
+            del self._used_g, self._mu, self._epoch_filters
 
 
 class TDSEPNode(ISFANode, ProjectMatrixMixin):
@@ -1,12 +1,31 @@
 __docformat__ = "restructuredtext en"
 
-from mdp import numx, numx_linalg, Cumulator, TrainingException, MDPWarning
+import mdp
+from mdp import (numx, numx_linalg, Cumulator, TrainingException,
+                 NodeException, MDPWarning)
 from mdp.utils import mult, nongeneral_svd, svd, sqrtm, symeig
 import warnings as _warnings
 
 # some useful functions
 sqrt = numx.sqrt
 
+# check if the scipy sparse matrices, the ARPACK eigensolver and the
+# KD-tree are available
+_HAS_SPARSE = False
+_HAS_KDTREE = False
+if mdp.numx_description == 'scipy':
+    try:
+        import scipy.sparse as _sparse
+        from scipy.sparse.linalg import eigsh as _eigsh
+        _HAS_SPARSE = True
+    except ImportError:
+        pass
+    try:
+        from scipy.spatial import cKDTree as _cKDTree
+        _HAS_KDTREE = True
+    except ImportError:
+        pass
+
 # search XXX for locations where future work is needed
 
 #########################################################
@@ -37,8 +56,15 @@ class LLENode(Cumulator):
     Original code contributed by: Jake VanderPlas, University of Washington,
     """
 
+    # maximal number of distances computed at once in the brute force
+    # nearest neighbors search (used if the KD-tree is not available)
+    max_block_elements = 2**22
+    # defaults for nodes pickled by older versions
+    sparse = False
+    _kdtree = None
+
     def __init__(self, k, r=0.001, svd=False, verbose=False,
-                 input_dim=None, output_dim=None, dtype=None):
+                 input_dim=None, output_dim=None, dtype=None, sparse=False):
         """
         :Arguments:
            k
@@ -64,8 +90,18 @@ def __init__(self, k, r=0.001, svd=False, verbose=False,
              training (e.g., for ``output_dim=0.95`` the algorithm will
              keep as many dimensions as necessary in order to explain
              95% of the input variance)
+           sparse
+             if true, the weight matrix is stored as a sparse matrix and
+             the bottom eigenvectors are computed with ARPACK in
+             shift-invert mode (requires ``scipy.sparse``); in this case
+             the ``svd`` switch is ignored and ``self.W`` is a
+             ``scipy.sparse.csr_matrix``
         """
 
+        if sparse and not _HAS_SPARSE:
+            err = "The sparse computation requires scipy.sparse."
+            raise NodeException(err)
+
         if isinstance(output_dim, float) and output_dim <= 1:
             self.desired_variance = output_dim
             output_dim = None
@@ -78,9 +114,73 @@ def __init__(self, k, r=0.001, svd=False, verbose=False,
         self.r = r
         self.svd = svd
         self.verbose = verbose
+        self.sparse = sparse
+        self._kdtree = None
+
+    def __getstate__(self):
+        # the scipy KD-tree can not be pickled, it is rebuilt when needed
+        state = self.__dict__.copy()
+        state['_kdtree'] = None
+        return state
+
+    def _nearest_neighbors(self, x, k):
+        """Return the indices of the k nearest training points for each
+        point in x, as an array of shape (len(x), k) sorted by distance.
+        """
+        if _HAS_KDTREE:
+            if self._kdtree is None:
+                self._kdtree = _cKDTree(self.data)
+            nbrs = self._kdtree.query(x, k=k)[1]
+            return nbrs.reshape((x.shape[0], k))
+        data = self.data
+        N = data.shape[0]
+        nbrs = numx.empty((x.shape[0], k), dtype='i')
+        data_square_norms = (data**2).sum(1)
+        block_size = max(1, self.max_block_elements // N)
+        for start in range(0, x.shape[0], block_size):
+            # the squared norms of x do not change the order
+            dist = mult(x[start:start+block_size], -2*data.T)
+            dist += data_square_norms
+            rows = numx.arange(dist.shape[0])[:, numx.newaxis]
+            if k < N and hasattr(numx, "argpartition"):
+                idx = numx.argpartition(dist, k-1, axis=1)[:, :k]
+                idx = idx[rows, dist[rows, idx].argsort(axis=1)]
+            else:
+                idx = dist.argsort(axis=1)[:, :k]
+            nbrs[start:start+block_size] = idx
+        return nbrs
+
+    def _training_neighbors(self):
+        """Return the indices of the k nearest neighbors of each training
+        point, excluding the point itself."""
+        N, k = self.data.shape[0], self.k
+        nbrs = self._nearest_neighbors(self.data, min(k+1, N))
+        if nbrs.shape[1] == k:
+            # k == N, nothing to exclude
+            return nbrs
+        is_self = nbrs == numx.arange(N)[:, numx.newaxis]
+        # if the point itself is not among the neighbors (e.g. because of
+        # duplicate points) exclude the farthest one
+        is_self[~is_self.any(axis=1), -1] = True
+        return nbrs[~is_self].reshape((N, k))
+
+    def _sparse_null_space(self, W):
+        """Return the eigenvectors 2 to output_dim+1 of W*W.T for a sparse
+        matrix W.
+
+        The shift-invert mode of ARPACK is used with a small negative shift,
+        which maps the smallest eigenvalues (close to 0) to well separated
+        large values. A regularization of the diagonal as in the dense
+        computation would map them all close to the same value instead.
+        """
+        WW = (W * W.T).tocsc()
+        sig, U = _eigsh(WW, k=self.output_dim+1, sigma=-1e-6, which='LM')
+        order = sig.argsort()[1:]
+        return sig[order], self._refcast(U[:, order])
 
     def _stop_training(self):
         Cumulator._stop_training(self)
+        self._kdtree = None
 
         if self.verbose:
             msg = ('training LLE on %i points'
@@ -116,29 +216,28 @@ def _stop_training(self):
         # do we need to automatically determine the regularization term?
         auto_reg = r is None
 
+        # -----------------------------------------------
+        #  find k nearest neighbors
+        # -----------------------------------------------
+        nbrss = self._training_neighbors()
+
         # determine number of output dims, precalculate useful stuff
         if learn_outdim:
-            Qs, sig2s, nbrss = self._adjust_output_dim()
+            Qs, sig2s = self._adjust_output_dim(nbrss)
 
-        # build the weight matrix
-        #XXX future work:
-        #XXX   for faster implementation, W should be a sparse matrix
-        W = numx.zeros((N, N), dtype=self.dtype)
+        # the weights of each row are stored in the column of the weight
+        # matrix, W[nbrss[row], row] = weights[row]
+        weights = numx.zeros((N, k), dtype=self.dtype)
 
         if self.verbose:
-            print ' - constructing [%i x %i] weight matrix...' % W.shape
+            print ' - constructing [%i x %i] weight matrix...' % (N, N)
 
         for row in range(N):
+            nbrs = nbrss[row, :]
             if learn_outdim:
                 Q = Qs[row, :, :]
-                nbrs = nbrss[row, :]
             else:
-                # -----------------------------------------------
-                #  find k nearest neighbors
-                # -----------------------------------------------
-                M_Mi = M-M[row]
-                nbrs = numx.argsort((M_Mi**2).sum(1))[1:k+1]
-                M_Mi = M_Mi[nbrs]
+                M_Mi = M[nbrs]-M[row]
                 # compute covariance matrix of distances
                 Q = mult(M_Mi, M_Mi.T)
 
@@ -171,24 +270,33 @@ def _stop_training(self):
             w = self._refcast(numx_linalg.solve(Q, numx.ones(k)))
             w /= w.sum()
 
-            #update row of the weight matrix
-            W[nbrs, row] = w
+            weights[row] = w
 
         if self.verbose:
             msg = (' - finding [%i x %i] null space of weight matrix\n'
                    '     (may take a while)...' % (self.output_dim, N))
             print msg
 
+        if self.sparse:
+            W = _sparse.csr_matrix((weights.ravel(),
+                                    (nbrss.ravel(), W_diag_idx.repeat(k))),
+                                   shape=(N, N))
+            self.W = W
+            # the bottom d+1 eigenvectors of (W-I)*(W-I).T are computed
+            # with ARPACK
+            W = W - _sparse.identity(N, dtype=W.dtype, format='csr')
+            sig, U = self._sparse_null_space(W)
+            self.training_projection = U
+            return
+
+        W = numx.zeros((N, N), dtype=self.dtype)
+        W[nbrss, W_diag_idx[:, numx.newaxis]] = weights
         self.W = W.copy()
         #to find the null space, we need the bottom d+1
         #  eigenvectors of (W-I).T*(W-I)
         #Compute this using the svd of (W-I):
         W[W_diag_idx, W_diag_idx] -= 1.
 
-        #XXX future work:
-        #XXX  use of upcoming ARPACK interface for bottom few eigenvectors
-        #XXX   of a sparse matrix will significantly increase the speed
-        #XXX   of the next step
         if self.svd:
             sig, U = nongeneral_svd(W.T, range=(2, self.output_dim+1))
         else:
@@ -202,10 +310,11 @@ def _stop_training(self):
 
         self.training_projection = U
 
-    def _adjust_output_dim(self):
+    def _adjust_output_dim(self, nbrss):
         # this function is called if we need to compute the number of
         # output dimensions automatically; some quantities that are
-        # useful later are pre-calculated to spare precious time
+        # useful later are pre-calculated to spare precious time;
+        # nbrss are the indices of the k nearest neighbors of each point
 
         if self.verbose:
             print ' - adjusting output dim:'
@@ -219,18 +328,11 @@ def _adjust_output_dim(self):
         m_est_array = []
         Qs = numx.zeros((N, k, k))
         sig2s = numx.zeros((N, d_in))
-        nbrss = numx.zeros((N, k), dtype='i')
 
         for row in range(N):
-            #-----------------------------------------------
-            #  find k nearest neighbors
-            #-----------------------------------------------
-            M_Mi = M-M[row]
-            nbrs = numx.argsort((M_Mi**2).sum(1))[1:k+1]
-            M_Mi = M_Mi[nbrs]
+            M_Mi = M[nbrss[row]]-M[row]
             # compute covariance matrix of distances
             Qs[row, :, :] = mult(M_Mi, M_Mi.T)
-            nbrss[row, :] = nbrs
 
             #-----------------------------------------------
             # singular values of M_Mi give the variance:
@@ -263,26 +365,26 @@ def _adjust_output_dim(self):
                                               self.desired_variance))
             print msg
 
-        return Qs, sig2s, nbrss
+        return Qs, sig2s
 
     def _execute(self, x):
         #----------------------------------------------------
         # similar algorithm to that within self.stop_training()
         #  refer there for notes & comments on code
         #----------------------------------------------------
-        N = self.data.shape[0]
         Nx = x.shape[0]
-        W = numx.zeros((Nx, N), dtype=self.dtype)
+        y = numx.zeros((Nx, self.output_dim), dtype=self.dtype)
 
         k, r = self.k, self.r
         d_out = self.output_dim
         Q_diag_idx = numx.arange(k)
 
+        #find nearest neighbors of x in M
+        nbrss = self._nearest_neighbors(x, k)
+
         for row in range(Nx):
-            #find nearest neighbors of x in M
-            M_xi = self.data-x[row]
-            nbrs = numx.argsort( (M_xi**2).sum(1) )[:k]
-            M_xi = M_xi[nbrs]
+            nbrs = nbrss[row]
+            M_xi = self.data[nbrs]-x[row]
 
             #find corrected covariance matrix Q
             Q = mult(M_xi, M_xi.T)
@@ -296,10 +398,10 @@ def _execute(self, x):
             #solve for weights
             w = self._refcast(numx_linalg.solve(Q , numx.ones(k)))
             w /= w.sum()
-            W[row, nbrs] = w
+            #multiply weights by result of SVD from training
+            y[row] = mult(w, self.training_projection[nbrs])
 
-        #multiply weights by result of SVD from training
-        return numx.dot(W, self.training_projection)
+        return y
 
     @staticmethod
     def is_trainable():
@@ -360,7 +462,7 @@ class HLLENode(LLENode):
     #----------------------------------------------------
 
     def __init__(self, k, r=0.001, svd=False, verbose=False,
-                 input_dim=None, output_dim=None, dtype=None):
+                 input_dim=None, output_dim=None, dtype=None, sparse=False):
         """
         :Keyword arguments:
            k
@@ -387,12 +489,17 @@ def __init__(self, k, r=0.001, svd=False, verbose=False,
               training (e.g., for 'output_dim=0.95' the algorithm will
               keep as many dimensions as necessary in order to explain
               95% of the input variance)
+           sparse
+              if true, the Hessian estimator is stored as a sparse matrix
+              and the bottom eigenvectors are computed with ARPACK
+              (see LLENode)
         """
         LLENode.__init__(self, k, r, svd, verbose,
-                         input_dim, output_dim, dtype)
+                         input_dim, output_dim, dtype, sparse)
 
     def _stop_training(self):
         Cumulator._stop_training(self)
+        self._kdtree = None
 
         k = self.k
         M = self.data
@@ -416,9 +523,14 @@ def _stop_training(self):
             else:
                 learn_outdim = True
 
+        # -----------------------------------------------
+        #  find k nearest neighbors
+        # -----------------------------------------------
+        nbrss = self._training_neighbors()
+
         # determine number of output dims, precalculate useful stuff
         if learn_outdim:
-            Qs, sig2s, nbrss = self._adjust_output_dim()
+            self._adjust_output_dim(nbrss)
 
         d_out = self.output_dim
 
@@ -437,22 +549,15 @@ def _stop_training(self):
                    % (k, 1+d_out+dp))
             _warnings.warn(wrn, MDPWarning)
 
-        #build the weight matrix
-        #XXX   for faster implementation, W should be a sparse matrix
-        W = numx.zeros((N, dp*N), dtype=self.dtype)
+        # the weights of each row are stored in the weight matrix as
+        # W[nbrss[row], row*dp:(row+1)*dp] = weights[row]
+        weights = numx.zeros((N, k, dp), dtype=self.dtype)
 
         if self.verbose:
-            print ' - constructing [%i x %i] weight matrix...' % W.shape
+            print ' - constructing [%i x %i] weight matrix...' % (N, dp*N)
 
         for row in range(N):
-            if learn_outdim:
-                nbrs = nbrss[row, :]
-            else:
-                # -----------------------------------------------
-                #  find k nearest neighbors
-                # -----------------------------------------------
-                M_Mi = M-M[row]
-                nbrs = numx.argsort((M_Mi**2).sum(1))[1:k+1]
+            nbrs = nbrss[row, :]
 
             #-----------------------------------------------
             #  center the neighborhood using the mean
@@ -495,9 +600,7 @@ def _stop_training(self):
             #if S[i] is too small, set it equal to 1.0
             # this prevents weights from blowing up
             S[numx.where(numx.absolute(S)<1E-4)] = 1.0
-            #print w.shape, S.shape, (w/S).shape
-            #print W[nbrs, row*dp:(row+1)*dp].shape
-            W[nbrs, row*dp:(row+1)*dp] = w / S
+            weights[row] = w / S
 
         #-----------------------------------------------
         # To find the null space, we want the
@@ -510,15 +613,23 @@ def _stop_training(self):
                    'null space of weight matrix...' % (d_out, N))
             print msg
 
-        #XXX future work:
-        #XXX  use of upcoming ARPACK interface for bottom few eigenvectors
-        #XXX   of a sparse matrix will significantly increase the speed
-        #XXX   of the next step
-
-        if self.svd:
+        if self.sparse:
+            rows = nbrss.ravel().repeat(dp)
+            cols = (numx.tile(numx.arange(dp), N*k) +
+                    (numx.arange(N)*dp).repeat(k*dp))
+            W = _sparse.csr_matrix((weights.ravel(), (rows, cols)),
+                                   shape=(N, dp*N))
+            del weights
+            sig, U = self._sparse_null_space(W)
+            Y = U*numx.sqrt(N)
+        elif self.svd:
+            W = self._dense_weights(weights, nbrss)
+            del weights
             sig, U = nongeneral_svd(W.T, range=(2, d_out+1))
             Y = U*numx.sqrt(N)
         else:
+            W = self._dense_weights(weights, nbrss)
+            del weights
             WW = mult(W, W.T)
             # regularizes the eigenvalues, does not change the eigenvectors:
             W_diag_idx = numx.arange(N)
@@ -552,3 +663,11 @@ def _stop_training(self):
 
         C = sqrtm(mult(Y.T, Y))
         self.training_projection = mult(Y, C)
+
+    def _dense_weights(self, weights, nbrss):
+        """Return the dense [N x dp*N] weight matrix."""
+        N, k, dp = weights.shape
+        W = numx.zeros((N, dp*N), dtype=self.dtype)
+        for row in range(N):
+            W[nbrss[row], row*dp:(row+1)*dp] = weights[row]
+        return W
@@ -8,6 +8,8 @@
 import cPickle as pickle
 import pickle as real_pickle
 
+from numpy.lib.stride_tricks import as_strided as _as_strided
+
 class IdentityNode(PreserveDimNode):
     """Execute returns the input data and the node is not trainable.
 
@@ -25,11 +27,81 @@ def _get_supported_dtypes(self):
     def is_trainable():
         return False
 
+class AffineNode(Node):
+    """Execute the affine map ``mult(x, A) + b``, the node is not trainable.
+
+    This node is for example created by `mdp.Flow.fuse_affine_nodes` to
+    replace a chain of affine nodes by a single matrix multiplication.
+    If the original nodes are given, then they are used for the inversion.
+    """
+
+    def __init__(self, A, b=None, nodes=None, dtype=None):
+        """Initialize node.
+
+        :Parameters:
+          A
+            Matrix of the map, with shape ``(input_dim, output_dim)``.
+          b
+            1d offset vector, default is zero.
+          nodes
+            Optional sequence of nodes which are equivalent to the map, they
+            are executed in reverse order by `inverse`.
+        """
+        if dtype is None:
+            dtype = A.dtype
+        super(AffineNode, self).__init__(input_dim=A.shape[0],
+                                         output_dim=A.shape[1],
+                                         dtype=dtype)
+        self.A = mdp.utils.refcast(A, self.dtype)
+        if b is None:
+            b = numx.zeros(self.output_dim, dtype=self.dtype)
+        self.b = mdp.utils.refcast(numx.ravel(b), self.dtype)
+        if nodes is not None:
+            nodes = list(nodes)
+        self.nodes = nodes
+
+    @staticmethod
+    def is_trainable():
+        return False
+
+    def is_invertible(self):
+        if self.nodes is None:
+            return False
+        for node in self.nodes:
+            if not node.is_invertible():
+                return False
+        return True
+
+    def _execute(self, x):
+        return utils.mult(x, self.A) + self.b
+
+    def _execute_out(self, x, out):
+        utils.mult_into(x, self.A, out)
+        out += self.b
+        return out
+
+    def _get_affine_map(self):
+        return self.A, self.b
+
+    def _inverse(self, y):
+        for node in reversed(self.nodes):
+            y = node.inverse(y)
+        return y
+
+
 class OneDimensionalHitParade(object):
     """
     Class to produce hit-parades (i.e., a list of the largest
     and smallest values) out of a one-dimensional time-series.
+
+    Only values larger than the smallest stored maximum (or smaller than the
+    largest stored minimum) can change the hit-parade. Since these bounds
+    only grow (or shrink) during the update, the data is processed in blocks
+    and only the candidate values of each block are examined one by one.
     """
+
+    # number of data points for which the candidates are selected at once
+    block_size = 512
     
     def __init__(self, n, d, real_dtype="d", integer_dtype="l"):
         """
@@ -65,17 +137,28 @@ def update(self, inp):
         inp -- tuple (time-series, time-indices)
         """
         (x, ix) = inp
-        rows = len(x)
+        x = numx.asarray(x)
+        ix = numx.asarray(ix)
+        for start in xrange(0, len(x), self.block_size):
+            x_block = x[start:start+self.block_size]
+            ix_block = ix[start:start+self.block_size]
+            candidates = (x_block > self.M.min()).nonzero()[0]
+            if len(candidates):
+                self._update_maxima(x_block[candidates],
+                                    ix_block[candidates])
+            candidates = (x_block < self.m.max()).nonzero()[0]
+            if len(candidates):
+                self._update_minima(x_block[candidates],
+                                    ix_block[candidates])
+
+    def _update_maxima(self, x, ix):
+        """Update the maxima with the candidate values x."""
         d = self.d
         M = self.M
-        m = self.m
         iM = self.iM
-        im = self.im
         lM = self.lM
-        lm = self.lm
-        for i in xrange(rows):
+        for i in xrange(len(x)):
             k1 = M.argmin()
-            k2 = m.argmax()
             if x[i] > M[k1]:
                 if ix[i]-iM[lM] <= d and x[i] > M[lM]:
                     M[lM] = x[i]
@@ -84,6 +167,16 @@ def update(self, inp):
                     M[k1] = x[i]
                     iM[k1] = ix[i]
                     lM = k1
+        self.lM = lM
+
+    def _update_minima(self, x, ix):
+        """Update the minima with the candidate values x."""
+        d = self.d
+        m = self.m
+        im = self.im
+        lm = self.lm
+        for i in xrange(len(x)):
+            k2 = m.argmax()
             if x[i] < m[k2]:
                 if ix[i]-im[lm] <= d and x[i] < m[lm]:
                     m[lm] = x[i]
@@ -92,11 +185,6 @@ def update(self, inp):
                     m[k2] = x[i]
                     im[k2] = ix[i]
                     lm = k2
-        self.M = M
-        self.m = m
-        self.iM = iM
-        self.im = im
-        self.lM = lM
         self.lm = lm
 
     def get_maxima(self):
@@ -221,20 +309,69 @@ class TimeFramesNode(Node):
     It is not always possible to invert this transformation (the
     transformation is not surjective. However, the ``pseudo_inverse``
     method does the correct thing when it is indeed possible.
+
+    For ``gap=1`` the output can be a read-only view on the input data
+    (see the ``strided_view`` argument), so the time frames do not take up
+    any additional memory.
+
+    In the streaming mode the last ``(time_frames-1)*gap`` samples are kept
+    between the `execute` calls, so that executing consecutive chunks of a
+    signal gives the same result as executing the whole signal at once
+    (the first call returns fewer rows, possibly none at all).
     """
 
+    # defaults for nodes pickled by older versions
+    strided_view = False
+    streaming = False
+    _history = None
+
     def __init__(self, time_frames, gap=1,
-                 input_dim=None, dtype=None):
+                 input_dim=None, dtype=None, strided_view=False,
+                 streaming=False):
         """
         Input arguments:
         time_frames -- Number of delayed copies
         gap -- Time delay between the copies
+        strided_view -- If True, then the output is a read-only view on the
+            input data when possible (i.e., for gap=1 and C contiguous
+            input with the node dtype). Note that the output then changes
+            when the input array is modified.
+        streaming -- If True, then successive calls to `execute` are treated
+            as consecutive chunks of a single signal (see `reset_stream`).
         """
         self.time_frames = time_frames
         super(TimeFramesNode, self).__init__(input_dim=input_dim,
                                              output_dim=None,
                                              dtype=dtype)
         self.gap = gap
+        self.strided_view = strided_view
+        self.streaming = streaming
+        # trailing samples of the previous chunk in the streaming mode
+        self._history = None
+
+    def reset_stream(self):
+        """Forget the samples from previous calls in the streaming mode."""
+        self._history = None
+
+    def _prepend_history(self, x, pad):
+        """Return x with the trailing samples of the previous call prepended
+        and store the trailing samples of the result for the next call.
+
+        pad -- If True then the samples before the first call are zeros,
+            otherwise there are no samples before the first call.
+        """
+        n_history = (self.time_frames-1)*self.gap
+        if self._history is None:
+            if pad:
+                self._history = numx.zeros((n_history, self.input_dim),
+                                           dtype=self.dtype)
+            else:
+                self._history = numx.zeros((0, self.input_dim),
+                                           dtype=self.dtype)
+        x = numx.concatenate((self._history, x))
+        # copy to not keep a reference to the whole chunk
+        self._history = x[max(0, x.shape[0]-n_history):].copy()
+        return x
 
     def _get_supported_dtypes(self):
         """Return the list of dtypes supported by this node."""
@@ -259,14 +396,27 @@ def _set_output_dim(self, n):
         raise NodeException(msg)
 
     def _execute(self, x):
+        if self.streaming:
+            x = self._prepend_history(x, pad=False)
         gap = self.gap
         tf = x.shape[0] - (self.time_frames-1)*gap
         rows = self.input_dim
         cols = self.output_dim
-        y = numx.zeros((tf, cols), dtype=self.dtype)
-        for frame in range(self.time_frames):
-            y[:, frame*rows:(frame+1)*rows] = x[gap*frame:gap*frame+tf, :]
-        return y
+        if tf <= 0:
+            # not enough samples for a complete time frame (yet)
+            return numx.zeros((0, cols), dtype=self.dtype)
+        row_stride, col_stride = x.strides
+        if (self.strided_view and gap == 1 and col_stride == x.itemsize and
+            row_stride == rows*col_stride):
+            # each output row is a contiguous piece of the input data
+            y = _as_strided(x, shape=(tf, cols),
+                            strides=(row_stride, col_stride))
+            y.flags.writeable = False
+            return y
+        # view with the frames on the second axis, copied in one go
+        frames = _as_strided(x, shape=(tf, self.time_frames, rows),
+                             strides=(row_stride, gap*row_stride, col_stride))
+        return frames.copy().reshape((tf, cols))
 
     def pseudo_inverse(self, y):
         """This function returns a pseudo-inverse of the execute frame.
@@ -328,28 +478,51 @@ class TimeDelayNode(TimeFramesNode):
     See ``TimeDelaySlidingWindowNode`` for a sliding window delay node for
     application in a non-batch manner.
 
+    In the streaming mode the missing samples are zeros only before the
+    first call, afterwards the last samples from the previous calls are used.
+    So each call returns as many rows as the input chunk, and the result is
+    the same as for the whole signal at once.
+
     Original code contributed by Sebastian Hoefer.
     Dec 31, 2010
     """
 
-    def __init__(self, time_frames, gap=1, input_dim=None, dtype=None):
+    def __init__(self, time_frames, gap=1, input_dim=None, dtype=None,
+                 streaming=False):
         """
         Input arguments:
         time_frames -- Number of delayed copies
         gap -- Time delay between the copies
+        streaming -- If True, then successive calls to `execute` are treated
+            as consecutive chunks of a single signal (see `reset_stream`).
         """
         super(TimeDelayNode, self).__init__(time_frames, gap,
-                                            input_dim, dtype)
+                                            input_dim, dtype,
+                                            streaming=streaming)
 
     def _execute(self, x):
         gap = self.gap
-        rows = x.shape[0]
         cols = self.output_dim
         n = self.input_dim
 
-        y = numx.zeros((rows, cols), dtype=self.dtype)
+        if self.streaming:
+            x = self._prepend_history(x, pad=True)
+            # the history replaces the zero padding
+            n_history = (self.time_frames-1)*gap
+            rows = x.shape[0] - n_history
+            y = numx.empty((rows, cols), dtype=self.dtype)
+            for frame in range(self.time_frames):
+                start = n_history - gap*frame
+                y[:, frame*n:(frame+1)*n] = x[start:start+rows, :]
+            return y
 
+        rows = x.shape[0]
+
+        # the zero padding of the delayed frames prevents a strided view,
+        # so only the padding is initialized instead of the whole array
+        y = numx.empty((rows, cols), dtype=self.dtype)
         for frame in range(self.time_frames):
+            y[:gap*frame, frame*n:(frame+1)*n] = 0
             y[gap*frame:, frame*n:(frame+1)*n] = x[:rows-gap*frame, :]
 
         return y
@@ -362,11 +535,13 @@ class TimeDelaySlidingWindowNode(TimeDelayNode):
     ``TimeDelaySlidingWindowNode`` is an alternative to ``TimeDelayNode``
     which should be used for online learning/execution. Whereas the
     ``TimeDelayNode`` works in a batch manner, for online application
-    a sliding window is necessary which yields only one row per call.
+    a sliding window is necessary which keeps the last samples between the
+    calls. The data can be passed in chunks of any size (e.g., single rows).
 
     Applied to the same data the collection of all returned rows of the
     ``TimeDelaySlidingWindowNode`` is equivalent to the result of the
-    ``TimeDelayNode``.
+    ``TimeDelayNode``. This is the same as a ``TimeDelayNode`` in the
+    streaming mode.
 
     Original code contributed by Sebastian Hoefer.
     Dec 31, 2010
@@ -378,50 +553,38 @@ def __init__(self, time_frames, gap=1, input_dim=None, dtype=None):
         gap -- Time delay between the copies
         """
 
-        self.time_frames = time_frames
-        self.gap = gap
         super(TimeDelaySlidingWindowNode, self).__init__(time_frames, gap,
-                                                         input_dim, dtype)
-        self.sliding_wnd = None
-        self.cur_idx = 0
-        self.slide = False
-
-    def _init_sliding_window(self):
-        rows = self.gap+1
-        cols = self.input_dim*self.time_frames
-        self.sliding_wnd = numx.zeros((rows, cols), dtype=self.dtype)
-
-    def _execute(self, x):
-        assert x.shape[0] == 1
-
-        if self.sliding_wnd == None:
-            self._init_sliding_window()
-
-        gap = self.gap
-        rows = self.sliding_wnd.shape[0]
-        cols = self.output_dim
-        n = self.input_dim
-
-        new_row = numx.zeros(cols, dtype=self.dtype)
-        new_row[:n] = x
-
-        # Slide
-        if self.slide:
-            self.sliding_wnd[:-1, :] = self.sliding_wnd[1:, :]
-
-        # Delay
-        if self.cur_idx-gap >= 0:
-            new_row[n:] = self.sliding_wnd[self.cur_idx-gap, :-n]
-
-        # Add new row to matrix
-        self.sliding_wnd[self.cur_idx, :] = new_row
-
-        if self.cur_idx < rows-1:
-            self.cur_idx = self.cur_idx+1 
-        else:
-            self.slide = True
-
-        return new_row[numx.newaxis,:]
+                                                         input_dim, dtype,
+                                                         streaming=True)
+
+    # default for nodes pickled by older versions
+    streaming = True
+
+    def __setstate__(self, state):
+        # nodes pickled by older versions store the last output rows in a
+        # sliding window, the input samples are recovered from it
+        sliding_wnd = state.pop("sliding_wnd", None)
+        cur_idx = state.pop("cur_idx", 0)
+        slide = state.pop("slide", False)
+        self.__dict__.update(state)
+        if sliding_wnd is not None:
+            if slide:
+                cur_idx = sliding_wnd.shape[0]
+            self._history = self._window_history(sliding_wnd[:cur_idx])
+
+    def _window_history(self, rows):
+        """Return the last input samples contained in the output rows."""
+        n, gap = self.input_dim, self.gap
+        n_history = (self.time_frames-1)*gap
+        history = numx.zeros((n_history, n), dtype=self.dtype)
+        for i_row, row in enumerate(rows):
+            # index of the last sample in this row
+            last = n_history - len(rows) + i_row
+            for frame in range(self.time_frames):
+                index = last - gap*frame
+                if 0 <= index < n_history:
+                    history[index] = row[frame*n:(frame+1)*n]
+        return history
 
 class EtaComputerNode(Node):
     """Compute the eta values of the normalized training data.
@@ -683,6 +846,16 @@ def _execute(self, x):
             x = numx.where(x <= self.upper_bound, x, self.upper_bound)
         return x
 
+    def _execute_out(self, x, out):
+        if self.lower_bound is not None:
+            numx.maximum(x, self.lower_bound, out)
+            x = out
+        if self.upper_bound is not None:
+            numx.minimum(x, self.upper_bound, out)
+        elif x is not out:
+            out[...] = x
+        return out
+
 
 class HistogramNode(PreserveDimNode):
     """Node which stores a history of the data during its training phase.
@@ -690,10 +863,22 @@ class HistogramNode(PreserveDimNode):
     The data history is stored in ``self.data_hist`` and can also be deleted to
     free memory. Alternatively it can be automatically pickled to disk.
 
+    During training the history is kept in a buffer whose capacity is
+    doubled when it is full, so that the data is not copied for every chunk.
+    If ``hist_size`` is given, at most ``hist_size`` samples are stored,
+    which are a uniform random sample of the whole training data (reservoir
+    sampling).
+
     Note that data is only stored during training.
     """
 
-    def __init__(self, hist_fraction=1.0, hist_filename=None,
+    # defaults for nodes pickled by older versions
+    hist_size = None
+    _hist_buffer = None
+    _hist_view = None
+    _n_hist_samples = 0
+
+    def __init__(self, hist_fraction=1.0, hist_filename=None, hist_size=None,
                  input_dim=None, output_dim=None, dtype=None):
         """Initialize the node.
 
@@ -704,31 +889,88 @@ def __init__(self, hist_fraction=1.0, hist_filename=None,
             is called and data_hist is then cleared (to free memory).
             If filename is None (default value) then data_hist is not cleared
             and can be directly used after training.
+        hist_size -- Maximum number of stored samples. If the training data
+            is longer, a random subset of this size is stored. If hist_size
+            is None (default value) all the samples are stored.
         """
         super(HistogramNode, self).__init__(input_dim=input_dim,
                                             output_dim=output_dim,
                                             dtype=dtype)
         self._hist_filename = hist_filename
         self.hist_fraction = hist_fraction
+        self.hist_size = hist_size
         self.data_hist = None  # stores the data history
+        # buffer for the history during training, data_hist is a view on it
+        self._hist_buffer = None
+        self._hist_view = None
+        # number of samples offered to the history
+        self._n_hist_samples = 0
 
     def _get_supported_dtypes(self):
         return (mdp.utils.get_dtypes('AllFloat') +
                 mdp.utils.get_dtypes('AllInteger') +
                 mdp.utils.get_dtypes('Character'))
 
+    def __getstate__(self):
+        # only store the used part of the history buffer
+        state = self.__dict__.copy()
+        state['_hist_buffer'] = None
+        state['_hist_view'] = None
+        return state
+
+    def _append_hist(self, x):
+        """Append x to the history buffer, growing it if necessary."""
+        hist = self.data_hist
+        if hist is not None and hist is not self._hist_view:
+            # data_hist was set from outside (e.g. when joining nodes)
+            self._hist_buffer = hist
+        n = 0 if hist is None else len(hist)
+        needed = n + len(x)
+        buffer = self._hist_buffer
+        if buffer is None or needed > len(buffer):
+            capacity = max(needed, 2*n)
+            if self.hist_size is not None:
+                capacity = max(needed, min(capacity, self.hist_size))
+            dtype = x.dtype if hist is None else hist.dtype
+            new_buffer = numx.empty((capacity,) + x.shape[1:], dtype=dtype)
+            if n:
+                new_buffer[:n] = hist
+            buffer = new_buffer
+        buffer[n:needed] = x
+        self._hist_buffer = buffer
+        self.data_hist = self._hist_view = buffer[:needed]
+
     def _train(self, x):
         """Store the history data."""
         if self.hist_fraction < 1.0:
             x = x[numx.random.random(len(x)) < self.hist_fraction]
-        if self.data_hist is not None:
-            self.data_hist = numx.concatenate([self.data_hist, x])
-        else:
-            self.data_hist = x
+        n_seen = self._n_hist_samples
+        self._n_hist_samples += len(x)
+        if self.hist_size is None:
+            self._append_hist(x)
+            return
+        n = 0 if self.data_hist is None else len(self.data_hist)
+        n_free = max(0, self.hist_size - n)
+        if n_free:
+            self._append_hist(x[:n_free])
+        x = x[n_free:]
+        if len(x):
+            # reservoir sampling: sample number t replaces a random sample
+            # in the history with probability hist_size / (t+1)
+            t = n_seen + n_free + numx.arange(len(x))
+            index = (numx.random.random(len(x)) * (t+1)).astype('l')
+            keep = index < self.hist_size
+            self.data_hist[index[keep]] = x[keep]
 
     def _stop_training(self):
         """Pickle the histogram data to file and clear it if required."""
         super(HistogramNode, self)._stop_training()
+        if (self.data_hist is not None and self._hist_buffer is not None and
+            len(self._hist_buffer) > len(self.data_hist)):
+            # release the unused capacity
+            self.data_hist = self.data_hist.copy()
+        self._hist_buffer = None
+        self._hist_view = None
         if self._hist_filename:
             pickle_file = open(self._hist_filename, "wb")
             try:
@@ -737,6 +979,62 @@ def _stop_training(self):
                 pickle_file.close( )
             self.data_hist = None
 
+class _QuantileSketch(object):
+    """Streaming estimation of the quantiles of each column of the data.
+
+    The samples are kept in a hierarchy of compactors: level ``i`` holds
+    samples with the weight ``2**i``. When a level has ``size`` or more
+    samples they are sorted (separately for each column) and every other
+    sample, starting at a random offset, is moved to the next level. The
+    memory is thus O(size * log(n/size)) per column, while the rank error
+    is of the order n/size.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.levels = []
+        self.n = 0
+
+    def update(self, x):
+        """Add the samples x (one per row) to the sketch."""
+        self.n += len(x)
+        level = 0
+        while len(x):
+            if level == len(self.levels):
+                self.levels.append(x.copy())
+            else:
+                self.levels[level] = numx.concatenate([self.levels[level], x])
+            items = self.levels[level]
+            if len(items) < self.size:
+                break
+            # keep one sample at this level if the number is odd
+            n_keep = len(items) % 2
+            items = numx.sort(items, axis=0)
+            offset = numx.random.randint(2)
+            if n_keep:
+                self.levels[level] = items[-1:] if offset else items[:1]
+                items = items[:-1] if offset else items[1:]
+            else:
+                self.levels[level] = items[:0]
+            x = items[offset::2]
+            level += 1
+
+    def at_rank(self, rank):
+        """Return the estimated value with the given rank in each column.
+
+        The rank is between 0 (minimum) and n (maximum).
+        """
+        values = numx.concatenate(self.levels)
+        weights = numx.concatenate([numx.ones(len(items), dtype='d') * 2**i
+                                    for i, items in enumerate(self.levels)])
+        order = values.argsort(axis=0)
+        columns = numx.arange(values.shape[1])
+        cum_weights = weights[order].cumsum(axis=0)
+        index = (cum_weights <= rank).sum(axis=0)
+        index = numx.minimum(index, len(values)-1)
+        return values[order[index, columns], columns]
+
+
 class AdaptiveCutoffNode(HistogramNode):
     """Node which uses the data history during training to learn cutoff values.
 
@@ -749,10 +1047,19 @@ class AdaptiveCutoffNode(HistogramNode):
 
     When ``stop_training`` is called the cutoff values for each coordinate are
     calculated based on the collected histogram data.
+
+    For long training streams the cutoff values can instead be estimated
+    with a streaming quantile sketch (see the ``sketch_size`` argument),
+    which needs memory independent of the length of the training data.
     """
 
+    # defaults for nodes pickled by older versions
+    sketch_size = None
+    _sketch = None
+
     def __init__(self, lower_cutoff_fraction=None, upper_cutoff_fraction=None,
-                 hist_fraction=1.0, hist_filename=None,
+                 hist_fraction=1.0, hist_filename=None, hist_size=None,
+                 sketch_size=None,
                  input_dim=None, output_dim=None, dtype=None):
         """Initialize the node.
 
@@ -773,14 +1080,26 @@ def __init__(self, lower_cutoff_fraction=None, upper_cutoff_fraction=None,
             cleared (to free memory).  If filename is ``None``
             (default value) then ``data_hist`` is not cleared and can
             be directly used after training.
+          hist_size
+            Maximum number of samples stored for the histogram (see
+            `HistogramNode`).
+          sketch_size
+            If given, the cutoff values are estimated with a streaming
+            quantile sketch of this size (the relative rank error is of
+            the order 1/sketch_size) and no data history is stored.
+            If ``None`` (default value) the exact quantiles of the
+            stored history are used.
         """
         super(AdaptiveCutoffNode, self).__init__(hist_fraction=hist_fraction,
                                                  hist_filename=hist_filename,
+                                                 hist_size=hist_size,
                                                  input_dim=input_dim,
                                                  output_dim=output_dim,
                                                  dtype=dtype)
         self.lower_cutoff_fraction = lower_cutoff_fraction
         self.upper_cutoff_fraction = upper_cutoff_fraction
+        self.sketch_size = sketch_size
+        self._sketch = None
         self.lower_bounds = None
         self.upper_bounds = None
         
@@ -788,18 +1107,36 @@ def _get_supported_dtypes(self):
         return (mdp.utils.get_dtypes('Float') +
                 mdp.utils.get_dtypes('AllInteger'))
 
+    def _train(self, x):
+        """Store the history data or update the quantile sketch."""
+        if self.sketch_size is None:
+            super(AdaptiveCutoffNode, self)._train(x)
+            return
+        if self.hist_fraction < 1.0:
+            x = x[numx.random.random(len(x)) < self.hist_fraction]
+        if self._sketch is None:
+            self._sketch = _QuantileSketch(self.sketch_size)
+        self._sketch.update(x)
+
     def _stop_training(self):
         """Calculate the cutoff bounds based on collected histogram data."""
         if self.lower_cutoff_fraction or self.upper_cutoff_fraction:
-            sorted_data = self.data_hist.copy()
-            sorted_data.sort(axis=0)
+            if self._sketch is not None:
+                n_samples = self._sketch.n
+                get_bound = self._sketch.at_rank
+            else:
+                sorted_data = self.data_hist.copy()
+                sorted_data.sort(axis=0)
+                n_samples = len(sorted_data)
+                def get_bound(rank):
+                    return sorted_data[min(int(rank), n_samples-1)]
             if self.lower_cutoff_fraction:
-                index = self.lower_cutoff_fraction * len(sorted_data)
-                self.lower_bounds = sorted_data[index]
+                rank = self.lower_cutoff_fraction * n_samples
+                self.lower_bounds = get_bound(rank)
             if self.upper_cutoff_fraction:
-                index = (len(sorted_data) -
-                         self.upper_cutoff_fraction * len(sorted_data))
-                self.upper_bounds = sorted_data[index]
+                rank = n_samples - self.upper_cutoff_fraction * n_samples
+                self.upper_bounds = get_bound(rank)
+        self._sketch = None
         super(AdaptiveCutoffNode, self)._stop_training()
 
     def _execute(self, x):
@@ -20,7 +20,171 @@ def inc_age(self):
         self.age += 1
 
 
-class GrowingNeuralGasNode(Node):
+class _NeuralGasBase(Node):
+    """Base class for the neural gas nodes, which stores the graph in arrays.
+
+    The node positions and cumulative errors are stored in contiguous arrays
+    and the edges in a symmetric matrix of edge ages (-1 means that there is
+    no edge), so that the update steps can be vectorized. The order of the
+    graph nodes is the order in which they were added.
+
+    The `mdp.graph.Graph` representation is only created on demand when the
+    ``graph`` attribute is accessed. Its node positions are views of the
+    internal position array, but otherwise it is a snapshot (i.e., changes to
+    the graph structure have no effect on the node).
+    """
+
+    def _init_storage(self):
+        """Initialize the empty arrays."""
+        self._n_nodes = 0
+        # the arrays are allocated when the first node is added, with some
+        # extra capacity for new nodes
+        self._positions = None
+        self._errors = None
+        self._ages = None
+        # _heads[i,j] is True if i is the head of the edge between i and j
+        self._heads = None
+        self._graph = None
+
+    def _ensure_capacity(self, n, dtype):
+        """Make sure that the arrays can hold n nodes."""
+        if self._positions is not None:
+            capacity = self._positions.shape[0]
+            if capacity >= n:
+                return
+            n = max(n, 2 * capacity)
+        else:
+            n = max(n, 16)
+        n_nodes = self._n_nodes
+        positions = numx.zeros((n, self.input_dim), dtype=dtype)
+        errors = numx.zeros(n, dtype="d")
+        ages = -numx.ones((n, n), dtype="l")
+        heads = numx.zeros((n, n), dtype=bool)
+        if self._positions is not None:
+            positions[:n_nodes] = self._positions[:n_nodes]
+            errors[:n_nodes] = self._errors[:n_nodes]
+            ages[:n_nodes, :n_nodes] = self._ages[:n_nodes, :n_nodes]
+            heads[:n_nodes, :n_nodes] = self._heads[:n_nodes, :n_nodes]
+        self._positions = positions
+        self._errors = errors
+        self._ages = ages
+        self._heads = heads
+
+    def _add_node(self, pos):
+        """Add a node at position pos and return its index."""
+        if self.input_dim is None:
+            self.input_dim = pos.shape[0]
+        self._ensure_capacity(self._n_nodes + 1, pos.dtype)
+        index = self._n_nodes
+        self._positions[index] = pos
+        self._errors[index] = 0.
+        self._n_nodes += 1
+        self._graph = None
+        return index
+
+    def _add_edge(self, from_, to_):
+        """Add an edge between the nodes with indices from_ and to_."""
+        self._ages[from_, to_] = self._ages[to_, from_] = 0
+        self._heads[from_, to_] = True
+        self._heads[to_, from_] = False
+
+    def _remove_nodes(self, indices):
+        """Remove the nodes with the given indices (and all their edges)."""
+        n = self._n_nodes
+        keep = numx.ones(n, dtype=bool)
+        keep[indices] = False
+        n_keep = keep.sum()
+        self._positions[:n_keep] = self._positions[:n][keep]
+        self._errors[:n_keep] = self._errors[:n][keep]
+        self._ages[:n_keep, :n_keep] = self._ages[:n, :n][keep][:, keep]
+        self._heads[:n_keep, :n_keep] = self._heads[:n, :n][keep][:, keep]
+        self._ages[n_keep:n] = -1
+        self._ages[:n, n_keep:n] = -1
+        self._n_nodes = n_keep
+
+    def _get_square_distances(self, x):
+        """Return the squared distances of all nodes from the points in x.
+
+        The result is a 2d array with one row for each point in x.
+        """
+        pos = self._positions[:self._n_nodes]
+        distances = utils.mult(x, -2 * pos.T)
+        distances += (x*x).sum(axis=1)[:, numx.newaxis]
+        distances += (pos*pos).sum(axis=1)
+        # avoid negative values due to rounding errors
+        return numx.maximum(distances, 0)
+
+    def _build_graph(self):
+        """Return a new `mdp.graph.Graph` for the current state."""
+        g = graph.Graph()
+        n = self._n_nodes
+        nodes = [g.add_node(_NGNodeData(self._positions[i],
+                                        error=self._errors[i]))
+                 for i in range(n)]
+        heads, tails = (self._ages[:n, :n] >= 0).nonzero()
+        for head, tail in zip(heads, tails):
+            if self._heads[head, tail]:
+                g.add_edge(nodes[head], nodes[tail],
+                           _NGEdgeData(int(self._ages[head, tail])))
+        return g
+
+    def _get_graph(self):
+        if self._graph is None:
+            self._graph = self._build_graph()
+        return self._graph
+
+    graph = property(_get_graph,
+                     doc="The corresponding `mdp.graph.Graph` object.")
+
+    def __getstate__(self):
+        # the graph can be recreated from the arrays
+        state = self.__dict__.copy()
+        state["_graph"] = None
+        return state
+
+    def __setstate__(self, state):
+        # nodes pickled by older versions store the graph instead of the
+        # arrays
+        old_graph = state.pop("graph", None)
+        self.__dict__.update(state)
+        if old_graph is not None:
+            self._init_storage()
+            self._load_graph(old_graph)
+
+    def _load_graph(self, g):
+        """Fill the empty arrays with the nodes and edges of the
+        `mdp.graph.Graph` g."""
+        indices = {}
+        for node in g.nodes:
+            index = self._add_node(numx.asarray(node.data.pos))
+            self._errors[index] = node.data.cum_error
+            indices[id(node)] = index
+        for edge in g.edges:
+            head, tail = indices[id(edge.head)], indices[id(edge.tail)]
+            self._add_edge(head, tail)
+            self._ages[head, tail] = self._ages[tail, head] = edge.data.age
+
+    def get_nodes_position(self):
+        return numx.array(self._positions[:self._n_nodes], dtype=self.dtype)
+
+    def nearest_neighbor(self, input):
+        """Assign each point in the input data to the nearest node in
+        the graph. Return the list of the nearest node instances, and
+        the list of distances.
+        Executing this function will close the training phase if
+        necessary."""
+        super(_NeuralGasBase, self).execute(input)
+
+        distances = self._get_square_distances(input)
+        indices = distances.argmin(axis=1)
+        graph_nodes = self.graph.nodes
+        nodes = [graph_nodes[i] for i in indices]
+        dists = list(numx.sqrt(distances[numx.arange(len(indices)),
+                                         indices]))
+        return nodes, dists
+
+
+class GrowingNeuralGasNode(_NeuralGasBase):
     """Learn the topological structure of the input data by building a
     corresponding graph approximation.
 
@@ -35,10 +199,15 @@ class GrowingNeuralGasNode(Node):
     D. S. Touretzky, and T. K. Leen (editors), Advances in Neural Information
     Processing Systems 7, pages 625-632. MIT Press, Cambridge MA, 1995.
 
+    The graph is internally stored in arrays, and the edges in a matrix of
+    size (number of nodes)^2.
+
     **Attributes and methods of interest**
 
-    - graph -- The corresponding `mdp.graph.Graph` object
+    - graph -- The corresponding `mdp.graph.Graph` object (created on
+      demand)
     """
+
     def __init__(self, start_poss=None, eps_b=0.2, eps_n=0.006, max_age=50,
                  lambda_=100, alpha=0.5, d=0.995, max_nodes=2147483647,
                  input_dim=None, dtype=None):
@@ -95,7 +264,7 @@ def __init__(self, start_poss=None, eps_b=0.2, eps_n=0.006, max_age=50,
 
             Default: 2^31 - 1
         """
-        self.graph = graph.Graph()
+        self._init_storage()
         self.tlen = 0
 
         #copy parameters
@@ -116,80 +285,32 @@ def _set_input_dim(self, n):
         self._input_dim = n
         self.output_dim = n
 
-    def _add_node(self, pos):
-        node = self.graph.add_node(_NGNodeData(pos))
-        return node
-
-    def _add_edge(self, from_, to_):
-        self.graph.add_edge(from_, to_, _NGEdgeData())
-
-    def _get_nearest_nodes(self, x):
-        """Return the two nodes in the graph that are nearest to x and their
-        squared distances. (Return ([node1, node2], [dist1, dist2])"""
-        # distance function
-        def _distance_from_node(node):
-            #return norm(node.data.pos-x)**2
-            tmp = node.data.pos - x
-            return utils.mult(tmp, tmp)
-        g = self.graph
-        # distances of all graph nodes from x
-        distances = numx.array(map(_distance_from_node, g.nodes))
-        ids = distances.argsort()[:2]
-        #nearest = [g.nodes[idx] for idx in ids]
-        #return nearest, distances[ids]
-        return (g.nodes[ids[0]], g.nodes[ids[1]]), distances.take(ids)
-
-    def _move_node(self, node, x, eps):
-        """Move a node by eps in the direction x."""
-        # ! make sure that eps already has the right dtype
-        node.data.pos += eps*(x - node.data.pos)
-
-    def _remove_old_edges(self, edges):
-        """Remove all edges older than the maximal age."""
-        g, max_age = self.graph, self.max_age
-        for edge in edges:
-            if edge.data.age > max_age:
-                g.remove_edge(edge)
-                if edge.head.degree() == 0:
-                    g.remove_node(edge.head)
-                if edge.tail.degree() == 0:
-                    g.remove_node(edge.tail)
-
     def _insert_new_node(self):
         """Insert a new node in the graph where it is more necessary (i.e.
         where the error is the largest)."""
-        g = self.graph
+        n = self._n_nodes
+        errors = self._errors[:n]
         # determine the node with the highest error
-        errors = map(lambda x: x.data.cum_error, g.nodes)
-        qnode = g.nodes[numx.argmax(errors)]
+        qnode = errors.argmax()
         # determine the neighbour with the highest error
-        neighbors = qnode.neighbors()
-        errors = map(lambda x: x.data.cum_error, neighbors)
-        fnode = neighbors[numx.argmax(errors)]
+        neighbors = (self._ages[qnode, :n] >= 0).nonzero()[0]
+        fnode = neighbors[errors[neighbors].argmax()]
         # new node, halfway between the worst node and the worst of
         # its neighbors
-        new_pos = 0.5*(qnode.data.pos + fnode.data.pos)
+        new_pos = 0.5*(self._positions[qnode] + self._positions[fnode])
         new_node = self._add_node(new_pos)
         # update edges
-        edges = qnode.get_edges(neighbor=fnode)
-        g.remove_edge(edges[0])
+        self._ages[qnode, fnode] = self._ages[fnode, qnode] = -1
         self._add_edge(qnode, new_node)
         self._add_edge(fnode, new_node)
         # update errors
-        qnode.data.cum_error *= self.alpha
-        fnode.data.cum_error *= self.alpha
-        new_node.data.cum_error = 0.5*(qnode.data.cum_error+
-                                       fnode.data.cum_error)
-
-    def get_nodes_position(self):
-        return numx.array(map(lambda n: n.data.pos, self.graph.nodes),
-                          dtype = self.dtype)
+        errors = self._errors
+        errors[qnode] *= self.alpha
+        errors[fnode] *= self.alpha
+        errors[new_node] = 0.5*(errors[qnode] + errors[fnode])
 
     def _train(self, input):
-        g = self.graph
-        d = self.d
-
-        if len(g.nodes)==0:
+        if self._n_nodes == 0:
             # if missing, generate two initial nodes at random
             # assuming that the input data has zero mean and unit variance,
             # choose the random position according to a gaussian distribution
@@ -197,63 +318,63 @@ def _train(self, input):
             normal = numx_rand.normal
             self._add_node(self._refcast(normal(0.0, 1.0, self.input_dim)))
             self._add_node(self._refcast(normal(0.0, 1.0, self.input_dim)))
+        self._graph = None
 
+        eps_b, eps_n, max_age, d = self.eps_b, self.eps_n, self.max_age, self.d
         # loop on single data points
         for x in input:
             self.tlen += 1
+            n = self._n_nodes
+            # views on the arrays (they can be reallocated in step 8)
+            pos = self._positions[:n]
+            ages = self._ages[:n, :n]
 
             # step 2 - find the nearest nodes
-            # dists are the squared distances of x from n0, n1
-            (n0, n1), dists = self._get_nearest_nodes(x)
+            # dists are the squared distances of x from all nodes
+            diff = x - pos
+            dists = (diff*diff).sum(axis=1)
+            n0 = dists.argmin()
+            dist0 = dists[n0]
+            dists[n0] = numx.inf
+            n1 = dists.argmin()
 
             # step 3 - increase age of the emanating edges
-            for e in n0.get_edges():
-                e.data.inc_age()
+            neighbors = (ages[n0] >= 0).nonzero()[0]
+            ages[n0, neighbors] += 1
+            ages[neighbors, n0] += 1
 
             # step 4 - update error
-            n0.data.cum_error += numx.sqrt(dists[0])
+            self._errors[n0] += numx.sqrt(dist0)
 
             # step 5 - move nearest node and neighbours
-            self._move_node(n0, x, self.eps_b)
-            # neighbors undirected
-            neighbors = n0.neighbors()
-            for n in neighbors:
-                self._move_node(n, x, self.eps_n)
+            pos[n0] += eps_b*diff[n0]
+            pos[neighbors] += eps_n*diff[neighbors]
 
             # step 6 - update n0<->n1 edge
-            if n1 in neighbors:
-                # should be one edge only
-                edges = n0.get_edges(neighbor=n1)
-                edges[0].data.age = 0
+            if ages[n0, n1] >= 0:
+                ages[n0, n1] = ages[n1, n0] = 0
             else:
                 self._add_edge(n0, n1)
 
             # step 7 - remove old edges
-            self._remove_old_edges(n0.get_edges())
+            old = neighbors[ages[n0, neighbors] > max_age]
+            if len(old):
+                ages[n0, old] = -1
+                ages[old, n0] = -1
+                isolated = [i for i in old if not (ages[i] >= 0).any()]
+                if not (ages[n0] >= 0).any():
+                    isolated.append(n0)
+                if isolated:
+                    self._remove_nodes(isolated)
 
             # step 8 - add a new node each lambda steps
-            if not self.tlen % self.lambda_ and len(g.nodes) < self.max_nodes:
+            if (not self.tlen % self.lambda_ and
+                self._n_nodes < self.max_nodes):
                 self._insert_new_node()
 
             # step 9 - decrease errors
-            for node in g.nodes:
-                node.data.cum_error *= d
-
-    def nearest_neighbor(self, input):
-        """Assign each point in the input data to the nearest node in
-        the graph. Return the list of the nearest node instances, and
-        the list of distances.
-        Executing this function will close the training phase if
-        necessary."""
-        super(GrowingNeuralGasNode, self).execute(input)
+            self._errors[:self._n_nodes] *= d
 
-        nodes = []
-        dists = []
-        for x in input:
-            (n0, _), dist = self._get_nearest_nodes(x)
-            nodes.append(n0)
-            dists.append(numx.sqrt(dist[0]))
-        return nodes, dists
 
 class NeuralGasNode(GrowingNeuralGasNode):
     """Learn the topological structure of the input data by building a
@@ -329,7 +450,7 @@ def __init__(self, num_nodes = 10,
             train once until max_epochs is reached.
         """
 
-        self.graph = graph.Graph()
+        self._init_storage()
 
         if n_epochs_to_train is None:
             n_epochs_to_train = max_epochs
@@ -359,9 +480,7 @@ def __init__(self, num_nodes = 10,
 
 
     def _train(self, input):
-        g = self.graph
-
-        if len(g.nodes) == 0:
+        if self._n_nodes == 0:
             # if missing, generate num_nodes initial nodes at random
             # assuming that the input data has zero mean and unit variance,
             # choose the random position according to a gaussian distribution
@@ -369,7 +488,12 @@ def _train(self, input):
             normal = numx_rand.normal
             for _ in range(self.num_nodes):
                 self._add_node(self._refcast(normal(0.0, 1.0, self.input_dim)))
+        self._graph = None
 
+        n = self._n_nodes
+        pos = self._positions[:n]
+        ages = self._ages[:n, :n]
+        ranks = numx.empty(n, dtype=pos.dtype)
         epoch = self.epoch
         e_i = self.epsilon_i
         e_f = self.epsilon_f
@@ -392,61 +516,29 @@ def _train(self, input):
             epoch += 1
             for x in di:
                 # Step 1 rank nodes according to their distance to random point
-                ranked_nodes = self._rank_nodes_by_distance(x)
+                diff = x - pos
+                ids = (diff*diff).sum(axis=1).argsort()
+                ranks[ids] = numx.arange(n)
 
                 # Step 2 move nodes
-                for rank,node in enumerate(ranked_nodes):
-                    #TODO: cut off at some rank when using many nodes
-                    #TODO: check speedup by vectorizing
-                    delta_w = epsilon * numx.exp(-rank / lmbda) * \
-                                    (x - node.data.pos)
-                    node.data.pos += delta_w
+                #TODO: cut off at some rank when using many nodes
+                pos += (epsilon * numx.exp(-ranks / lmbda))[:, numx.newaxis] \
+                       * diff
 
                 # Step 3 update edge weight
-                for e in g.edges:
-                    e.data.inc_age()
+                edges = ages >= 0
+                ages[edges] += 1
 
                 # Step 4 set age of edge between first two nodes to zero
                 #  or create it if it doesn't exist.
-                n0 = ranked_nodes[0]
-                n1 = ranked_nodes[1]
-                nn = n0.neighbors()
-                if n1 in nn:
-                    edges = n0.get_edges(neighbor=n1)
-                    edges[0].data.age = 0  # should only be one edge
+                n0 = ids[0]
+                n1 = ids[1]
+                if edges[n0, n1]:
+                    ages[n0, n1] = ages[n1, n0] = 0
                 else:
                     self._add_edge(n0, n1)
 
                 # step 5 delete edges with age > max_age
-                self._remove_old_edges(max_age=T)
+                ages[ages > T] = -1
             remaining_epochs -= 1
         self.epoch = epoch
-
-
-    def _rank_nodes_by_distance(self, x):
-        """Return the nodes in the graph in a list ranked by their squared
-        distance to x. """
-
-        #TODO: Refactor together with GNGNode._get_nearest_nodes
-
-        # distance function
-        def _distance_from_node(node):
-            tmp = node.data.pos - x
-            return utils.mult(tmp, tmp) # maps to mdp.numx.dot
-
-        g = self.graph
-
-        # distances of all graph nodes from x
-        distances = numx.array(map(_distance_from_node, g.nodes))
-        ids = distances.argsort()
-        ranked_nodes = [g.nodes[id] for id in ids]
-
-        return ranked_nodes
-
-
-    def _remove_old_edges(self, max_age):
-        """Remove edges with age > max_age."""
-        g = self.graph
-        for edge in self.graph.edges:
-            if edge.data.age > max_age:
-                g.remove_edge(edge)
@@ -2,7 +2,7 @@
 
 import mdp
 from mdp import numx
-from mdp.utils import (mult, nongeneral_svd, CovarianceMatrix,
+from mdp.utils import (mult, mult_into, nongeneral_svd, CovarianceMatrix,
                        symeig, SymeigException)
 import warnings as _warnings
 
@@ -262,6 +262,15 @@ def _execute(self, x, n=None):
             return mult(x-self.avg, self.v[:, :n])
         return mult(x-self.avg, self.v)
 
+    def _execute_out(self, x, out):
+        # avoid the temporary centered copy of x
+        mult_into(x, self.v, out)
+        out -= mult(self.avg, self.v)
+        return out
+
+    def _get_affine_map(self):
+        return self.v, -numx.ravel(mult(self.avg, self.v))
+
     def _inverse(self, y, n=None):
         """Project 'y' to the input space using the first 'n' components.
         If 'n' is not set, use all available components."""
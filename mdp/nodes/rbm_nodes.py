@@ -2,7 +2,7 @@
 
 import mdp
 from mdp import numx
-from mdp.utils import mult
+from mdp.utils import mult, mult_into
 
 random = mdp.numx_rand.random
 randn = mdp.numx_rand.randn
@@ -17,6 +17,14 @@ def rrep(x, n):
     shp = x.shape + (1,)
     return x.reshape(shp).repeat(n, axis=-1)
 
+def _logistic(a):
+    """Compute the logistic function 1/(1+exp(-a)) in place."""
+    numx.negative(a, a)
+    exp(a, a)
+    a += 1.
+    numx.reciprocal(a, a)
+    return a
+
 
 class RBMNode(mdp.Node):
     """Restricted Boltzmann Machine node. An RBM is an undirected
@@ -35,6 +43,12 @@ class RBMNode(mdp.Node):
     Hinton, G. E. (2002). Training products of experts by minimizing
     contrastive divergence. Neural Computation, 14(8):1711-1800
 
+    Large chunks of training data can be split in mini-batches, and
+    Persistent Contrastive Divergence can be used instead, as described in
+    Tieleman, T. (2008). Training restricted Boltzmann machines using
+    approximations to the likelihood gradient. Proc. 25th ICML, 1064-1071.
+    The arrays used during training are allocated once and reused.
+
     **Internal variables of interest**
 
       ``self.w``
@@ -50,6 +64,10 @@ class RBMNode(mdp.Node):
     Geoffrey E. Hinton (2007) Boltzmann machine. Scholarpedia, 2(5):1668
     """
 
+    # defaults for nodes pickled by older versions
+    _buffers = None
+    _chain = None
+
     def __init__(self, hidden_dim, visible_dim = None, dtype = None):
         """
         :Parameters:
@@ -60,6 +78,14 @@ def __init__(self, hidden_dim, visible_dim = None, dtype = None):
         """
         super(RBMNode, self).__init__(visible_dim, hidden_dim, dtype)
         self._initialized = False
+        # arrays reused during training
+        self._buffers = {}
+
+    def __getstate__(self):
+        # the training buffers are not stored
+        state = self.__dict__.copy()
+        state['_buffers'] = {}
+        return state
 
     def _init_weights(self):
         # weights and biases are initialized to small random values to
@@ -76,21 +102,72 @@ def _init_weights(self):
 
         # delta w, bv, bh used for momentum term
         self._delta = (0., 0., 0.)
+        # state of the persistent Markov chains, given by the hidden units
+        self._chain = None
 
-    def _sample_h(self, v):
-        # returns P(h=1|v,W,b) and a sample from it
-        probs = 1./(1. + exp(-self.bh - mult(v, self.w)))
-        h = (probs > random(probs.shape)).astype(self.dtype)
+    def _get_buffer(self, name, shape):
+        """Return an array of the given shape for temporary results.
+
+        The array is only allocated again if it is too small.
+        """
+        if self._buffers is None:
+            self._buffers = {}
+        buf = self._buffers.get(name)
+        if (buf is None or buf.dtype != self.dtype or
+            buf.shape[1:] != shape[1:] or buf.shape[0] < shape[0]):
+            buf = numx.empty(shape, dtype=self.dtype)
+            self._buffers[name] = buf
+        return buf[:shape[0]]
+
+    def _get_buffers(self, name, shape):
+        """Return a tuple of arrays for probabilities and samples."""
+        return (self._get_buffer(name + '_probs', shape),
+                self._get_buffer(name, shape))
+
+    def _sample_h(self, v, out=None):
+        # returns P(h=1|v,W,b) and a sample from it,
+        # the arrays in the tuple out are used for the results if given
+        shape = v.shape[:-1] + (self.output_dim,)
+        if out is None:
+            out = (numx.empty(shape, dtype=self.dtype),
+                   numx.empty(shape, dtype=self.dtype))
+        probs, h = out
+        mult_into(v, self.w, probs)
+        probs += self.bh
+        _logistic(probs)
+        numx.greater(probs, random(shape), h)
         return probs, h
 
-    def _sample_v(self, h):
-        # returns  P(v=1|h,W,b) and a sample from it
-        probs = 1./(1. + exp(-self.bv - mult(h, self.w.T)))
-        v = (probs > random(probs.shape)).astype(self.dtype)
+    def _sample_v(self, h, out=None):
+        # returns  P(v=1|h,W,b) and a sample from it,
+        # the arrays in the tuple out are used for the results if given
+        shape = h.shape[:-1] + (self.input_dim,)
+        if out is None:
+            out = (numx.empty(shape, dtype=self.dtype),
+                   numx.empty(shape, dtype=self.dtype))
+        probs, v = out
+        mult_into(h, self.w.T, probs)
+        probs += self.bv
+        _logistic(probs)
+        numx.greater(probs, random(shape), v)
         return probs, v
 
+    @staticmethod
+    def _momentum_step(delta, grad, momentum, epsilon):
+        """Return the new parameter change momentum*delta + epsilon*grad.
+
+        The array of the old change is reused, grad is overwritten.
+        """
+        grad *= epsilon
+        if numx.isscalar(delta) or delta.shape != grad.shape:
+            return grad.copy()
+        delta *= momentum
+        delta += grad
+        return delta
+
     def _train(self, v, n_updates=1, epsilon=0.1, decay=0., momentum=0.,
-               update_with_ph=True, verbose=False):
+               update_with_ph=True, verbose=False, batch_size=None,
+               persistent=False):
         """Update the internal structures according to the input data `v`.
         The training is performed using Contrastive Divergence (CD).
 
@@ -111,10 +188,40 @@ def _train(self, v, n_updates=1, epsilon=0.1, decay=0., momentum=0.,
             probability of the hidden unit activations instead of a
             sample from it. This is in order to speed up sequential
             learning of RBMs. Set this to False to use the samples instead.
+          batch_size
+            If not None, `v` is split in mini-batches of this size and one
+            update is performed for each of them. Default value: None
+          persistent
+            If True, use Persistent Contrastive Divergence: the model term
+            is computed with Markov chains that are continued from one
+            update to the next, instead of being started at the data.
+            The number of chains is the size of the first mini-batch.
+            Default value: False
         """
         if not self._initialized:
             self._init_weights()
 
+        n = v.shape[0]
+        if batch_size is None:
+            batch_size = n
+        train_err = 0.
+        for start in range(0, n, batch_size):
+            train_err += self._update(v[start:start+batch_size], n_updates,
+                                      epsilon, decay, momentum,
+                                      update_with_ph, persistent)
+        self._train_err = train_err
+
+        if verbose:
+            print 'training error', self._train_err/v.shape[0]
+            ph, h = self._sample_h(v)
+            print 'energy', self._energy(v, ph).sum()
+
+    def _update(self, v, n_updates, epsilon, decay, momentum,
+                update_with_ph, persistent):
+        """Perform a single CD update with the mini-batch `v`.
+
+        Return the squared reconstruction error.
+        """
         # useful quantities
         n = v.shape[0]
         w, bv, bh = self.w, self.bv, self.bh
@@ -123,47 +230,63 @@ def _train(self, v, n_updates=1, epsilon=0.1, decay=0., momentum=0.,
         dw, dbv, dbh = self._delta
 
         # first update of the hidden units for the data term
-        ph_data, h_data = self._sample_h(v)
+        ph_data, h_data = self._sample_h(
+                    v, out=self._get_buffers('h_data', (n, self.output_dim)))
+        if persistent:
+            if self._chain is None:
+                self._chain = h_data.copy()
+            h_model = self._chain
+        else:
+            h_model = h_data
         # n updates of both v and h for the model term
-        h_model = h_data.copy()
+        m = h_model.shape[0]
+        v_buffers = self._get_buffers('v_model', (m, self.input_dim))
+        h_buffers = self._get_buffers('h_model', (m, self.output_dim))
         for i in range(n_updates):
-            pv_model, v_model = self._sample_v(h_model)
-            ph_model, h_model = self._sample_h(v_model)
+            pv_model, v_model = self._sample_v(h_model, out=v_buffers)
+            ph_model, h_model = self._sample_h(v_model, out=h_buffers)
+        if persistent:
+            self._chain[:] = h_model
+            # the model samples are no reconstructions of the data
+            rec_buffers = self._get_buffers('v_rec', (n, self.input_dim))
+            pv_rec, v_rec = self._sample_v(h_data, out=rec_buffers)
+        else:
+            v_rec = v_model
 
         # update w
-        data_term = mult(v.T, ph_data)
-        model_term = mult(v_model.T, ph_model)
-        dw = momentum*dw + epsilon*((data_term - model_term)/n - decay*w)
+        grad = mult_into(v.T, ph_data, self._get_buffer('grad', w.shape))
+        grad /= n
+        model_term = mult_into(v_model.T, ph_model,
+                               self._get_buffer('model_term', w.shape))
+        model_term /= m
+        grad -= model_term
+        if decay:
+            grad -= decay*w
+        dw = self._momentum_step(dw, grad, momentum, epsilon)
         w += dw
 
         # update bv
-        data_term = v.sum(axis=0)
-        model_term = v_model.sum(axis=0)
-        dbv = momentum*dbv + epsilon*((data_term - model_term)/n)
+        grad = v.sum(axis=0)/n - v_model.sum(axis=0)/m
+        dbv = self._momentum_step(dbv, grad, momentum, epsilon)
         bv += dbv
 
         # update bh
         if update_with_ph:
-            data_term = ph_data.sum(axis=0)
-            model_term = ph_model.sum(axis=0)
+            grad = ph_data.sum(axis=0)/n - ph_model.sum(axis=0)/m
         else:
-            data_term = h_data.sum(axis=0)
-            model_term = h_model.sum(axis=0)
-        dbh = momentum*dbh + epsilon*((data_term - model_term)/n)
+            grad = h_data.sum(axis=0)/n - h_model.sum(axis=0)/m
+        dbh = self._momentum_step(dbh, grad, momentum, epsilon)
         bh += dbh
 
         self._delta = (dw, dbv, dbh)
-        self._train_err = float(((v-v_model)**2.).sum())
-
-        if verbose:
-            print 'training error', self._train_err/v.shape[0]
-            ph, h = self._sample_h(v)
-            print 'energy', self._energy(v, ph).sum()
+        err = numx.subtract(v, v_rec, self._get_buffer('err', v.shape))
+        err *= err
+        return float(err.sum())
 
     def _stop_training(self):
         #del self._delta
         #del self._train_err
-        pass
+        self._buffers = {}
 
     # execution methods
 
@@ -271,37 +394,42 @@ def _set_input_dim(self, n):
         self._input_dim = n
         self._visible_dim = n - self._labels_dim
 
-    def _sample_v(self, h, sample_l=False, concatenate=True):
+    def _sample_v(self, h, sample_l=False, concatenate=True, out=None):
         # returns  P(v=1|h,W,b), a sample from it, P(l=1|h,W,b),
-        # and a sample from it
+        # and a sample from it,
+        # the arrays in the tuple out are used for the results if given
 
         ldim, vdim = self._labels_dim, self._visible_dim
+        shape = (h.shape[0], self.input_dim)
+        if out is None:
+            out = (numx.empty(shape, dtype=self.dtype),
+                   numx.empty(shape, dtype=self.dtype))
+        probs, x = out
 
         # activation
-        a = self.bv + mult(h, self.w.T)
-        av, al = a[:, :vdim], a[:, vdim:]
+        mult_into(h, self.w.T, probs)
+        probs += self.bv
+        probs_v, probs_l = probs[:, :vdim], probs[:, vdim:]
+        v, l = x[:, :vdim], x[:, vdim:]
 
         # ## visible units: logistic activation
-        probs_v = 1./(1. + exp(-av))
-        v = (probs_v > random(probs_v.shape)).astype('d')
+        _logistic(probs_v)
+        numx.greater(probs_v, random(probs_v.shape), v)
 
         # ## label units: softmax activation
         # subtract maximum to regularize exponent
-        exponent = al - rrep(al.max(axis=1), ldim)
-        probs_l = exp(exponent)
+        probs_l -= rrep(probs_l.max(axis=1), ldim)
+        exp(probs_l, probs_l)
         probs_l /= rrep(probs_l.sum(axis=1), ldim)
 
         if sample_l:
             # ?? todo: I'm sure this can be optimized
-            l = numx.zeros((h.shape[0], ldim))
             for t in range(h.shape[0]):
                 l[t, :] = mdp.numx_rand.multinomial(1, probs_l[t, :])
         else:
-            l = probs_l.copy()
+            l[:] = probs_l
 
         if concatenate:
-            probs = numx.concatenate((probs_v, probs_l), axis=1)
-            x = numx.concatenate((v, l), axis=1)
             return probs, x
         else:
             return probs_v, probs_l, v, l
@@ -364,7 +492,7 @@ def is_invertible():
         return False
 
     def train(self, v, l, n_updates=1, epsilon=0.1, decay=0., momentum=0.,
-              verbose=False):
+              verbose=False, batch_size=None, persistent=False):
         """Update the internal structures according to the visible data `v`
         and the labels `l`.
         The training is performed using Contrastive Divergence (CD).
@@ -384,6 +512,12 @@ def train(self, v, l, n_updates=1, epsilon=0.1, decay=0., momentum=0.,
             weight decay term. Default value: 0.
           momentum
             momentum term. Default value: 0.
+          batch_size
+            If not None, the data is split in mini-batches of this size and
+            one update is performed for each of them. Default value: None
+          persistent
+            If True, use Persistent Contrastive Divergence.
+            Default value: False
         """
 
         if not self.is_training():
@@ -399,4 +533,6 @@ def train(self, v, l, n_updates=1, epsilon=0.1, decay=0., momentum=0.,
                                               epsilon=epsilon,
                                               decay=decay,
                                               momentum=momentum,
-                                              verbose=verbose)
+                                              verbose=verbose,
+                                              batch_size=batch_size,
+                                              persistent=persistent)
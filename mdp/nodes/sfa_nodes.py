@@ -2,7 +2,7 @@
 
 import mdp
 from mdp import numx, Node, NodeException, TrainingException
-from mdp.utils import (mult, pinv, CovarianceMatrix, QuadraticForm,
+from mdp.utils import (mult, mult_into, pinv, CovarianceMatrix, QuadraticForm,
                        symeig, SymeigException)
 
 class SFANode(Node):
@@ -66,16 +66,33 @@ class SFANode(Node):
 
           You can even change this behaviour during training. Just set the
           corresponding switch in the `train` method.
+
+      ``streaming``
+          If ``True`` the chunks passed to `train` are treated as consecutive
+          parts of a single signal, without any overlap. The last sample of
+          each chunk is kept for the derivative with the first sample of the
+          next chunk, so the training result is the same as for the whole
+          signal at once. Chunks (apart from the first one) can then be as
+          small as a single sample. If ``include_last_sample`` is ``False``
+          then only the last sample of the whole signal is excluded from the
+          covariance matrix.
     """
 
+    # defaults for nodes pickled by older versions
+    _streaming = False
+    _last_sample = None
+
     def __init__(self, input_dim=None, output_dim=None, dtype=None,
-                 include_last_sample=True):
+                 include_last_sample=True, streaming=False):
         """
-        For the ``include_last_sample`` switch have a look at the
-        SFANode class docstring.
+        For the ``include_last_sample`` and ``streaming`` switches have a look
+        at the SFANode class docstring.
          """
         super(SFANode, self).__init__(input_dim, output_dim, dtype)
         self._include_last_sample = include_last_sample
+        self._streaming = streaming
+        # last sample of the previous chunk in the streaming mode
+        self._last_sample = None
 
         # init two covariance matrices
         # one for the input data
@@ -112,6 +129,9 @@ def _check_train_args(self, x, *args, **kwargs):
         # check that we have at least 2 time samples to
         # compute the update for the derivative covariance matrix
         s = x.shape[0]
+        if self._streaming and self._last_sample is not None:
+            # the derivative is computed with the previous sample
+            s += 1
         if  s < 2:
             raise TrainingException('Need at least 2 time samples to '
                                     'compute time derivative (%d given)'%s)
@@ -127,8 +147,22 @@ def _train(self, x, include_last_sample=None):
         last_sample_index = None if include_last_sample else -1
 
         # update the covariance matrices
-        self._cov_mtx.update(x[:last_sample_index, :])
-        self._dcov_mtx.update(self.time_derivative(x))
+        if self._streaming:
+            if self._last_sample is not None:
+                x_ext = numx.concatenate((self._last_sample, x))
+            else:
+                x_ext = x
+            if include_last_sample:
+                self._cov_mtx.update(x)
+            else:
+                # the sample held back from the previous chunk is used now,
+                # so only the last sample of the whole stream is excluded
+                self._cov_mtx.update(x_ext[:-1, :])
+            self._dcov_mtx.update(self.time_derivative(x_ext))
+            self._last_sample = x[-1:].copy()
+        else:
+            self._cov_mtx.update(x[:last_sample_index, :])
+            self._dcov_mtx.update(self.time_derivative(x))
 
     def _stop_training(self, debug=False):
         ##### request the covariance matrices and clean up
@@ -140,6 +174,7 @@ def _stop_training(self, debug=False):
         # the covariance matrix
         self.dcov_mtx, self.davg, self.dtlen = self._dcov_mtx.fix(center=False)
         del self._dcov_mtx
+        self._last_sample = None
 
         rng = self._set_range()
 
@@ -179,6 +214,14 @@ def _execute(self, x, n=None):
             bias = self._bias
         return mult(x, sf) - bias
 
+    def _execute_out(self, x, out):
+        mult_into(x, self.sf, out)
+        out -= self._bias
+        return out
+
+    def _get_affine_map(self):
+        return self.sf, -numx.ravel(self._bias)
+
     def _inverse(self, y):
         return mult(y, pinv(self.sf)) + self.avg
 
@@ -226,11 +269,11 @@ class SFA2Node(SFANode):
     Learning of Invariances, Neural Computation, 14(4):715-770 (2002)."""
 
     def __init__(self, input_dim=None, output_dim=None, dtype=None,
-                 include_last_sample=True):
+                 include_last_sample=True, streaming=False):
         self._expnode = mdp.nodes.QuadraticExpansionNode(input_dim=input_dim,
                                                          dtype=dtype)
         super(SFA2Node, self).__init__(input_dim, output_dim, dtype,
-                                       include_last_sample)
+                                       include_last_sample, streaming)
 
     @staticmethod
     def is_invertible():
@@ -297,6 +297,14 @@ def _execute(self, x):
         result[:, :-self.L] = src
         return result
 
+    def _get_affine_map(self):
+        n_exp = self.input_dim - self.output_dim
+        A = mdp.numx.zeros((self.input_dim, self.output_dim))
+        A[:n_exp, -self.L:] = -self.proj_mtx
+        A[n_exp:-self.L, :-self.L] = mdp.numx.eye(self.output_dim - self.L)
+        A[-self.L:, -self.L:] = mdp.numx.eye(self.L)
+        return A, mdp.numx.zeros(self.output_dim)
+
 class NormalizeNode(mdp.PreserveDimNode):
     """Make input signal meanfree and unit variance"""
     def __init__(self, input_dim=None, output_dim=None, dtype=None):
@@ -318,5 +326,8 @@ def _stop_training(self):
     def _execute(self, x):
         return (x - self.m)/self.s
 
+    def _get_affine_map(self):
+        return mdp.numx.diag(1./self.s), -self.m/self.s
+
     def _inverse(self, y):
         return y*self.s + self.m
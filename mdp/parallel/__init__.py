@@ -21,11 +21,12 @@
 
 
 from scheduling import (
-    ResultContainer, ListResultContainer, OrderedResultContainer, TaskCallable,
+    ResultContainer, ListResultContainer, OrderedResultContainer,
+    StreamResultContainer, TaskCallable,
     SqrTestCallable, SleepSqrTestCallable, TaskCallableWrapper, Scheduler,
     cpu_count, MDPVersionCallable
 )
-from process_schedule import ProcessScheduler
+from process_schedule import ProcessScheduler, ProcessSchedulerException
 from thread_schedule import ThreadScheduler
 from parallelnodes import (
     ParallelExtensionNode, NotForkableParallelException, JoinParallelException,
@@ -55,9 +56,10 @@
 
 __all__ = [
     "ResultContainer", "ListResultContainer",
-    "OrderedResultContainer", "TaskCallable", "SqrTestCallable",
+    "OrderedResultContainer", "StreamResultContainer", "TaskCallable",
+    "SqrTestCallable",
     "SleepSqrTestCallable", "TaskCallableWrapper", "Scheduler",
-    "ProcessScheduler", "ThreadScheduler",
+    "ProcessScheduler", "ProcessSchedulerException", "ThreadScheduler",
     "ParallelExtensionNode", "JoinParallelException",
     "NotForkableParallelException",
     "ParallelSFANode", "ParallelSFANode", "ParallelFDANode",
@@ -4,13 +4,18 @@
 Corresponding classes for task callables and ResultContainer are defined here
 as well.
 """
+from __future__ import with_statement
+
+import collections
+import warnings as _warnings
 
 import mdp
 from mdp import numx as n
 
 from parallelnodes import NotForkableParallelException
 from scheduling import (
-    TaskCallable, ResultContainer, OrderedResultContainer, Scheduler
+    TaskCallable, ResultContainer, ListResultContainer,
+    OrderedResultContainer, StreamResultContainer, Scheduler, cpu_count
 )
 from mdp.hinet import FlowNode
 
@@ -100,6 +105,66 @@ def fork(self):
                               purge_nodes=self._purge_nodes)
 
 
+class _ChunkGroupCallable(TaskCallable):
+    """Wrapper which trains a single fork on a whole group of data chunks.
+
+    This is more efficient than one fork per chunk, since the node statistics
+    are directly accumulated in the fork and only one trained flownode has to
+    be returned and joined for the whole group.
+
+    The wrapped train callable must not purge the nodes (purge_nodes=False),
+    since the flownode is used for multiple chunks. The purging is instead
+    done by this wrapper after the last chunk.
+    """
+
+    def __init__(self, task_callable, purge_nodes=True):
+        """Store the wrapped train callable.
+
+        task_callable -- Flow train callable, created with purge_nodes=False.
+        purge_nodes -- If True nodes not needed for the join will be replaced
+            with dummy nodes to reduce the footprint.
+        """
+        self._callable = task_callable
+        self._purge_nodes = purge_nodes
+        super(_ChunkGroupCallable, self).__init__()
+
+    def setup_environment(self):
+        """Setup the environment for the wrapped callable."""
+        self._callable.setup_environment()
+
+    def __call__(self, chunks):
+        """Train on all the chunks and return the trained flownode.
+
+        chunks -- List of data chunks, each one as for the wrapped callable.
+        """
+        for data in chunks:
+            flownode = self._callable(data)
+        if self._purge_nodes:
+            _purge_flownode(flownode)
+        return flownode
+
+    def fork(self):
+        return self.__class__(self._callable.fork(),
+                              purge_nodes=self._purge_nodes)
+
+
+class _FlowNodeJoinCallable(FlowTaskCallable):
+    """Callable which joins two trained flownodes.
+
+    This is used by ParallelFlow.train to join the trained flownodes
+    pairwise on the scheduler, instead of joining them all in the master.
+    """
+
+    def __call__(self, flownodes):
+        """Join the second flownode into the first one and return it.
+
+        flownodes -- Pair of trained flownodes.
+        """
+        flownode, other_flownode = flownodes
+        flownode.join(other_flownode)
+        return flownode
+
+
 class TrainResultContainer(ResultContainer):
     """Container for parallel nodes.
 
@@ -122,7 +187,7 @@ def get_results(self):
         flownode = self._flownode
         self._flownode = None
         return [flownode,]
-    
+
 
 ### Execute task classes ###
 
@@ -144,6 +209,10 @@ def __init__(self, flownode, nodenr=None, purge_nodes=True):
         self._flownode = flownode
         self._nodenr = nodenr
         self._purge_nodes = purge_nodes
+        # stored, so that the parallel extension is only required for the
+        # fork if the flownode uses an execute fork (e.g. when the tasks are
+        # executed in a thread while the extension is not active)
+        self._use_execute_fork = flownode.use_execute_fork()
         super(FlowExecuteCallable, self).__init__()
 
     def __call__(self, x):
@@ -155,7 +224,7 @@ def __call__(self, x):
         in the result tuple.
         """
         y = self._flownode.execute(x, nodenr=self._nodenr)
-        if self._flownode.use_execute_fork():
+        if self._use_execute_fork:
             if self._purge_nodes:
                 _purge_flownode(self._flownode)
             return (y, self._flownode)
@@ -163,6 +232,9 @@ def __call__(self, x):
             return (y, None)
 
     def fork(self):
+        if not self._use_execute_fork:
+            # the callable is not modified by the execution
+            return self
         return self.__class__(self._flownode.fork(), nodenr=self._nodenr,
                               purge_nodes=self._purge_nodes)
     
@@ -257,11 +329,13 @@ def __init__(self, flow, verbose=False, **kwargs):
         self._next_task = None  # buffer for next task
         self._train_callable_class = None
         self._execute_callable_class = None
+        self._chunks_per_task = 1
 
     @mdp.with_extension("parallel")
     def train(self, data_iterables, scheduler=None,
               train_callable_class=None,
               overwrite_result_container=True,
+              chunks_per_task=1, tree_join=False,
               **kwargs):
         """Train all trainable nodes in the flow.
 
@@ -290,8 +364,21 @@ def train(self, data_iterables, scheduler=None,
             provided. By default NodeResultContainer is used.
         overwrite_result_container -- If set to True (default value) then
             the result container in the scheduler will be overwritten with an
-            instance of NodeResultContainer (unless it is already an instance
-            of NodeResultContainer). This improves the memory efficiency.
+            instance of TrainResultContainer (unless it already is one). This
+            improves the memory efficiency. With tree_join a
+            ListResultContainer is used instead.
+        chunks_per_task -- Number of data chunks that are put into a single
+            task (default value is 1). A single fork is trained on all the
+            chunks of a task, so only one trained node per task has to be
+            returned and joined. Setting this to the number of chunks divided
+            by the number of workers results in one trained node per worker.
+        tree_join -- If True then the trained nodes are joined pairwise in a
+            balanced tree by join tasks on the scheduler, so that only the
+            final node is joined in the master (default value is False).
+            For n trained nodes there are about log2(n) rounds of join tasks,
+            in return the trained nodes have to be sent to the workers again.
+            This is only useful if a join takes longer than the transport of
+            a node, e.g. for large covariance matrices and a ThreadScheduler.
         """
         # Warning: If this method is updated you also have to update train
         #          in ParallelCheckpointFlow.
@@ -306,12 +393,17 @@ def train(self, data_iterables, scheduler=None,
         else:
             if train_callable_class is None:
                 train_callable_class = FlowTrainCallable
+            if tree_join:
+                result_container_class = ListResultContainer
+            else:
+                result_container_class = TrainResultContainer
             schedulers = None
             # do parallel training
             try:
                 self.setup_parallel_training(
                                     data_iterables,
                                     train_callable_class=train_callable_class,
+                                    chunks_per_task=chunks_per_task,
                                     **kwargs)
                 # prepare scheduler
                 if not isinstance(scheduler, Scheduler):
@@ -338,9 +430,9 @@ def train(self, data_iterables, scheduler=None,
                 # check that the scheduler is compatible
                 if ((scheduler is not None) and
                     overwrite_result_container and
-                    (not isinstance(scheduler.result_container,
-                                    TrainResultContainer))):
-                    scheduler.result_container = TrainResultContainer()
+                    (type(scheduler.result_container) is not
+                     result_container_class)):
+                    scheduler.result_container = result_container_class()
                 ## train all nodes
                 while self.is_parallel_training:
                     while self.task_available:
@@ -352,6 +444,8 @@ def train(self, data_iterables, scheduler=None,
                                "for the current training phase.")
                         raise Exception(err)
                     else:
+                        if tree_join:
+                            results = self._tree_join(results, scheduler)
                         self.use_results(results)
                     # check if we have to switch to next scheduler
                     if ((schedulers is not None) and
@@ -366,9 +460,10 @@ def train(self, data_iterables, scheduler=None,
                         # check that the scheduler is compatible
                         if ((scheduler is not None) and
                             overwrite_result_container and
-                            (not isinstance(scheduler.result_container,
-                                            TrainResultContainer))):
-                            scheduler.result_container = TrainResultContainer()
+                            (type(scheduler.result_container) is not
+                             result_container_class)):
+                            scheduler.result_container = \
+                                                    result_container_class()
             finally:
                 # reset iterable references, which cannot be pickled
                 self._train_data_iterables = None
@@ -376,8 +471,26 @@ def train(self, data_iterables, scheduler=None,
                 if (schedulers is not None) and (scheduler is not None):
                     scheduler.shutdown()
 
+    def _tree_join(self, flownodes, scheduler):
+        """Join the trained flownodes pairwise with tasks on the scheduler.
+
+        Returns a list containing the single joined flownode.
+        """
+        join_callable = _FlowNodeJoinCallable()
+        while len(flownodes) > 1:
+            for i_pair in range(len(flownodes) // 2):
+                scheduler.add_task(flownodes[2*i_pair:2*i_pair+2],
+                                   join_callable)
+            if len(flownodes) % 2:
+                # the odd flownode is joined in the next round
+                flownodes = scheduler.get_results() + flownodes[-1:]
+            else:
+                flownodes = scheduler.get_results()
+        return flownodes
+
     def setup_parallel_training(self, data_iterables,
-                                train_callable_class=FlowTrainCallable):
+                                train_callable_class=FlowTrainCallable,
+                                chunks_per_task=1):
         """Prepare the flow for handing out tasks to do the training.
 
         After calling setup_parallel_training one has to pick up the
@@ -396,10 +509,17 @@ def setup_parallel_training(self, data_iterables,
             scheduler. By specifying your own class you can implement data
             transformations before the data is actually fed into the flow
             (e.g. from 8 bit image to 64 bit double precision).
+        chunks_per_task -- Number of data chunks that are trained by a single
+            task (default value is 1). In this case the task data is a list
+            of data chunks.
         """
         if self.is_parallel_training:
             err = "Parallel training is already underway."
             raise ParallelFlowException(err)
+        if chunks_per_task < 1:
+            err = "chunks_per_task must be at least 1."
+            raise ParallelFlowException(err)
+        self._chunks_per_task = chunks_per_task
         self._train_callable_class = train_callable_class
         self._train_data_iterables = self._train_check_iterables(data_iterables)
         self._i_train_node = 0
@@ -448,8 +568,13 @@ def _next_train_phase(self):
                 # Only first task contains the new callable (enable caching).
                 # A fork is not required here, since the callable is always
                 # forked in the scheduler.
-                self._next_task = (task_data_chunk,
-                                   self._train_callable_class(self._flownode))
+                if self._chunks_per_task > 1:
+                    task_callable = _ChunkGroupCallable(
+                                self._train_callable_class(self._flownode,
+                                                           purge_nodes=False))
+                else:
+                    task_callable = self._train_callable_class(self._flownode)
+                self._next_task = (task_data_chunk, task_callable)
                 break
             except NotForkableParallelException, exception:
                 if self.verbose:
@@ -508,8 +633,18 @@ def _post_stop_training_hook(self):
     def _create_train_task(self):
         """Create and return a single training task without callable.
 
-        Returns None if data iterator end is reached.
+        Returns None if data iterator end is reached. If chunks_per_task is
+        larger than one then the task data is a list of data chunks.
         """
+        if self._chunks_per_task > 1:
+            chunks = []
+            for data in self._train_data_iterator:
+                chunks.append(data)
+                if len(chunks) == self._chunks_per_task:
+                    break
+            if not chunks:
+                return None
+            return (chunks, None)
         try:
             return (self._train_data_iterator.next(), None)
         except StopIteration:
@@ -580,6 +715,99 @@ def execute(self, iterable, nodenr=None, scheduler=None,
             self._exec_data_iterator = None
         return result
 
+    def execute_iter(self, iterable, nodenr=None, scheduler=None,
+                     execute_callable_class=None, max_open_tasks=None):
+        """Return an iterator over the execution results for the data chunks.
+
+        The results are returned in the order of the data chunks, each one
+        as soon as it is available (and all the previous ones have been
+        returned). So unlike execute the complete output is never held in
+        memory at once. The arguments are the same as for execute, except for:
+
+        max_open_tasks -- Maximum number of tasks which have been submitted to
+            the scheduler but whose result has not yet been returned. This
+            limits the memory used for results that arrive out of order.
+            The default value is None, in which case twice the number of CPU
+            cores is used.
+
+        During the iteration the result container of the scheduler is
+        temporarily replaced with a StreamResultContainer, the original one
+        is restored at the end.
+        """
+        if self.is_parallel_training:
+            raise ParallelFlowException("Parallel training is underway.")
+        if scheduler is None:
+            if execute_callable_class is not None:
+                err = ("A execute_callable_class was specified but no "
+                       "scheduler was given, so the execute_callable_class "
+                       "has no effect.")
+                raise ParallelFlowException(err)
+            return self._local_execute_iter(iterable, nodenr)
+        if execute_callable_class is None:
+            execute_callable_class = FlowExecuteCallable
+        if max_open_tasks is None:
+            max_open_tasks = 2 * cpu_count()
+        elif max_open_tasks < 1:
+            err = "max_open_tasks must be at least 1."
+            raise ParallelFlowException(err)
+        return self._parallel_execute_iter(iterable, nodenr, scheduler,
+                                           execute_callable_class,
+                                           max_open_tasks)
+
+    def _local_execute_iter(self, iterable, nodenr):
+        """Generator for execute_iter without a scheduler."""
+        if isinstance(iterable, n.ndarray):
+            iterable = [iterable]
+        for x in iterable:
+            yield super(ParallelFlow, self).execute(x, nodenr)
+
+    def _parallel_execute_iter(self, iterable, nodenr, scheduler,
+                               execute_callable_class, max_open_tasks):
+        """Generator for execute_iter with a scheduler.
+
+        The parallel extension is only active while the tasks are created and
+        the forked flownodes are joined, not while the consumer is processing
+        a result.
+        """
+        result_container = scheduler.result_container
+        stream_container = StreamResultContainer()
+        # scheduler task indices of the tasks with pending results
+        open_task_indices = collections.deque()
+        scheduler.result_container = stream_container
+        try:
+            with mdp.extension("parallel"):
+                self._flownode = FlowNode(mdp.Flow(self.flow))
+                self.setup_parallel_execution(
+                                iterable,
+                                nodenr=nodenr,
+                                execute_callable_class=execute_callable_class)
+            while self.task_available or open_task_indices:
+                with mdp.extension("parallel"):
+                    while (self.task_available and
+                           len(open_task_indices) < max_open_tasks):
+                        task = self.get_task()
+                        open_task_indices.append(scheduler.add_task(*task))
+                y, forked_flownode = stream_container.get_result(
+                                                open_task_indices.popleft())
+                if forked_flownode is not None:
+                    with mdp.extension("parallel"):
+                        self._flownode.join(forked_flownode)
+                yield y
+        finally:
+            # reset remaining iterator references, which cannot be pickled
+            self._exec_data_iterator = None
+            self._next_task = None
+            # wait for abandoned tasks, so that no result ends up in the
+            # original result container
+            for task_index in open_task_indices:
+                try:
+                    stream_container.get_result(task_index)
+                except Exception, exception:
+                    wrnstr = ("Abandoned execute task %d failed: %r" %
+                              (task_index, exception))
+                    _warnings.warn(wrnstr, mdp.MDPWarning)
+            scheduler.result_container = result_container
+
     def setup_parallel_execution(self, iterable, nodenr=None,
                                  execute_callable_class=FlowExecuteCallable):
         """Prepare the flow for handing out tasks to do the execution.
@@ -164,9 +164,7 @@ def _join_covariance(cov, forked_cov):
         cov -- Instance of CovarianceMatrix, to which the forked_cov instance
             is aded in-place.
         """
-        cov._cov_mtx += forked_cov._cov_mtx
-        cov._avg += forked_cov._avg
-        cov._tlen += forked_cov._tlen
+        cov.merge(forked_cov)
         
 
 ## MDP parallel node implementations ##
@@ -245,8 +243,26 @@ def _fork(self):
         return self._default_fork()
 
     def _join(self, forked_node):
-        if (self.data_hist is not None) and (forked_node.data_hist is not None):
-            self.data_hist = numx.concatenate([self.data_hist,
-                                            forked_node.data_hist])
-        elif forked_node.data_hist != None:
+        n_samples = self._n_hist_samples
+        n_forked_samples = forked_node._n_hist_samples
+        self._n_hist_samples = n_samples + n_forked_samples
+        if forked_node.data_hist is None:
+            return
+        if self.data_hist is None:
             self.data_hist = forked_node.data_hist
+            return
+        hist = self.data_hist
+        forked_hist = forked_node.data_hist
+        if (self.hist_size is not None and
+            len(hist) + len(forked_hist) > self.hist_size):
+            # weighted reservoir merge, the number of samples taken from
+            # each history follows the number of samples seen by the nodes,
+            # so the result is again a uniform sample of all the data
+            n_keep = numx.random.hypergeometric(n_samples, n_forked_samples,
+                                                self.hist_size)
+            n_keep = max(min(n_keep, len(hist)),
+                         self.hist_size - len(forked_hist))
+            hist = hist[numx.random.permutation(len(hist))[:n_keep]]
+            forked_hist = forked_hist[numx.random.permutation(
+                            len(forked_hist))[:self.hist_size - n_keep]]
+        self.data_hist = numx.concatenate([hist, forked_hist])
@@ -2,12 +2,6 @@
 Process based scheduler for distribution across multiple CPU cores.
 """
 
-# TODO: use a queue instead of sleep?
-#    http://docs.python.org/library/queue.html
-
-# TODO: use shared memory for data numpy arrays, but this also requires the
-#    use of multiprocessing since the ctype objects can't be pickled
-
 # TODO: only return result when get_results is called,
 #    this sends a special request to the processes to send their data,
 #    we would have to add support for this to the callable,
@@ -23,8 +17,9 @@
 import cPickle as pickle
 import threading
 import subprocess
-import time
+import tempfile
 import traceback
+import Queue
 import warnings
 
 if __name__ == "__main__":
@@ -41,14 +36,130 @@
 import mdp
 from mdp.parallel import Scheduler, cpu_count
 
-SLEEP_TIME = 0.1  # time spend sleeping when waiting for a free process
+# directory for POSIX shared memory, used for the shared memory transport
+SHARED_MEMORY_DIR = "/dev/shm"
+# default minimal size in bytes for an array to be moved to shared memory
+SHARED_MEMORY_THRESHOLD = 2**16
+SHARED_MEMORY_PREFIX = "mdp_shm_"
+
+
+class _SharedArrayTransport(object):
+    """Pickle helper which moves large arrays into memory mapped files.
+
+    Arrays with at least threshold bytes are written to a file in the given
+    directory (ideally a tmpfs like /dev/shm) and only a small descriptor is
+    pickled in their place. The receiving side maps the file and gets an
+    ndarray view on it, so the array data never passes through the pipe.
+
+    This works anywhere in the pickled object graph, e.g., for the data
+    chunks, for the results and for arrays stored in nodes.
+    """
+
+    def __init__(self, dirname, threshold=SHARED_MEMORY_THRESHOLD):
+        """Initialize the transport.
+
+        dirname -- Directory in which the array files are created.
+        threshold -- Minimal size in bytes for an array to be transported
+            via a file, smaller arrays are simply pickled.
+        """
+        self.dirname = dirname
+        self.threshold = threshold
+        # files created by the last call of dump
+        self.filenames = []
+
+    def dump(self, obj, file):
+        """Pickle obj to file, large arrays are stored in shared files.
+
+        The names of the created files are stored in the filenames attribute,
+        the caller is responsible for their removal.
+        """
+        self.filenames = []
+        pickler = pickle.Pickler(file, -1)
+        pickler.persistent_id = self._persistent_id
+        pickler.dump(obj)
+        file.flush()
+
+    def load(self, file, remove_files=False):
+        """Unpickle an object from file and map the shared arrays.
+
+        remove_files -- If True then the shared files are removed right after
+            they have been mapped (the mapping itself stays valid on POSIX
+            systems, elsewhere the data is copied before the removal).
+        """
+        unpickler = pickle.Unpickler(file)
+        if remove_files:
+            unpickler.persistent_load = self._persistent_load_remove
+        else:
+            unpickler.persistent_load = self._persistent_load
+        return unpickler.load()
+
+    def _persistent_id(self, obj):
+        """Store large arrays in a file and return the descriptor."""
+        if (type(obj) is not mdp.numx.ndarray or obj.dtype.hasobject or
+            obj.nbytes < max(self.threshold, 1)):
+            return None
+        if obj.flags.f_contiguous and not obj.flags.c_contiguous:
+            order = "F"
+        else:
+            order = "C"
+        fd, filename = tempfile.mkstemp(prefix=SHARED_MEMORY_PREFIX,
+                                        dir=self.dirname)
+        os.close(fd)
+        self.filenames.append(filename)
+        shared = mdp.numx.memmap(filename, dtype=obj.dtype, mode="w+",
+                                 shape=obj.shape, order=order)
+        shared[...] = obj
+        shared.flush()
+        del shared
+        return ("ndarray", filename, obj.dtype, obj.shape, order)
+
+    def _persistent_load(self, pid):
+        """Map the array described by pid.
+
+        The copy-on-write mode allows in-place modifications of the array
+        without touching the file.
+        """
+        _, filename, dtype, shape, order = pid
+        shared = mdp.numx.memmap(filename, dtype=dtype, mode="c",
+                                 shape=shape, order=order)
+        # keep the memmap alive as the base, but return a normal array
+        return shared.view(mdp.numx.ndarray)
+
+    def _persistent_load_remove(self, pid):
+        """Map the array described by pid and remove the file."""
+        array = self._persistent_load(pid)
+        if os.name != "posix":
+            # open files can not be removed, so make a copy
+            array = array.copy()
+        _remove_shared_files([pid[1]])
+        return array
+
+
+def _remove_shared_files(filenames):
+    """Remove the given shared files, ignoring files that are already gone."""
+    for filename in filenames:
+        try:
+            os.remove(filename)
+        except OSError:
+            pass
+
+
+class ProcessSchedulerException(mdp.MDPException):
+    """Exception for a task which has failed in a slave process."""
+    pass
 
 
 class ProcessScheduler(Scheduler):
     """Scheduler that distributes the task to multiple processes.
 
     The subprocess module is used to start the requested number of processes.
-    The execution of each task is internally managed by dedicated thread.
+    Each process is served by a dedicated long-lived dispatcher thread, which
+    takes the next task from a queue as soon as its process is free.
+
+    By default the tasks and results are pickled through the pipes of the
+    processes. With shared_memory=True all large arrays (in the data, the
+    callable or the result) are instead placed in memory mapped files and only
+    small descriptors are sent through the pipes.
 
     This scheduler should work on all platforms (at least on Linux,
     Windows XP and Vista).
@@ -56,7 +167,8 @@ class ProcessScheduler(Scheduler):
 
     def __init__(self, result_container=None, verbose=False, n_processes=1,
                  source_paths=None, python_executable=None,
-                 cache_callable=True):
+                 cache_callable=True, shared_memory=False,
+                 shared_memory_threshold=SHARED_MEMORY_THRESHOLD):
         """Initialize the scheduler and start the slave processes.
 
         result_container -- ResultContainer used to store the results.
@@ -76,6 +188,13 @@ def __init__(self, result_container=None, verbose=False, n_processes=1,
             is True). Disabling caching can reduce the memory usage, but will
             generally be less efficient since the task_callable has to be
             pickled each time.
+        shared_memory -- If True then arrays with at least
+            shared_memory_threshold bytes are transported via memory mapped
+            files instead of the pipes (default is False). The files are
+            created in /dev/shm if available, otherwise in the default
+            temporary directory.
+        shared_memory_threshold -- Minimal array size in bytes for the
+            shared memory transport.
         """
         super(ProcessScheduler, self).__init__(
                                         result_container=result_container,
@@ -85,6 +204,20 @@ def __init__(self, result_container=None, verbose=False, n_processes=1,
         else:
             self._n_processes = cpu_count()
         self._cache_callable = cache_callable
+        if shared_memory:
+            if os.path.isdir(SHARED_MEMORY_DIR):
+                shared_root = SHARED_MEMORY_DIR
+            else:
+                shared_root = None
+            self._shared_dir = mdp.utils.TemporaryDirectory(
+                                        prefix=SHARED_MEMORY_PREFIX,
+                                        dir=shared_root)
+            self._transport = _SharedArrayTransport(
+                                        dirname=self._shared_dir.name,
+                                        threshold=shared_memory_threshold)
+        else:
+            self._shared_dir = None
+            self._transport = None
         if python_executable is None:
             python_executable = sys.executable
         # get the location of this module to start the processes
@@ -96,101 +229,171 @@ def __init__(self, result_container=None, verbose=False, n_processes=1,
         #    copy_reg.
         process_args = [python_executable, "-u", module_file]
         process_args.append(str(self._cache_callable))
+        if self._transport is not None:
+            process_args.append(self._transport.dirname)
+            process_args.append(str(self._transport.threshold))
+        else:
+            process_args += ["None", "0"]
         if isinstance(source_paths, str):
             source_paths = [source_paths]
         if source_paths is None:
             source_paths = sys.path
         process_args += source_paths
-        # list of processes not in use, start the processes now
-        self._free_processes = [subprocess.Popen(args=process_args,
-                                                 stdout=subprocess.PIPE,
-                                                 stdin=subprocess.PIPE)
-                                for _ in range(self._n_processes)]
-        # tag each process with its cached callable task_index,
-        # this is compared with _last_callable_index to check if the cached
-        # task_callable is still up to date
-        for process in self._free_processes:
-            process._callable_index = -1
+        self._process_args = process_args
+        # start the processes now
+        self._processes = [self._start_process()
+                           for _ in range(self._n_processes)]
+        # tasks waiting for a free process, the size limit makes add_task
+        # block when all processes are busy
+        self._task_queue = Queue.Queue(maxsize=1)
+        self._dispatcher_threads = []
+        for process in self._processes:
+            thread = threading.Thread(target=self._dispatcher_thread,
+                                      args=(process,))
+            thread.setDaemon(True)
+            thread.start()
+            self._dispatcher_threads.append(thread)
         if self.verbose:
             print ("scheduler initialized with %d processes" %
                    self._n_processes)
 
+    def _start_process(self):
+        """Start and return a new slave process."""
+        return subprocess.Popen(args=self._process_args,
+                                stdout=subprocess.PIPE,
+                                stdin=subprocess.PIPE)
+
+    def _restart_process(self, process):
+        """Replace a broken slave process with a new one and return it.
+
+        The old process is killed, since it might be in an undefined state
+        (e.g., with a half-read pipe).
+        """
+        try:
+            process.kill()
+        except OSError:
+            # the process is already gone
+            pass
+        process.wait()
+        new_process = self._start_process()
+        self._lock.acquire()
+        self._processes[self._processes.index(process)] = new_process
+        self._lock.release()
+        if self.verbose:
+            print "restarted a slave process"
+        return new_process
+
     def _shutdown(self):
         """Shut down the slave processes.
 
         If a process is still running a task then an exception is raised.
         """
         self._lock.acquire()
-        if len(self._free_processes) < self._n_processes:
+        if self._n_open_tasks:
+            self._lock.release()
             raise Exception("some slave process is still working")
-        for process in self._free_processes:
-            pickle.dump("EXIT", process.stdin)
-            process.stdin.flush()
         self._lock.release()
+        # the dispatcher threads tell their processes to exit
+        for _ in self._dispatcher_threads:
+            self._task_queue.put(None)
+        for thread in self._dispatcher_threads:
+            thread.join()
+        if self._shared_dir is not None:
+            self._shared_dir.cleanup()
         if self.verbose:
             print "scheduler shutdown"
 
     def _process_task(self, data, task_callable, task_index):
-        """Add a task, if possible without blocking.
+        """Queue the task for the next free process.
 
-        It blocks when the system is not able to start a new thread
-        or when the processes are all in use.
+        It blocks when the processes are all in use and another task is
+        already waiting.
         """
-        task_started = False
-        while not task_started:
-            if not len(self._free_processes):
-                # release lock for other threads and wait
-                self._lock.release()
-                time.sleep(SLEEP_TIME)
-                self._lock.acquire()
-            else:
-                try:
-                    process = self._free_processes.pop()
-                    self._lock.release()
-                    thread = threading.Thread(target=self._task_thread,
-                                              args=(process, data,
-                                                    task_callable, task_index))
-                    thread.start()
-                    task_started = True
-                except thread.error:
-                    if self.verbose:
-                        print ("unable to create new task thread,"
-                               " waiting 2 seconds...")
-                    time.sleep(2)
-
-    def _task_thread(self, process, data, task_callable, task_index):
-        """Thread function which cares for a single task.
-
-        The task is pushed to the process via stdin, then we wait for the
-        result on stdout, pass the result to the result container, free
-        the process and exit.
+        # the index of the callable is used by the dispatcher thread to check
+        # if the callable cached in its process is still up to date
+        callable_index = self._last_callable_index
+        self._lock.release()
+        self._task_queue.put((data, task_callable, task_index,
+                              callable_index))
+
+    def _dispatcher_thread(self, process):
+        """Thread function which serves a single process.
+
+        The next task is taken from the queue and pushed to the process via
+        stdin, then we wait for the result on stdout and pass the result to
+        the result container. A None task makes the process and this thread
+        exit.
+
+        If a task fails then the error is stored, so that it is raised by
+        get_results, and the process is replaced with a new one.
         """
-        try:
-            if self._cache_callable:
-                # check if the cached callable is up to date
-                if process._callable_index < self._last_callable_index:
-                    process._callable_index = self._last_callable_index
+        # index of the callable that is cached in the process
+        process_callable_index = -1
+        while True:
+            task = self._task_queue.get()
+            if task is None:
+                try:
+                    pickle.dump("EXIT", process.stdin, protocol=-1)
+                    process.stdin.flush()
+                except (IOError, OSError):
+                    # the process is already gone
+                    pass
+                return
+            data, task_callable, task_index, callable_index = task
+            del task
+            transport = None
+            try:
+                if self._cache_callable:
+                    # check if the cached callable is up to date
+                    if process_callable_index < callable_index:
+                        process_callable_index = callable_index
+                    else:
+                        task_callable = None
+                # push the task to the process
+                task = (data, task_callable, task_index)
+                if self._transport is not None:
+                    # use a separate transport per task for the file
+                    # bookkeeping
+                    transport = _SharedArrayTransport(
+                                        dirname=self._transport.dirname,
+                                        threshold=self._transport.threshold)
+                    transport.dump(task, process.stdin)
+                    # wait for result to arrive
+                    result = transport.load(process.stdout,
+                                            remove_files=True)
+                    # the process is done with the task data
+                    _remove_shared_files(transport.filenames)
                 else:
-                    task_callable = None
-            # push the task to the process
-            pickle.dump((data, task_callable, task_index),
-                        process.stdin, protocol=-1)
-            process.stdin.flush()
-            # wait for result to arrive
-            result = pickle.load(process.stdout)
-        except:
-            traceback.print_exc()
-            self._free_processes.append(process)
-            sys.exit("failed to execute task %d in process:" % task_index)
-        # store the result and clean up
-        self._store_result(result, task_index)
-        self._free_processes.append(process)
+                    pickle.dump(task, process.stdin, protocol=-1)
+                    process.stdin.flush()
+                    # wait for result to arrive
+                    result = pickle.load(process.stdout)
+                del task, data, task_callable
+            except:
+                # the exception itself is printed by the process
+                err = ("failed to execute task %d in process (%s: %s)" %
+                       (task_index, sys.exc_info()[0].__name__,
+                        sys.exc_info()[1]))
+                exception = ProcessSchedulerException(err)
+                self._store_error((ProcessSchedulerException, exception, None),
+                                  task_index)
+                if transport is not None:
+                    _remove_shared_files(transport.filenames)
+                process = self._restart_process(process)
+                # the new process has no cached callable
+                process_callable_index = -1
+                continue
+            self._store_result(result, task_index)
+            del result
 
 
-def _process_run(cache_callable=True):
+def _process_run(cache_callable=True, shared_dir=None,
+                 shared_threshold=SHARED_MEMORY_THRESHOLD):
     """Run this function in a worker process to receive and run tasks.
 
     It waits for tasks on stdin, and sends the results back via stdout.
+    If shared_dir is given then large arrays are exchanged via memory mapped
+    files in this directory (see _SharedArrayTransport).
     """
     # use sys.stdout only for pickled objects, everything else goes to stderr
     # NOTE: .buffer is the binary mode interface for stdin and out in py3k
@@ -204,13 +407,21 @@ def _process_run(cache_callable=True):
         pickle_in = sys.stdin
 
     sys.stdout = sys.stderr
+    if shared_dir is not None:
+        transport = _SharedArrayTransport(dirname=shared_dir,
+                                          threshold=shared_threshold)
+    else:
+        transport = None
     exit_loop = False
     last_callable = None  # cached callable
     while not exit_loop:
         task = None
         try:
             # wait for task to arrive
-            task = pickle.load(pickle_in)
+            if transport is not None:
+                task = transport.load(pickle_in)
+            else:
+                task = pickle.load(pickle_in)
             if task == "EXIT":
                 exit_loop = True
             else:
@@ -230,8 +441,16 @@ def _process_run(cache_callable=True):
                     task_callable.setup_environment()
                 result = task_callable(data)
                 del task_callable  # free memory
-                pickle.dump(result, pickle_out, protocol=-1)
-                pickle_out.flush()
+                # release the mapping of shared data as early as possible
+                del data
+                task = (None, None, task_index)
+                if transport is not None:
+                    # the scheduler takes care of removing the result files
+                    transport.dump(result, pickle_out)
+                else:
+                    pickle.dump(result, pickle_out, protocol=-1)
+                    pickle_out.flush()
+                del result
         except Exception, exception:
             # return the exception instead of the result
             if task is None:
@@ -246,11 +465,17 @@ def _process_run(cache_callable=True):
 if __name__ == "__main__":
     # first argument is cache_callable flag
     cache_callable = sys.argv[1] == "True"
+    # second and third argument are the shared memory directory and threshold
+    shared_dir = sys.argv[2]
+    if shared_dir == "None":
+        shared_dir = None
+    shared_threshold = int(sys.argv[3])
 
-    if len(sys.argv) > 2:
+    if len(sys.argv) > 4:
         # remaining arguments are code paths,
         # put them in front so that they take precedence over PYTHONPATH
-        new_paths = [sys_arg for sys_arg in sys.argv[2:]
+        new_paths = [sys_arg for sys_arg in sys.argv[4:]
                      if sys_arg not in sys.path]
         sys.path = new_paths + sys.path
-    _process_run(cache_callable=cache_callable)
+    _process_run(cache_callable=cache_callable, shared_dir=shared_dir,
+                 shared_threshold=shared_threshold)
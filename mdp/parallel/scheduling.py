@@ -19,6 +19,17 @@ def add_result(self, result_data, task_index):
         """Store a result in the container."""
         pass
 
+    def add_error(self, exc_info, task_index):
+        """Store the error of a failed task.
+
+        exc_info -- Exception info tuple as returned by sys.exc_info().
+
+        Return True if the container takes care of raising the error,
+        otherwise (default) the error is raised by the get_results method
+        of the scheduler.
+        """
+        return False
+
     def get_results(self):
         """Return results and reset container."""
         pass
@@ -73,6 +84,64 @@ def get_results(self):
         return list(zip(*results))[0]
 
 
+class StreamResultContainer(ResultContainer):
+    """Result container which hands out single results as soon as they arrive.
+
+    This allows the processing of results while other tasks are still
+    running, e.g., to stream the results in the original task order.
+    """
+
+    def __init__(self):
+        super(StreamResultContainer, self).__init__()
+        self._results = {}
+        # exception info tuples of the failed tasks
+        self._errors = {}
+        self._condition = threading.Condition()
+
+    def add_result(self, result, task_index):
+        """Store a result in the container and notify waiting threads."""
+        self._condition.acquire()
+        self._results[task_index] = result
+        self._condition.notifyAll()
+        self._condition.release()
+
+    def add_error(self, exc_info, task_index):
+        """Store the error, it is raised by get_result for this task."""
+        self._condition.acquire()
+        self._errors[task_index] = exc_info
+        self._condition.notifyAll()
+        self._condition.release()
+        return True
+
+    def get_result(self, task_index):
+        """Return the result for the given task index and remove it.
+
+        This method blocks until the result is available. If the task has
+        failed then its exception is raised instead.
+        """
+        self._condition.acquire()
+        try:
+            while (task_index not in self._results and
+                   task_index not in self._errors):
+                self._condition.wait()
+            if task_index in self._errors:
+                exc_info = self._errors.pop(task_index)
+                raise exc_info[0], exc_info[1], exc_info[2]
+            return self._results.pop(task_index)
+        finally:
+            self._condition.release()
+
+    def get_results(self):
+        """Return all the stored results in task order and reset this
+        container."""
+        self._condition.acquire()
+        results = self._results
+        self._results = {}
+        self._errors = {}
+        self._condition.release()
+        return [results[task_index] for task_index in sorted(results)]
+
+
 class TaskCallable(object):
     """Abstract base class for task callables.
 
@@ -211,6 +280,10 @@ def __init__(self, result_container=None, verbose=False):
         # count the number of submitted tasks, also used for the task index
         self._task_counter = 0
         self._lock = threading.Lock()
+        # exception info tuples of failed tasks, raised by get_results
+        self._task_errors = []
+        # notified when the last open task has finished
+        self._tasks_finished = threading.Condition(self._lock)
         self._last_callable = None  # last callable is stored
         # task index of the _last_callable, can be *.5 if updated between tasks
         self._last_callable_index = -1.0
@@ -241,6 +314,9 @@ def add_task(self, data, task_callable=None):
         The callable together with the data constitutes the task. This method
         blocks if there are no free recources to store or process the task
         (e.g. if no free worker processes are available).
+
+        The task index is returned, which is also used for the result in the
+        result container.
         """
         self._lock.acquire()
         if task_callable is None:
@@ -261,6 +337,7 @@ def add_task(self, data, task_callable=None):
             self._last_callable = task_callable
             self._last_callable_index = self.task_counter
         self._process_task(data, task_callable, task_index)
+        return task_index
 
     def set_task_callable(self, task_callable):
         """Set the callable that will be used if no task_callable is given.
@@ -294,22 +371,53 @@ def _store_result(self, result, task_index):
             else:
                 print "    task failed"
         self._n_open_tasks -= 1
+        if self._n_open_tasks == 0:
+            self._tasks_finished.notifyAll()
+        self._lock.release()
+
+    def _store_error(self, exc_info, task_index):
+        """Store the error of a failed task instead of a result.
+
+        exc_info -- Exception info tuple as returned by sys.exc_info().
+        task_index -- Task index of the failed task.
+
+        The task is no longer counted as open. Unless the result container
+        handles the error itself it is raised by get_results.
+        """
+        self._lock.acquire()
+        if not self.result_container.add_error(exc_info, task_index):
+            self._task_errors.append(exc_info)
+        if self.verbose:
+            print "    task no. %d failed" % task_index
+        self._n_open_tasks -= 1
+        if self._n_open_tasks == 0:
+            self._tasks_finished.notifyAll()
         self._lock.release()
 
     def get_results(self):
         """Get the accumulated results from the result container.
 
-        This method blocks if there are open tasks.
+        This method blocks if there are open tasks. If any of the tasks has
+        failed then the exception of the first failed task is raised (the
+        result container is reset nevertheless).
         """
-        while True:
-            self._lock.acquire()
-            if self._n_open_tasks == 0:
-                results = self.result_container.get_results()
-                self._lock.release()
-                return results
-            else:
-                self._lock.release()
-                time.sleep(1)
+        self._lock.acquire()
+        while self._n_open_tasks:
+            self._tasks_finished.wait()
+        task_errors = self._task_errors
+        self._task_errors = []
+        try:
+            results = self.result_container.get_results()
+        except Exception:
+            # the container might not cope with the missing results
+            if not task_errors:
+                raise
+        finally:
+            self._lock.release()
+        if task_errors:
+            exc_info = task_errors[0]
+            raise exc_info[0], exc_info[1], exc_info[2]
+        return results
 
     def shutdown(self):
         """Controlled shutdown of the scheduler.
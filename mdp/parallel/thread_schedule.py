@@ -3,13 +3,12 @@
 """
 
 import threading
-import time
+import sys
+import Queue
 import cPickle as pickle
 
 from scheduling import Scheduler, cpu_count
 
-SLEEP_TIME = 0.1  # time spend sleeping when waiting for a thread to finish
-
 
 class ThreadScheduler(Scheduler):
     """Thread based scheduler.
@@ -18,6 +17,13 @@ class ThreadScheduler(Scheduler):
     numpy calculations (or some other external non-blocking C code) or for IO,
     but can be more efficient than ProcessScheduler because of the
     shared memory.
+
+    The tasks are processed by a fixed pool of worker threads. If the
+    callables are copied then each worker thread keeps its own copy of the
+    callable, which is only renewed when a new callable is provided, and
+    forks this copy for every task. The worker threads share the extensions
+    of the caller, so the extensions required by the callable have to stay
+    active until the results are retrieved.
     """
 
     def __init__(self, result_container=None, verbose=False, n_threads=1,
@@ -32,6 +38,8 @@ def __init__(self, result_container=None, verbose=False, n_threads=1,
         copy_callable -- Use deep copies of the task callable in the threads.
             This is for example required if some nodes are stateful during
             execution (e.g., a BiNode using the coroutine decorator).
+            Every thread copies a callable only once and uses forks of this
+            copy for all the tasks with the same callable.
         """
         super(ThreadScheduler, self).__init__(
                                             result_container=result_container,
@@ -40,45 +48,86 @@ def __init__(self, result_container=None, verbose=False, n_threads=1,
             self._n_threads = n_threads
         else:
             self._n_threads = cpu_count()
-        self._n_active_threads = 0
         self.copy_callable = copy_callable
+        # tasks waiting for a free thread, the size limit makes add_task
+        # block when all threads are busy
+        self._task_queue = Queue.Queue(maxsize=1)
+        self._worker_threads = []
+        for _ in range(self._n_threads):
+            thread = threading.Thread(target=self._worker_thread)
+            thread.setDaemon(True)
+            thread.start()
+            self._worker_threads.append(thread)
+
+    def _shutdown(self):
+        """Stop the worker threads.
+
+        If a thread is still running a task then an exception is raised.
+        """
+        self._lock.acquire()
+        if self._n_open_tasks:
+            self._lock.release()
+            raise Exception("some thread is still working")
+        self._lock.release()
+        for _ in self._worker_threads:
+            self._task_queue.put(None)
+        for thread in self._worker_threads:
+            thread.join()
+        self._worker_threads = []
+        if self.verbose:
+            print "scheduler shutdown"
 
     def _process_task(self, data, task_callable, task_index):
-        """Add a task, if possible without blocking.
+        """Queue the task for the next free thread.
 
-        It blocks when the maximum number of threads is reached (given by
-        n_threads) or when the system is not able to start a new thread.
+        This blocks when the threads are all in use and another task is
+        already waiting. If the callable is not copied then it is forked
+        here, before add_task returns (e.g. while the extensions required by
+        the fork are still active).
         """
-        task_started = False
-        while not task_started:
-            if self._n_active_threads >= self._n_threads:
-                # release lock for other threads and wait
-                self._lock.release()
-                time.sleep(SLEEP_TIME)
-                self._lock.acquire()
-            else:
-                self._lock.release()
+        # the index of the callable is used by the worker thread to check
+        # if its copy of the callable is still up to date
+        callable_index = self._last_callable_index
+        self._lock.release()
+        if not self.copy_callable:
+            try:
                 task_callable = task_callable.fork()
-                if self.copy_callable:
-                    # create a deep copy of the task_callable,
-                    # since it might not be thread safe 
-                    # (but the fork is still required)
-                    as_str = pickle.dumps(task_callable, -1)
-                    task_callable = pickle.loads(as_str)
-                try:
-                    thread = threading.Thread(target=self._task_thread,
-                                              args=(data, task_callable,
-                                                    task_index))
-                    thread.start()
-                    task_started = True
-                except Exception:
-                    if self.verbose:
-                        print ("unable to create new thread,"
-                               " waiting 2 seconds...")
-                    time.sleep(2)
+            except:
+                self._store_error(sys.exc_info(), task_index)
+                return
+        self._task_queue.put((data, task_callable, task_index,
+                              callable_index))
+
+    def _worker_thread(self):
+        """Thread function which processes the queued tasks.
 
-    def _task_thread(self, data, task_callable, task_index):
-        """Thread function which processes a single task."""
-        result = task_callable(data)
-        self._store_result(result, task_index)
-        self._n_active_threads -= 1
+        A None task makes the thread exit. If a task fails then its exception
+        is stored, so that it is raised by get_results.
+        """
+        # copy of the callable and its index
+        thread_callable = None
+        thread_callable_index = -1
+        while True:
+            task = self._task_queue.get()
+            if task is None:
+                return
+            data, task_callable, task_index, callable_index = task
+            del task
+            try:
+                if self.copy_callable:
+                    if thread_callable_index != callable_index:
+                        # create a deep copy of the task_callable,
+                        # since it might not be thread safe
+                        thread_callable = None
+                        as_str = pickle.dumps(task_callable, -1)
+                        thread_callable = pickle.loads(as_str)
+                        thread_callable_index = callable_index
+                        del as_str
+                    task_callable = thread_callable.fork()
+                result = task_callable(data)
+                del data, task_callable
+            except:
+                self._store_error(sys.exc_info(), task_index)
+                continue
+            self._store_result(result, task_index)
+            del result
@@ -567,6 +567,34 @@ def _stop_training(self, *args, **kwargs):
     def _execute(self, x):
         return x
 
+    def _execute_out(self, x, out):
+        """Like `_execute`, but store the result in the array `out`.
+
+        Subclasses can overwrite this method to compute the result directly
+        in `out`, which avoids allocating a new output array (see
+        `Node.execute_out`). `out` is C contiguous, has the node dtype and
+        the shape ``(x.shape[0], self.output_dim)``. Return `out`.
+
+        Note that this method is only used if it is defined in the same class
+        as `_execute`, so subclasses which change `_execute` automatically
+        fall back to the default.
+        """
+        out[...] = self._execute(x)
+        return out
+
+    def _get_affine_map(self):
+        """Return the tuple (A, b) with ``_execute(x) == mult(x, A) + b``.
+
+        Subclasses with an affine execution (for arbitrary data) can
+        overwrite this method, which is for example used by
+        `mdp.Flow.fuse_affine_nodes`. b is a 1d array. The default
+        implementation returns None (i.e., the node is not affine).
+
+        Like `_execute_out` this method is only used if it is defined in the
+        same class as `_execute`.
+        """
+        return None
+
     def _inverse(self, x):
         if self.is_invertible():
             return x
@@ -643,6 +671,73 @@ def execute(self, x, *args, **kwargs):
         self._pre_execution_checks(x)
         return self._execute(self._refcast(x), *args, **kwargs)
 
+    def _get_execute_class(self):
+        """Return the class which defines the `_execute` method of the node.
+
+        Returns None if `execute` is overwritten, i.e. if `execute` does more
+        than the standard checks before calling `_execute`.
+        """
+        for cls in self.__class__.__mro__:
+            members = cls.__dict__
+            # wrappers created by the NodeMetaclass are fine
+            if (cls is not Node and 'execute' in members and
+                not hasattr(members['execute'], '_undecorated_')):
+                return None
+            if '_execute' in members:
+                return cls
+        return None
+
+    def _has_execute_method(self, name):
+        """Return True if the method name is defined along with `_execute`.
+
+        This is used for optional methods which must be consistent with
+        `_execute` (like `_execute_out`).
+        """
+        cls = self._get_execute_class()
+        return cls is not None and cls is not Node and name in cls.__dict__
+
+    def has_execute_out(self):
+        """Return True if the node can compute its output in-place.
+
+        This is the case if `_execute_out` is implemented together with
+        `_execute` and `execute` is not overwritten.
+        """
+        return self._has_execute_method('_execute_out')
+
+    def get_affine_map(self):
+        """Return the tuple (A, b) if the node execution is affine.
+
+        In this case the output of `execute` is ``mult(x, A) + b``. If the
+        node is not affine or has not finished training then None is
+        returned.
+        """
+        if self.is_training() or not self._has_execute_method(
+                                                        '_get_affine_map'):
+            return None
+        return self._get_affine_map()
+
+    def execute_out(self, x, out):
+        """Process the data contained in `x` and store the result in `out`.
+
+        `out` must be an array with the shape ``(x.shape[0], output_dim)``.
+        If the node supports it (see `has_execute_out`) the result is
+        directly computed in `out`, otherwise it is computed with `execute`
+        and copied to `out`. Returns `out`.
+        """
+        if not self.has_execute_out():
+            out[...] = self.execute(x)
+            return out
+        self._pre_execution_checks(x)
+        if out.shape != (x.shape[0], self.output_dim):
+            error_str = ("out has shape %s, should be %s" %
+                         (str(out.shape), str((x.shape[0], self.output_dim))))
+            raise NodeException(error_str)
+        if out.dtype != self.dtype or not out.flags.c_contiguous:
+            out[...] = self._execute_out(self._refcast(x),
+                                         numx.empty(out.shape, self.dtype))
+            return out
+        return self._execute_out(self._refcast(x), out)
+
     def inverse(self, y, *args, **kwargs):
         """Invert `y`.
 
@@ -748,9 +843,20 @@ def VariadicCumulator(*fields):
     The data is accessible in the attributes given with the VariadicCumulator's
     constructor after the beginning of the `Node._stop_training` phase.
     ``self.tlen`` contains the number of data points collected.
+
+    By default the data is kept in memory. If the ``memmap_dir`` attribute
+    is set to a directory (on the class or on the instance, before the
+    training starts), then the data chunks are instead appended to files in
+    this directory and the fields are memory mapped arrays on these files
+    (see `mdp.utils.MemmapArrayBuffer`). This allows collecting more data than
+    fits into memory and avoids the concatenation copy at the end.
     """
 
     class Cumulator(Node):
+
+        # directory for the memory mapped data files, None for in-memory
+        memmap_dir = None
+
         def __init__(self, *args, **kwargs):
             super(Cumulator, self).__init__(*args, **kwargs)
             self._cumulator_fields = fields
@@ -762,16 +868,26 @@ def __init__(self, *args, **kwargs):
             self.tlen = 0
 
         def _train(self, *args):
-            """Collect all input data in a list."""
+            """Collect all input data in a list (or a memmap buffer)."""
             self.tlen += args[0].shape[0]
             for field, data in zip(self._cumulator_fields, args):
-                getattr(self, field).append(data)
+                collected = getattr(self, field)
+                if (self.memmap_dir is not None and
+                    isinstance(collected, list) and not collected):
+                    collected = mdp.utils.MemmapArrayBuffer(
+                                            dirname=self.memmap_dir,
+                                            prefix="mdp_cumulator_")
+                    setattr(self, field, collected)
+                collected.append(data)
 
         def _stop_training(self, *args, **kwargs):
             """Concatenate the collected data in a single array."""
             for field in self._cumulator_fields:
                 data = getattr(self, field)
-                setattr(self, field, numx.concatenate(data, 0))
+                if isinstance(data, mdp.utils.MemmapArrayBuffer):
+                    setattr(self, field, data.get_array())
+                else:
+                    setattr(self, field, numx.concatenate(data, 0))
 
     return Cumulator
 
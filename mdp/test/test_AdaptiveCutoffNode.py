@@ -35,3 +35,46 @@ def test_AdaptiveCutoffNode_randomdata():
     node.stop_training()
     node.execute(x)
 
+
+def test_AdaptiveCutoffNode_sketch():
+    """Test AdaptiveCutoffNode with the quantile sketch."""
+    # the sketch is exact as long as it is not compacted
+    x1 = numx.array([[0.1, 0.3], [0.3, 0.5], [0.5, 0.7]])
+    x2 = numx.array([[0.4, 0.6], [0.2, 0.4], [0.6, 0.2]])
+    node = mdp.nodes.AdaptiveCutoffNode(lower_cutoff_fraction= 0.2,
+                                        upper_cutoff_fraction=0.4,
+                                        sketch_size=100)
+    node.train(x1)
+    node.train(x2)
+    node.stop_training()
+    assert node.data_hist is None
+    assert numx.all(node.lower_bounds == numx.array([0.2, 0.3]))
+    assert numx.all(node.upper_bounds == numx.array([0.4, 0.5]))
+    # on a long stream the bounds must be close to the exact quantiles
+    node = mdp.nodes.AdaptiveCutoffNode(lower_cutoff_fraction= 0.1,
+                                        upper_cutoff_fraction=0.05,
+                                        sketch_size=200)
+    for i in range(50):
+        node.train(numx_rand.random((1000, 3)))
+    node.stop_training()
+    assert_array_almost_equal(node.lower_bounds, [0.1]*3, 1)
+    assert_array_almost_equal(node.upper_bounds, [0.95]*3, 1)
+
+def test_AdaptiveCutoffNode_old_pickle():
+    """Test an AdaptiveCutoffNode pickled by an older version in training."""
+    x1 = numx.array([[0.1, 0.3], [0.3, 0.5], [0.5, 0.7]])
+    x2 = numx.array([[0.4, 0.6], [0.2, 0.4], [0.6, 0.2]])
+    node = mdp.nodes.AdaptiveCutoffNode(lower_cutoff_fraction= 0.2,
+                                        upper_cutoff_fraction=0.4)
+    node.train(x1)
+    node = node.copy()
+    # the old node stores the history directly in data_hist
+    node.data_hist = node.data_hist.copy()
+    for attr in ["hist_size", "_hist_buffer", "_hist_view",
+                 "_n_hist_samples", "sketch_size", "_sketch"]:
+        del node.__dict__[attr]
+    node.train(x2)
+    node.stop_training()
+    assert numx.all(numx.concatenate([x1, x2]) == node.data_hist)
+    assert numx.all(node.lower_bounds == numx.array([0.2, 0.3]))
+    assert numx.all(node.upper_bounds == numx.array([0.4, 0.5]))
@@ -83,6 +83,24 @@ def testConvolution2DNode_fft():
         
         assert_array_almost_equal(y_fft, y_lin, 6)
 
+@requires_signal
+def testConvolution2DNode_fft_blocks():
+    # blocks of images and threads must give the same result
+    x = numx.random.random((11,12,10))
+    filters = numx.random.random((4,5,3))
+    for mode in ['valid', 'same', 'full']:
+        node_lin = mdp.nodes.Convolution2DNode(filters, approach='linear',
+                                               mode=mode, output_2d=False)
+        y_lin = node_lin.execute(x)
+        for n_threads in [1, 3]:
+            node_fft = mdp.nodes.Convolution2DNode(filters, approach='fft',
+                                                   mode=mode, output_2d=False,
+                                                   n_threads=n_threads)
+            node_fft.max_block_elements = 1
+            assert_array_almost_equal(node_fft.execute(x), y_lin, 6)
+            # the second call uses the cached filter spectra
+            assert_array_almost_equal(node_fft.execute(x), y_lin, 6)
+
 @requires_signal
 def testConvolution2DNode_in_Flow():
     filters = numx.empty((3,1,1))
@@ -53,3 +53,52 @@ def test_GrowingNeuralGasNode():
     assert_equal(dists[0],1.)
     assert_array_equal(nodes[0].data.pos,numx.asarray([2,0]))
 
+
+def test_GrowingNeuralGasNode_graph_view():
+    data = uniform((2000, 2))
+    gng = mdp.nodes.GrowingNeuralGasNode(max_age=20, lambda_=50)
+    gng.train(data)
+    gng.stop_training()
+    graph = gng.graph
+    # the graph is cached until the node changes
+    assert gng.graph is graph
+    assert len(graph.nodes) == gng.get_nodes_position().shape[0]
+    assert_array_equal(numx.array([node.data.pos for node in graph.nodes]),
+                       gng.get_nodes_position())
+    for node in graph.nodes:
+        assert node.degree() > 0
+    for edge in graph.edges:
+        assert 0 <= edge.data.age <= gng.max_age
+    # the copy recreates the graph from the arrays
+    gng_copy = gng.copy()
+    assert len(gng_copy.graph.edges) == len(graph.edges)
+    assert_array_equal(gng_copy.get_nodes_position(),
+                       gng.get_nodes_position())
+
+def test_GrowingNeuralGasNode_old_pickle():
+    data = uniform((2000, 2))
+    gng = mdp.nodes.GrowingNeuralGasNode(max_age=20, lambda_=50)
+    gng.train(data)
+    graph = gng.graph
+    # a node pickled by an older version stores the graph
+    state = gng.__dict__.copy()
+    for attr in ("_n_nodes", "_positions", "_errors", "_ages", "_heads",
+                 "_graph"):
+        del state[attr]
+    state["graph"] = graph
+    old_gng = mdp.nodes.GrowingNeuralGasNode.__new__(
+                                            mdp.nodes.GrowingNeuralGasNode)
+    old_gng.__dict__.update(state)
+    gng_copy = old_gng.copy()
+    n = gng._n_nodes
+    assert_array_equal(gng_copy.get_nodes_position(),
+                       gng.get_nodes_position())
+    assert_array_equal(gng_copy._errors[:n], gng._errors[:n])
+    assert_array_equal(gng_copy._ages[:n, :n], gng._ages[:n, :n])
+    # the edge directions are only defined for existing edges
+    edges = gng._ages[:n, :n] >= 0
+    assert_array_equal(gng_copy._heads[:n, :n][edges],
+                       gng._heads[:n, :n][edges])
+    # the training can be continued
+    gng_copy.train(data)
+    gng_copy.stop_training()
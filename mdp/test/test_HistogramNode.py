@@ -18,3 +18,28 @@ def testHistogramNode_fraction():
     node.train(x1)
     node.train(x2)
     assert len(node.data_hist) < 1000
+
+def testHistogramNode_chunks():
+    """Test that the history buffer stores all chunks."""
+    node = mdp.nodes.HistogramNode()
+    x = numx_rand.random((100, 3))
+    for i in range(0, 100, 7):
+        node.train(x[i:i+7])
+    assert_array_equal(node.data_hist, x)
+    node.stop_training()
+    assert_array_equal(node.data_hist, x)
+
+def testHistogramNode_size():
+    """Test HistogramNode with a limited history size."""
+    node = mdp.nodes.HistogramNode(hist_size=50)
+    x = numx.arange(3000.).reshape((1000, 3))
+    for i in range(0, 1000, 30):
+        node.train(x[i:i+30])
+    node.stop_training()
+    assert node.data_hist.shape == (50, 3)
+    # the stored samples must be distinct rows of the data
+    assert len(set(node.data_hist[:,0])) == 50
+    assert numx.all(node.data_hist[:,0] % 3 == 0)
+    assert numx.all(node.data_hist[:,1] == node.data_hist[:,0] + 1)
+    # the samples must come from the whole data and not only the start
+    assert node.data_hist[:,0].max() > 1500
@@ -53,3 +53,17 @@ def testOneDimensionalHitParade():
     assert_array_equal(ind_maxima,[110,103,0,10,50])
     assert_array_equal(minima,[-3.1,-3,-1.5,-1.4,-1.3])
     assert_array_equal(ind_minima,[123,130,1,11,51])
+
+def testOneDimensionalHitParade_blocks():
+    # the result must not depend on the candidate block size
+    signal = (uniform(5000)-0.5)*2
+    results = []
+    for block_size in [1, 7, 512]:
+        hit = mdp.nodes._OneDimensionalHitParade(10, 3)
+        hit.block_size = block_size
+        hit.update((signal[:2500], numx.arange(2500)))
+        hit.update((signal[2500:], numx.arange(2500, 5000)))
+        results.append(hit.get_maxima() + hit.get_minima())
+    for result in results[1:]:
+        for array, ref_array in zip(result, results[0]):
+            assert_array_equal(array, ref_array)
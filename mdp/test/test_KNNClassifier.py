@@ -52,3 +52,45 @@ def distr(size): return normal(0, 1., size=(size)) * std_
     node.train(x, classes)
     classification = node.label(x)
     assert_array_equal(classes, classification)
+
+def testKNNClassifier_algorithms():
+    x = uniform((500, 3))
+    classes = (x[:, 0] > 0.5).astype('i') + 2 * (x[:, 1] > 0.5)
+    xq = uniform((300, 3))
+    labels = []
+    for algorithm in ["brute", "auto", "kdtree"]:
+        try:
+            node = mdp.nodes.KNNClassifier(k=5, algorithm=algorithm)
+        except mdp.NodeException:
+            # scipy.spatial is not available
+            continue
+        node.train(x, classes)
+        labels.append(node.label(xq))
+    for labels_ in labels[1:]:
+        assert_array_equal(labels[0], labels_)
+
+def testKNNClassifier_blocks():
+    x = uniform((50, 2))
+    classes = (x[:, 0] > 0.5).astype('i')
+    node = mdp.nodes.KNNClassifier(k=3, algorithm="brute")
+    node.train(x, classes)
+    labels = node.label(x)
+    # force a very small block size
+    node.max_block_elements = 120
+    assert_array_equal(node.label(x), labels)
+    # k larger than the number of samples
+    node = mdp.nodes.KNNClassifier(k=100, algorithm="brute")
+    node.train(x, classes)
+    assert len(node.label(x)) == 50
+
+def testKNNClassifier_old_pickle():
+    x = uniform((50, 2))
+    classes = (x[:, 0] > 0.5).astype('i')
+    node = mdp.nodes.KNNClassifier(k=3)
+    node.train(x, classes)
+    labels = node.label(x)
+    node = node.copy()
+    # a node pickled by an older version does not have these attributes
+    for attr in ("algorithm", "_kdtree", "_sample_square_norms"):
+        del node.__dict__[attr]
+    assert_array_equal(node.label(x), labels)
@@ -232,3 +232,14 @@ def test_PCANode_no_eigenvalues_left():
     pca.train(mat)
     py.test.raises(mdp.NodeException, 'pca.stop_training()')
     
+
+def test_PCANode_execute_out_dtype():
+    x = uniform((100, 4))
+    pca = mdp.nodes.PCANode(dtype='f')
+    pca.train(x)
+    pca.stop_training()
+    # the projection matrix might have been set with a different dtype
+    pca.v = pca.v.astype('d')
+    out = numx.empty((100, 4), dtype='f')
+    pca.execute_out(x, out)
+    assert_array_almost_equal(out, pca.execute(x), 5)
@@ -48,3 +48,21 @@ def test_expansion():
             des = hardcoded_expansion(inp, degree)
             exp = expand.execute(inp)
             assert_array_almost_equal(exp, des, decimal)
+
+def test_expansion_blocks():
+    # the result must not depend on the block size and must be C contiguous
+    inp = uniform((100, 4))
+    des = hardcoded_expansion(inp, 3)
+    expand = mdp.nodes.PolynomialExpansionNode(degree=3)
+    expand.min_block_rows = 7
+    expand.block_elements = 1
+    exp = expand.execute(inp)
+    assert exp.flags.c_contiguous
+    assert_array_almost_equal(exp, des, decimal)
+
+def test_expansion_float32():
+    inp = uniform((20, 3)).astype('f')
+    expand = mdp.nodes.PolynomialExpansionNode(degree=2, dtype='f')
+    exp = expand.execute(inp)
+    assert exp.dtype == numx.dtype('f')
+    assert_array_almost_equal(exp, hardcoded_expansion(inp, 2), 5)
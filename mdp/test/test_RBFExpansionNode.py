@@ -54,3 +54,53 @@ def scalar_to_covs(x, n):
     rbf = mdp.nodes.RBFExpansionNode(centers, sizes)
     check_mn_cov(rbf, sizes)
 
+
+def testRBFExpansionNode_blocks():
+    # compare with the direct computation for each center
+    dim, n = 3, 7
+    centers = numx_rand.random((n, dim))
+    x = numx_rand.random((50, dim))
+    sizes = [0.3 + numx_rand.random(n)*0.2,
+             [mdp.utils.symrand(numx.array([0.2, 0.3, 0.4]))
+              for i in xrange(n)]]
+    for size in sizes:
+        rbf = mdp.nodes.RBFExpansionNode(centers, size)
+        expected = numx.zeros((50, n))
+        for i in xrange(n):
+            dist = x - centers[i]
+            if numx.ndim(size[i]) == 0:
+                tmp = (dist**2).sum(axis=1) / size[i]
+            else:
+                tmp = (dist*mult(dist, utils.inv(size[i]))).sum(axis=1)
+            expected[:, i] = numx.exp(-0.5*tmp)
+        assert_array_almost_equal(rbf.execute(x), expected)
+        # the result must not depend on the block size
+        rbf.block_elements = 1
+        assert_array_almost_equal(rbf.execute(x), expected)
+
+def testRBFExpansionNode_diagonal_first_size():
+    # the first covariance matrix is diagonal, the second is not
+    dim = 3
+    centers = numx_rand.random((2, dim))
+    x = numx_rand.random((50, dim))
+    sizes = [numx.diag([0.2, 0.3, 0.4]),
+             mdp.utils.symrand(numx.array([0.2, 0.3, 0.4]))]
+    rbf = mdp.nodes.RBFExpansionNode(centers, sizes)
+    expected = numx.zeros((50, 2))
+    for i in xrange(2):
+        dist = x - centers[i]
+        tmp = (dist*mult(dist, utils.inv(sizes[i]))).sum(axis=1)
+        expected[:, i] = numx.exp(-0.5*tmp)
+    assert_array_almost_equal(rbf.execute(x), expected)
+
+def testRBFExpansionNode_old_pickle():
+    dim = 3
+    centers = numx_rand.random((2, dim))
+    x = numx_rand.random((50, dim))
+    sizes = [mdp.utils.symrand(numx.array([0.2, 0.3, 0.4]))
+             for i in xrange(2)]
+    rbf = mdp.nodes.RBFExpansionNode(centers, sizes)
+    y = rbf.execute(x)
+    # a node pickled by an older version does not have these attributes
+    del rbf.__dict__["_whitening"], rbf.__dict__["_centers_white"]
+    assert_array_almost_equal(rbf.copy().execute(x), y)
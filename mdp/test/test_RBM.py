@@ -305,3 +305,51 @@ def test_RBMWithLabelsNode():
     nzeros = idxzeros.sum()
     point5 = numx.zeros((nzeros, L)) + 0.5
     assert_array_almost_equal(pl[idxzeros], point5, 2)
+
+def test_RBM_minibatch():
+    # mini-batches give the same result as separate calls to train
+    I, J = 6, 3
+    v = (numx_rand.random((100, I)) > 0.5).astype('d')
+    numx_rand.seed(1)
+    bm1 = mdp.nodes.RBMNode(J, I)
+    bm1.train(v, batch_size=20, momentum=0.5)
+    numx_rand.seed(1)
+    bm2 = mdp.nodes.RBMNode(J, I)
+    for start in xrange(0, 100, 20):
+        bm2.train(v[start:start+20], momentum=0.5)
+    assert_array_almost_equal(bm1.w, bm2.w, 10)
+    assert_array_almost_equal(bm1.bv, bm2.bv, 10)
+    assert_array_almost_equal(bm1.bh, bm2.bh, 10)
+
+def test_RBM_persistent():
+    I, J = 6, 3
+    v = (numx_rand.random((100, I)) > 0.5).astype('float32')
+    bm = mdp.nodes.RBMNode(J, I, dtype='float32')
+    for k in xrange(5):
+        bm.train(v, batch_size=30, persistent=True, n_updates=2)
+    # the number of chains is given by the first mini-batch
+    assert bm._chain.shape == (30, J)
+    assert 0 <= bm._train_err <= 100 * I
+    # the training buffers are not copied
+    assert bm._buffers
+    assert bm.copy()._buffers == {}
+    bm.stop_training()
+    assert bm.w.dtype == numx.dtype('float32')
+    assert bm.execute(v).dtype == numx.dtype('float32')
+
+def test_RBM_old_pickle():
+    I, J = 6, 3
+    v = (numx_rand.random((100, I)) > 0.5).astype('d')
+    numx_rand.seed(1)
+    bm1 = mdp.nodes.RBMNode(J, I)
+    bm1.train(v)
+    bm1.train(v, persistent=True)
+    numx_rand.seed(1)
+    bm2 = mdp.nodes.RBMNode(J, I)
+    bm2.train(v)
+    bm2 = bm2.copy()
+    # a node pickled by an older version does not have these attributes
+    del bm2.__dict__["_buffers"], bm2.__dict__["_chain"]
+    bm2.train(v, persistent=True)
+    assert_array_almost_equal(bm1.w, bm2.w, 10)
+    assert_array_almost_equal(bm1.bh, bm2.bh, 10)
@@ -148,3 +148,37 @@ def testSFANode_derivative_bug2D_eigen():
                                         overwrite=False)
     assert_array_almost_equal(eigvalues, sfa.d, decimal)
     assert_array_almost_equal(eigvectors, sfa.sf, decimal)
+
+def testSFANode_streaming():
+    x = mdp.numx_rand.random((200, 4))
+    for include_last_sample in [True, False]:
+        ref_node = mdp.nodes.SFANode(include_last_sample=include_last_sample)
+        ref_node.train(x)
+        ref_node.stop_training(debug=True)
+        node = mdp.nodes.SFANode(include_last_sample=include_last_sample,
+                                 streaming=True)
+        node.train(x[:2])
+        # single samples are possible after the first chunk
+        node.train(x[2:3])
+        for i in range(3, 200, 9):
+            node.train(x[i:i+9])
+        node.stop_training(debug=True)
+        assert_array_almost_equal(node.dcov_mtx, ref_node.dcov_mtx, 10)
+        assert_array_almost_equal(node.cov_mtx, ref_node.cov_mtx, 10)
+        assert node.dtlen == ref_node.dtlen
+        assert node.tlen == ref_node.tlen
+
+def testSFANode_old_pickle():
+    x = mdp.numx_rand.random((200, 4))
+    ref_node = mdp.nodes.SFANode()
+    ref_node.train(x[:100])
+    ref_node.train(x[100:])
+    ref_node.stop_training()
+    node = mdp.nodes.SFANode()
+    node.train(x[:100])
+    # a node pickled by an older version does not have these attributes
+    del node.__dict__["_streaming"], node.__dict__["_last_sample"]
+    node = node.copy()
+    node.train(x[100:])
+    node.stop_training()
+    assert_array_almost_equal(node.sf, ref_node.sf, 10)
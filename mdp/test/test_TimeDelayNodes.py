@@ -77,3 +77,61 @@ def test_TimeDelayNodes():
 
     assert_array_equal(real_res, slider_res)
 
+
+def test_TimeDelayNode_streaming():
+    x = numx_rand.random((50, 3))
+    ref = TimeDelayNode(time_frames=4, gap=3).execute(x)
+    node = TimeDelayNode(time_frames=4, gap=3, streaming=True)
+    res = numx.concatenate([node.execute(x[i:i+7]) for i in range(0, 50, 7)])
+    assert_array_equal(ref, res)
+    # the sliding window node accepts chunks of any size
+    slider = TimeDelaySlidingWindowNode(time_frames=4, gap=3)
+    res = numx.concatenate([slider.execute(x[:1]), slider.execute(x[1:20]),
+                            slider.execute(x[20:])])
+    assert_array_equal(ref, res)
+    # after a reset the stream starts again with zeros
+    node.reset_stream()
+    assert_array_equal(node.execute(x), ref)
+
+def test_TimeFramesNode_streaming():
+    x = numx_rand.random((50, 3))
+    ref = mdp.nodes.TimeFramesNode(time_frames=3, gap=4).execute(x)
+    node = mdp.nodes.TimeFramesNode(time_frames=3, gap=4, streaming=True)
+    chunks = [node.execute(x[i:i+5]) for i in range(0, 50, 5)]
+    # not enough samples for the first time frame
+    assert chunks[0].shape == (0, 9)
+    assert_array_equal(ref, numx.concatenate(chunks))
+
+def test_streaming_flow_reset():
+    x = numx_rand.random((50, 3))
+    node = TimeDelayNode(time_frames=2, gap=1, streaming=True)
+    flow = mdp.Flow([node, mdp.nodes.PCANode()])
+    flow.train([None, [x[i:i+10] for i in range(0, 50, 10)]])
+    # the history of the training data does not reach the execution
+    ref = TimeDelayNode(time_frames=2, gap=1).execute(x)
+    assert_array_equal(node.execute(x), ref)
+
+def test_TimeDelayNodes_old_pickle():
+    x = numx_rand.random((20, 3))
+    ref = TimeDelayNode(time_frames=3, gap=2).execute(x)
+    # nodes pickled by an older version do not have these attributes
+    for node in [TimeDelayNode(time_frames=3, gap=2),
+                 mdp.nodes.TimeFramesNode(time_frames=3, gap=2)]:
+        y = node.execute(x)
+        for attr in ("strided_view", "streaming", "_history"):
+            del node.__dict__[attr]
+        assert_array_equal(node.copy().execute(x), y)
+    # the old sliding window node stores the last gap+1 output rows
+    for n_done in [1, 2, 10]:
+        slider = TimeDelaySlidingWindowNode(time_frames=3, gap=2)
+        slider.execute(x[:n_done])
+        del slider.__dict__["streaming"], slider.__dict__["_history"]
+        sliding_wnd = numx.zeros((3, 9))
+        if n_done >= 3:
+            sliding_wnd[:] = ref[n_done-3:n_done]
+            slider.cur_idx, slider.slide = 2, True
+        else:
+            sliding_wnd[:n_done] = ref[:n_done]
+            slider.cur_idx, slider.slide = n_done, False
+        slider.sliding_wnd = sliding_wnd
+        assert_array_equal(slider.copy().execute(x[n_done:]), ref[n_done:])
@@ -24,3 +24,28 @@ def test_TimeFramesNode():
 
 def test_TimeFramesNodeBugInputDim():
     mdp.nodes.TimeFramesNode(time_frames=10, gap=1, input_dim=1)
+
+def test_TimeFramesNode_short_input():
+    # without a complete time frame the output is empty
+    node = mdp.nodes.TimeFramesNode(time_frames=4, gap=2)
+    y = node.execute(numx_rand.random((5, 3)))
+    assert y.shape == (0, 12)
+
+def test_TimeFramesNode_strided_view():
+    x = numx_rand.random((20, 3))
+    for gap in [1, 3]:
+        node = mdp.nodes.TimeFramesNode(4, gap=gap)
+        ref = node.execute(x)
+        assert ref.flags.writeable
+        assert not numx.may_share_memory(ref, x)
+        view_node = mdp.nodes.TimeFramesNode(4, gap=gap, strided_view=True)
+        y = view_node.execute(x)
+        assert_array_equal(y, ref)
+        if gap == 1:
+            assert not y.flags.writeable
+            assert numx.may_share_memory(y, x)
+    # a non contiguous input is copied
+    view_node = mdp.nodes.TimeFramesNode(4, strided_view=True)
+    y = view_node.execute(x[::2])
+    assert y.flags.writeable
+    assert_array_equal(y, mdp.nodes.TimeFramesNode(4).execute(x[::2]))
@@ -30,3 +30,18 @@ def _stop_training(self, *args, **kwargs):
     for i in range(NREP):
         ab.train(x[i], y[i])
     ab.stop_training()
+
+def test_VariadicCumulator_memmap():
+    ONELEN = 101
+    NREP = 7
+    x = [numx_rand.rand(ONELEN, 3) for _ in range(NREP)]
+    y = [numx_rand.rand(ONELEN, 2) for _ in range(NREP)]
+    ab = mdp.VariadicCumulator('a', 'b')()
+    ab.memmap_dir = py.test.mdp_tempdirname
+    for i in range(NREP):
+        ab.train(x[i], y[i])
+    assert isinstance(ab.a, mdp.utils.MemmapArrayBuffer)
+    ab.stop_training()
+    assert ab.tlen == ONELEN*NREP
+    assert_array_equal(ab.a, numx.concatenate(x, 0))
+    assert_array_equal(ab.b, numx.concatenate(y, 0))
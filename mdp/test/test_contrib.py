@@ -8,6 +8,10 @@
     "not mdp.config.has_caching",
     "This test requires the 'joblib' module.")
 
+requires_scipy = skip_on_condition(
+    "not mdp.numx_description == 'scipy'",
+    "This test requires 'scipy'")
+
 def _s_shape(theta):
     """
     returns x,y
@@ -158,6 +162,47 @@ def test_LLENode_outputdim_float_bug():
     err = _compare_neighbors(data, res, k)
     assert err.max() == 0
 
+def test_LLENode_old_pickle():
+    n, k = 50, 2
+    x, y, z, t = _s_shape_1D(n)
+    data = numx.asarray([x,y,z]).T
+    node = mdp.nodes.LLENode(k, output_dim=1)
+    node.train(data)
+    out = node.execute(data)
+    node = node.copy()
+    # a node pickled by an older version does not have these attributes
+    for attr in ("sparse", "_kdtree"):
+        del node.__dict__[attr]
+    assert_array_almost_equal(node.execute(data), out)
+
+def _assert_same_embedding(res, dense):
+    # the eigenvectors are only defined up to the sign
+    for i in xrange(dense.shape[1]):
+        corr = (mdp.utils.mult(res[:,i], dense[:,i]) /
+                numx.sqrt((res[:,i]**2).sum() * (dense[:,i]**2).sum()))
+        assert abs(corr) > 0.9999, 'correlation %f' % corr
+
+@requires_scipy
+def test_LLENode_sparse():
+    # the sparse computation must give the same embedding
+    nt, ny = 40, 15
+    n, k = nt*ny, 8
+    x, y, z, t = _s_shape_2D(nt, ny)
+    data = numx.asarray([x,y,z]).T
+    res = mdp.nodes.LLENode(k, output_dim=2, sparse=True)(data)
+    dense = mdp.nodes.LLENode(k, output_dim=2, sparse=False)(data)
+    _assert_same_embedding(res, dense)
+
+@requires_scipy
+def test_HLLENode_sparse():
+    nt, ny = 40, 15
+    n, k = nt*ny, 8
+    x, y, z, t = _s_shape_2D(nt, ny)
+    data = numx.asarray([x,y,z]).T
+    res = mdp.nodes.HLLENode(k, r=0.001, output_dim=2, sparse=True)(data)
+    dense = mdp.nodes.HLLENode(k, r=0.001, output_dim=2, sparse=False)(data)
+    _assert_same_embedding(res, dense)
+
 def test_HLLENode():
     # 1D S-shape in 3D
     n, k = 250, 4
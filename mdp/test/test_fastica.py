@@ -3,7 +3,8 @@
 uniform = mdp.numx_rand.random
 
 def pytest_generate_tests(metafunc):
-    _fastica_test_factory(metafunc)
+    if 'parms' in metafunc.funcargnames:
+        _fastica_test_factory(metafunc)
 
 def _fastica_test_factory(metafunc):
     # generate FastICANode testcases
@@ -62,3 +63,54 @@ def test_FastICA(parms):
             verify_ICANodeMatrices(ica2, rand_func=rand_func, vars=2)
         except exc:
             pass
+
+def test_FastICA_float32():
+    for approach in ['symm', 'defl']:
+        ica = mdp.nodes.FastICANode(approach=approach, dtype='float32')
+        verify_ICANode(ica, vars=2, prec=2)
+        assert ica.filters.dtype == numx.dtype('float32')
+
+def test_FastICA_blocks():
+    # the blocks of samples must not change the result
+    x = uniform((1000, 3))
+    guess = mdp.utils.random_rot(3)
+    for approach in ['symm', 'defl']:
+        ica = mdp.nodes.FastICANode(approach=approach, guess=guess)
+        ica.train(x)
+        ica.stop_training()
+        ica_blocks = mdp.nodes.FastICANode(approach=approach, guess=guess)
+        ica_blocks.block_elements = 7
+        ica_blocks.train(x)
+        ica_blocks.stop_training()
+        assert_array_almost_equal(ica.filters, ica_blocks.filters)
+
+def test_FastICA_old_pickle():
+    x = uniform((1000, 3))
+    guess = mdp.utils.random_rot(3)
+    ica = mdp.nodes.FastICANode(guess=guess)
+    ica.train(x)
+    ica.stop_training()
+    old_ica = mdp.nodes.FastICANode(guess=guess).copy()
+    # a node pickled by an older version does not have these attributes
+    del old_ica.__dict__["batch_size"], old_ica.__dict__["max_epochs"]
+    old_ica.train(x)
+    old_ica.stop_training()
+    assert_array_almost_equal(old_ica.filters, ica.filters)
+
+def test_FastICA_minibatch():
+    mat, mix, inp = get_random_mix(mat_dim=(8000, 2))
+    ica = mdp.nodes.FastICANode(approach='symm', batch_size=1000,
+                                max_epochs=10)
+    # one phase for the whitening and one for each epoch
+    assert ica.get_remaining_train_phase() == 11
+    flow = mdp.Flow([ica])
+    flow.train([[inp[i:i+2000] for i in range(0, 8000, 2000)]])
+    # the data is not accumulated
+    assert len(ica.data) == 0
+    act_mat = flow.execute(inp)
+    cov = utils.cov2((mat-mean(mat,axis=0))/std(mat,axis=0), act_mat)
+    maxima = numx.amax(abs(cov), axis=0)
+    assert_array_almost_equal(maxima, numx.ones(2), 2)
+    # symmetric approach is required
+    py.test.raises(mdp.NodeException,
+                   "mdp.nodes.FastICANode(approach='defl', batch_size=10)")
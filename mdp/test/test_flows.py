@@ -4,6 +4,7 @@
 import pickle
 import cPickle
 import os
+import threading
 from _tools import *
 
 uniform = numx_rand.random
@@ -341,3 +342,170 @@ def testgenerator():
         raise Exception('Expected mdp.FlowException')
     except mdp.FlowException:
         pass
+
+def testFlow_execute_buffers():
+    x = mdp.numx_rand.random((100, 5))
+    flow = mdp.Flow([mdp.nodes.PCANode(), mdp.nodes.SFANode(),
+                     mdp.nodes.CutoffNode(-1., 1.), mdp.nodes.IdentityNode()])
+    flow.train(x)
+    assert flow[0].has_execute_out()
+    assert flow[2].has_execute_out()
+    assert not flow[3].has_execute_out()
+    y = flow.execute(x)
+    flow.set_execute_buffers()
+    y1 = flow.execute(x)
+    y2 = flow.execute(x)
+    assert_array_almost_equal(y, y1, decimal=10)
+    assert_array_almost_equal(y, y2, decimal=10)
+    # the result must not be one of the reused arrays
+    assert y1 is not y2
+    assert not numx.may_share_memory(y1, y2)
+    out = numx.zeros_like(y)
+    y3 = flow.execute([x[:60], x[60:]], out=out)
+    assert y3 is out
+    assert_array_almost_equal(y, out, decimal=10)
+    flow.set_execute_buffers(False)
+    assert_array_almost_equal(y, flow.execute(x), decimal=10)
+
+def testFlow_execute_buffers_threads():
+    x = mdp.numx_rand.random((100, 5))
+    flow = mdp.Flow([mdp.nodes.PCANode(), mdp.nodes.SFANode(),
+                     mdp.nodes.CutoffNode(-1., 1.), mdp.nodes.IdentityNode()])
+    flow.train(x)
+    flow.set_execute_buffers()
+    xs = [x * (i+1) for i in range(4)]
+    refs = [flow.execute(x_i) for x_i in xs]
+    results = {}
+    def run(i):
+        for _ in range(50):
+            results[i] = flow.execute(xs[i])
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for i in range(4):
+        assert_array_almost_equal(results[i], refs[i], decimal=10)
+
+def testFlow_execute_buffers_copy():
+    x = mdp.numx_rand.random((100, 5))
+    flow = mdp.Flow([mdp.nodes.PCANode(), mdp.nodes.SFANode(),
+                     mdp.nodes.IdentityNode()])
+    flow.train(x)
+    flow.set_execute_buffers()
+    y = flow.execute(x)
+    # the buffers are not copied, but the copy still reuses its arrays
+    flow_copy = flow.copy()
+    assert flow_copy._execute_buffers is None
+    assert_array_almost_equal(flow_copy.execute(x), y, decimal=10)
+    assert flow_copy._execute_buffers.buffers
+
+def testFlow_train_cache():
+    x = mdp.numx_rand.random((100, 5))
+    class TestIterable:
+        def __init__(self):
+            self.used = 0
+        def __iter__(self):
+            self.used += 1
+            for i in range(0, 100, 25):
+                yield x[i:i+25]
+    def get_flow():
+        return mdp.Flow([BogusNode(), mdp.nodes.PCANode(),
+                         mdp.nodes.SFANode(), BogusMultiNode()])
+    ref_flow = get_flow()
+    iterable = TestIterable()
+    ref_flow.train([iterable]*4)
+    assert iterable.used == 4
+    # all chunks in memory, all in a file, and mixed
+    for max_bytes in [2**20, 0, 3000]:
+        flow = get_flow()
+        flow.set_train_cache(max_bytes=max_bytes,
+                             dirname=py.test.mdp_tempdirname)
+        iterable = TestIterable()
+        flow.train([iterable]*4)
+        assert iterable.used == 1
+        # one training call per chunk
+        assert flow[3].visited == [1,1,1,1,2,3,3,3,3,4]
+        assert flow[3].visited == ref_flow[3].visited
+        assert flow._train_cache is None
+        assert_array_almost_equal(flow.execute(x), ref_flow.execute(x))
+
+def testFlow_prefetch():
+    x = mdp.numx_rand.random((100, 5))
+    class TestIterable:
+        def __init__(self):
+            self.used = 0
+        def __iter__(self):
+            self.used += 1
+            for i in range(0, 100, 25):
+                yield x[i:i+25]
+    ref_flow = mdp.Flow([mdp.nodes.PCANode(), BogusMultiNode()])
+    ref_flow.train([TestIterable()]*2)
+    flow = mdp.Flow([mdp.nodes.PCANode(), BogusMultiNode()])
+    flow.set_prefetch(2)
+    iterable = TestIterable()
+    flow.train([iterable]*2)
+    # the iterable is restarted for each training phase
+    assert iterable.used == 3
+    # one training call per chunk
+    assert flow[1].visited == [1,1,1,1,2,3,3,3,3,4]
+    assert_array_almost_equal(flow.execute(TestIterable()),
+                              ref_flow.execute(x))
+    # exceptions are re-raised
+    def failing_generator():
+        yield x
+        raise ValueError("bogus error")
+    py.test.raises(ValueError, flow.execute, failing_generator())
+
+def testFlow_execute_out_wrong_size():
+    flow = _get_default_flow()
+    x = numx.ones((10, 3))
+    py.test.raises(mdp.FlowException, flow.execute, [x, x],
+                   out=numx.zeros((15, 3)))
+
+def testFlow_freeze():
+    x = mdp.numx_rand.random((100, 5))
+    flow = mdp.Flow([mdp.nodes.PCANode(), mdp.nodes.SFANode(),
+                     mdp.nodes.CutoffNode(-1., 1.)])
+    flow.train(x)
+    frozen = flow.freeze(x)
+    assert frozen.input_dim == 5
+    assert_array_almost_equal(frozen(x), flow(x), decimal=10)
+    assert_array_almost_equal(frozen([x[:3], x[3:]]), flow(x), decimal=10)
+    # float32 input is cast once
+    assert_array_almost_equal(frozen(x.astype('f')),
+                              flow(x.astype('f')), decimal=5)
+    py.test.raises(mdp.FlowException, frozen, x[:, :4])
+    copied = cPickle.loads(cPickle.dumps(frozen, -1))
+    assert_array_almost_equal(copied(x), flow(x), decimal=10)
+
+def testFlow_freeze_untrained():
+    flow = mdp.Flow([mdp.nodes.PCANode(), mdp.nodes.CutoffNode(-1., 1.)])
+    py.test.raises(mdp.FlowException, flow.freeze)
+
+def testFlow_fuse_affine_nodes():
+    x = mdp.numx_rand.random((100, 6))
+    switchboard = mdp.hinet.Switchboard(input_dim=3,
+                                        connections=[2, 0, 1, 1])
+    flow = mdp.Flow([mdp.nodes.WhiteningNode(), mdp.nodes.SFANode(),
+                     mdp.nodes.PCANode(output_dim=3), switchboard,
+                     mdp.nodes.CutoffNode(-1., 1.),
+                     mdp.nodes.NormalizeNode()])
+    flow.train(x)
+    y = flow.execute(x)
+    fused = flow.fuse_affine_nodes()
+    # the NormalizeNode is affine, but a single node is not replaced
+    assert len(fused) == 3
+    assert isinstance(fused[0], mdp.nodes.AffineNode)
+    assert fused[1] is flow[4]
+    assert fused[2] is flow[5]
+    assert_array_almost_equal(fused.execute(x), y, decimal=8)
+    assert not fused[0].is_invertible()
+
+def testFlow_fuse_affine_nodes_inverse():
+    x = mdp.numx_rand.random((100, 4))
+    flow = mdp.Flow([mdp.nodes.PCANode(), mdp.nodes.SFANode()])
+    flow.train(x)
+    fused = flow.fuse_affine_nodes(keep_nodes=True)
+    assert len(fused) == 1
+    assert_array_almost_equal(fused.inverse(fused.execute(x)), x, decimal=8)
@@ -14,6 +14,77 @@ def testCovarianceMatrix():
     assert_array_almost_equal(act_avg,des_avg, decimal)
     assert_array_almost_equal(act_cov,des_cov, decimal)
 
+def testCovarianceMatrixSymmetric():
+    mat,mix,inp = get_random_mix()
+    des_cov = numx.cov(inp, rowvar=0)
+    for stable in [False, True]:
+        act_cov = utils.CovarianceMatrix(stable=stable)
+        for chunk in numx.split(inp, 4):
+            act_cov.update(chunk)
+        act_cov,act_avg,act_tlen = act_cov.fix()
+        assert_array_equal(act_cov, act_cov.T)
+        assert_array_almost_equal(act_cov, des_cov, decimal)
+    act_cov = utils.DelayCovarianceMatrix(dt=0)
+    act_cov.update(inp)
+    act_cov,act_avg,act_avg_dt,act_tlen = act_cov.fix()
+    assert_array_equal(act_cov, act_cov.T)
+    assert_array_almost_equal(act_cov, des_cov, decimal)
+
+def testCovarianceMatrixStable():
+    mat,mix,inp = get_random_mix()
+    # large offset to provoke cancellation in the raw sums
+    inp += 1e4
+    des_cov = numx.cov(inp, rowvar=0)
+    des_avg = mean(inp,axis=0)
+    for center in [True, False]:
+        act_cov = utils.CovarianceMatrix(stable=True)
+        for chunk in numx.split(inp, 5):
+            act_cov.update(chunk)
+        act_cov,act_avg,act_tlen = act_cov.fix(center=center)
+        assert_equal(act_tlen, inp.shape[0])
+        assert_array_almost_equal(act_avg, des_avg, decimal)
+        if center:
+            assert_array_almost_equal(act_cov, des_cov, decimal-1)
+        else:
+            des_mom = mult(inp.T, inp) / (inp.shape[0] - 1)
+            assert_array_almost_equal_diff(act_cov, des_mom, decimal)
+
+def testCovarianceMatrixStableFloat32():
+    mat,mix,inp = get_random_mix()
+    inp += 100.
+    des_cov = numx.cov(inp, rowvar=0)
+    # the stable mode is not the default, not even for single precision
+    assert not utils.CovarianceMatrix(dtype='f')._stable
+    act_cov = utils.CovarianceMatrix(dtype='f', stable=True)
+    for chunk in numx.split(inp, 10):
+        act_cov.update(chunk.astype('f'))
+    act_cov,act_avg,act_tlen = act_cov.fix()
+    assert_type_equal(act_cov.dtype, 'f')
+    assert_array_almost_equal(act_cov, des_cov, 4)
+
+def testCovarianceMatrixMerge():
+    mat,mix,inp = get_random_mix()
+    des_cov = numx.cov(inp, rowvar=0)
+    des_avg = mean(inp,axis=0)
+    for stable1, stable2 in [(False, False), (True, True),
+                             (False, True), (True, False)]:
+        cov1 = utils.CovarianceMatrix(stable=stable1)
+        cov2 = utils.CovarianceMatrix(stable=stable2)
+        cov1.update(inp[:123])
+        cov2.update(inp[123:])
+        cov1.merge(cov2)
+        act_cov,act_avg,act_tlen = cov1.fix()
+        assert_equal(act_tlen, inp.shape[0])
+        assert_array_almost_equal(act_avg, des_avg, decimal)
+        assert_array_almost_equal(act_cov, des_cov, decimal)
+    # merge into an empty instance
+    cov1 = utils.CovarianceMatrix()
+    cov2 = utils.CovarianceMatrix()
+    cov2.update(inp)
+    cov1.merge(cov2)
+    act_cov,act_avg,act_tlen = cov1.fix()
+    assert_array_almost_equal(act_cov, des_cov, decimal)
+
 def testDelayCovarianceMatrix():
     dt = 5
     mat,mix,inp = get_random_mix()
@@ -44,6 +115,28 @@ def testCrossCovarianceMatrix():
     assert_array_almost_equal(act_avg2,des_avg2, decimal-1)
     assert_array_almost_equal(act_cov,des_cov, decimal-1)
 
+def testCrossCovarianceMatrixMerge():
+    mat,mix,inp1 = get_random_mix(mat_dim=(500,5))
+    mat,mix,inp2 = get_random_mix(mat_dim=(500,3))
+    des_cov = utils.cov2(inp1, inp2)
+    cov1 = utils.CrossCovarianceMatrix()
+    cov2 = utils.CrossCovarianceMatrix()
+    cov1.update(inp1[:123], inp2[:123])
+    cov2.update(inp1[123:], inp2[123:])
+    cov1.merge(cov2)
+    act_cov, act_avg1, act_avg2, act_tlen = cov1.fix()
+    assert_equal(act_tlen, inp1.shape[0])
+    assert_array_almost_equal(act_avg1, mean(inp1, axis=0), decimal-1)
+    assert_array_almost_equal(act_avg2, mean(inp2, axis=0), decimal-1)
+    assert_array_almost_equal(act_cov, des_cov, decimal-1)
+    # merge into an empty instance
+    cov1 = utils.CrossCovarianceMatrix()
+    cov2 = utils.CrossCovarianceMatrix()
+    cov2.update(inp1, inp2)
+    cov1.merge(cov2)
+    act_cov, act_avg1, act_avg2, act_tlen = cov1.fix()
+    assert_array_almost_equal(act_cov, des_cov, decimal-1)
+
 def testdtypeCovarianceMatrix():
     for type in TESTYPES:
         mat,mix,inp = get_random_mix(type='d')
@@ -1,6 +1,10 @@
+from __future__ import with_statement
+import warnings
+
 from _tools import *
 
 import mdp.parallel as parallel
+from mdp.parallel.parallelflows import _FlowNodeJoinCallable
 n = numx
 
 def test_tasks():
@@ -267,3 +271,91 @@ def use_execute_fork(self):
         scheduler.shutdown()
   
 
+
+def test_execute_iter():
+    """Test streaming parallel execution with execute_iter."""
+    flow = parallel.ParallelFlow([
+                        mdp.nodes.SFANode(output_dim=5),
+                        mdp.nodes.PolynomialExpansionNode(degree=2),
+                        mdp.nodes.SFANode(output_dim=8)])
+    data_iterables = [n.random.random((6,30,10))*n.arange(1,11),
+                      None,
+                      n.random.random((6,30,10))*n.arange(1,11)]
+    scheduler = parallel.Scheduler()
+    flow.train(data_iterables, scheduler=scheduler)
+    iterable = [n.random.random((20,10)) for _ in xrange(7)]
+    y = flow.execute(iterable)
+    ys_local = list(flow.execute_iter(iterable))
+    assert len(ys_local) == 7
+    assert_array_almost_equal(n.concatenate(ys_local), y)
+    result_container = parallel.OrderedResultContainer()
+    scheduler = parallel.ThreadScheduler(result_container=result_container,
+                                         n_threads=3)
+    ys = list(flow.execute_iter(iterable, scheduler=scheduler,
+                                max_open_tasks=2))
+    assert len(ys) == 7
+    assert_array_almost_equal(n.concatenate(ys), y)
+    # the original result container is restored
+    assert scheduler.result_container is result_container
+    # abandoning the iteration leaves the flow in a clean state
+    ys_iter = flow.execute_iter(iterable, scheduler=scheduler)
+    assert_array_almost_equal(ys_iter.next(), y[:20])
+    # the extension is not active in the code of the consumer
+    assert "parallel" not in mdp.get_active_extensions()
+    ys_iter.close()
+    assert not flow.is_parallel_executing
+    assert scheduler.result_container is result_container
+    assert "parallel" not in mdp.get_active_extensions()
+    # a failed task is raised and does not block the cleanup
+    bad_iterable = iterable[:2] + [n.random.random((20,3))] + iterable[2:]
+    py.test.raises(mdp.NodeException, list,
+                   flow.execute_iter(bad_iterable, scheduler=scheduler))
+    assert not flow.is_parallel_executing
+    assert scheduler.result_container is result_container
+    # the errors of abandoned tasks are reported as warnings
+    ys_iter = flow.execute_iter(bad_iterable[1:], scheduler=scheduler)
+    ys_iter.next()
+    with warnings.catch_warnings(record=True) as warns:
+        warnings.simplefilter("always")
+        ys_iter.close()
+    assert [w.category for w in warns] == [mdp.MDPWarning]
+    assert scheduler.result_container is result_container
+    scheduler.shutdown()
+
+def test_chunks_per_task_tree_join():
+    """Test parallel training with chunk groups and pairwise joining."""
+    data_iterables = [[n.random.random((30,10))*n.arange(1,11)
+                       for _ in xrange(7)],
+                      None,
+                      [n.random.random((30,10))*n.arange(1,11)
+                       for _ in xrange(7)]]
+    flow = mdp.Flow([mdp.nodes.PCANode(output_dim=5),
+                     mdp.nodes.PolynomialExpansionNode(degree=2),
+                     mdp.nodes.SFANode(output_dim=4)])
+    flow.train(data_iterables)
+    x = n.random.random((20,10))
+    for scheduler in [parallel.Scheduler(),
+                      parallel.ThreadScheduler(n_threads=2)]:
+        parallel_flow = parallel.ParallelFlow(
+                        mdp.Flow([mdp.nodes.PCANode(output_dim=5),
+                                  mdp.nodes.PolynomialExpansionNode(degree=2),
+                                  mdp.nodes.SFANode(output_dim=4)]))
+        join_pairs = []
+        add_task = scheduler.add_task
+        def count_joins(data, task_callable=None):
+            if isinstance(task_callable, _FlowNodeJoinCallable):
+                join_pairs.append(len(data))
+            return add_task(data, task_callable)
+        scheduler.add_task = count_joins
+        parallel_flow.train(data_iterables, scheduler=scheduler,
+                            chunks_per_task=3, tree_join=True)
+        scheduler.shutdown()
+        # the exact container type is used
+        assert type(scheduler.result_container) is parallel.ListResultContainer
+        # 3 trained nodes for each of the 2 trained nodes are joined in
+        # 2 tasks, only the final node is joined in the master
+        assert join_pairs == [2, 2] * 2
+        assert parallel_flow[0].tlen == flow[0].tlen
+        assert parallel_flow[2].tlen == flow[2].tlen
+        assert_array_almost_equal(abs(flow.execute(x)),
+                                  abs(parallel_flow.execute(x)), 6)
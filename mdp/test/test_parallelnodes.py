@@ -120,6 +120,21 @@ def test_ParallelHistogramNode_fraction():
         node.join(forked_node)
     assert len(node.data_hist) < 1000
 
+def test_ParallelHistogramNode_size():
+    """Test that the joined history is a sample of limited size."""
+    node = parallel.ParallelHistogramNode(hist_size=50)
+    x = numx.arange(3000.).reshape((1000, 3))
+    for chunk in [x[:900], x[900:950], x[950:]]:
+        forked_node = node.fork()
+        forked_node.train(chunk)
+        node.join(forked_node)
+    assert node.data_hist.shape == (50, 3)
+    assert node._n_hist_samples == 1000
+    assert len(set(node.data_hist[:,0])) == 50
+    # the samples are taken according to the size of the chunks
+    assert numx.sum(node.data_hist[:,0] < 2700) > 30
+    node.stop_training()
+
 
 class TestDerivedParallelMDPNodes(object):
     """Test derived nodes that use the parallel node classes."""
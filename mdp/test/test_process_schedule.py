@@ -43,6 +43,36 @@ def test_process_scheduler_no_cache():
     results = n.array(results)
     assert n.all(results == n.array([0,1,4,9,16,25,36,49]))
     
+def test_process_scheduler_many_tasks():
+    """Test process scheduler with many more tasks than processes."""
+    with parallel.ProcessScheduler(n_processes=3,
+                                   source_paths=None) as scheduler:
+        for i in xrange(200):
+            scheduler.add_task(i, parallel.SqrTestCallable())
+        results = scheduler.get_results()
+        # scheduler must be reusable after get_results
+        for i in xrange(10):
+            scheduler.add_task(i, parallel.SqrTestCallable())
+        results2 = scheduler.get_results()
+    assert n.all(n.array(results) == n.arange(200)**2)
+    assert n.all(n.array(results2) == n.arange(10)**2)
+
+def test_process_scheduler_error():
+    """Test that a failed task is raised and the process replaced."""
+    with parallel.ProcessScheduler(n_processes=2,
+                                   source_paths=None) as scheduler:
+        for i in xrange(4):
+            scheduler.add_task(i, parallel.SqrTestCallable())
+        # the squaring fails in the process
+        scheduler.add_task(None)
+        py.test.raises(parallel.ProcessSchedulerException,
+                       scheduler.get_results)
+        # the new process must also work with the cached callable
+        for i in xrange(8):
+            scheduler.add_task(i)
+        results = scheduler.get_results()
+    assert n.all(n.array(results) == n.arange(8)**2)
+
 def test_process_scheduler_manager():
     """Test process scheduler with context manager itnerface."""
     with parallel.ProcessScheduler(n_processes=2,
@@ -96,3 +126,47 @@ def test_process_scheduler_mdp_version():
     # check that we get 2 identical dictionaries
     assert out[0] == out[1], 'Subprocesses did not run '\
         'the same MDP as the parent:\n%s\n--\n%s'%(out[0], out[1])
+
+def test_process_scheduler_shared_memory():
+    """Test process scheduler with the shared memory transport."""
+    scheduler = parallel.ProcessScheduler(verbose=False,
+                                          n_processes=2,
+                                          source_paths=None,
+                                          shared_memory=True,
+                                          shared_memory_threshold=100)
+    # mix of arrays above and below the threshold
+    data = [n.arange(i, i+100*i, dtype="d") for i in xrange(1, 8)]
+    for x in data:
+        scheduler.add_task(x, parallel.SqrTestCallable())
+    results = scheduler.get_results()
+    scheduler.shutdown()
+    for x, y in zip(data, results):
+        assert_array_equal(y, x**2)
+
+def test_process_scheduler_shared_memory_flow():
+    """Test process scheduler with shared memory and real Nodes."""
+    precision = 6
+    node1 = mdp.nodes.PCANode(output_dim=20)
+    node2 = mdp.nodes.SFANode(output_dim=10)
+    flow = mdp.parallel.ParallelFlow([node1, node2])
+    parallel_flow = mdp.parallel.ParallelFlow(flow.copy()[:])
+    input_dim = 30
+    scales = n.linspace(1, 100, num=input_dim)
+    scale_matrix = mdp.numx.diag(scales)
+    train_iterables = [n.dot(mdp.numx_rand.random((5, 100, input_dim)),
+                             scale_matrix)
+                       for _ in xrange(2)]
+    x = mdp.numx.random.random((100, input_dim))
+    with parallel.ProcessScheduler(verbose=False,
+                                   n_processes=2,
+                                   source_paths=None,
+                                   shared_memory=True,
+                                   shared_memory_threshold=0) as scheduler:
+        parallel_flow.train(train_iterables, scheduler=scheduler)
+        y_parallel = parallel_flow.execute([x for _ in xrange(4)],
+                                           scheduler=scheduler)
+    flow.train(train_iterables)
+    y1 = flow.execute(x)
+    y2 = parallel_flow.execute(x)
+    assert_array_almost_equal(abs(y1), abs(y2), precision)
+    assert_array_almost_equal(abs(y_parallel[:100]), abs(y1), precision)
@@ -49,6 +49,82 @@ def test_cpu_count():
     assert isinstance(n_cpus, int)
 
 
+_copy_log = []
+
+class _CopyCountCallable(parallel.TaskCallable):
+    """Callable which logs when it is unpickled."""
+
+    def __init__(self, factor):
+        self.factor = factor
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        _copy_log.append(self.factor)
+
+    def __call__(self, data):
+        return self.factor * data
+
+def test_thread_scheduler_copies():
+    """Test that the threads copy a callable only once."""
+    del _copy_log[:]
+    scheduler = parallel.ThreadScheduler(n_threads=2,
+                    result_container=parallel.OrderedResultContainer())
+    scheduler.set_task_callable(_CopyCountCallable(2))
+    for i in xrange(10):
+        scheduler.add_task(i)
+    assert list(scheduler.get_results()) == [2*i for i in xrange(10)]
+    assert 1 <= len(_copy_log) <= 2
+    del _copy_log[:]
+    for i in xrange(10):
+        scheduler.add_task(i, _CopyCountCallable(3))
+    assert list(scheduler.get_results()) == [3*i for i in xrange(10)]
+    # every new callable has to be copied
+    assert _copy_log == [3] * 10
+    del _copy_log[:]
+    scheduler.set_task_callable(_CopyCountCallable(4))
+    for i in xrange(10):
+        scheduler.add_task(i)
+    assert list(scheduler.get_results()) == [4*i for i in xrange(10)]
+    assert 1 <= len(_copy_log) <= 2
+    scheduler.shutdown()
+
+class _ForkCopyCountCallable(_CopyCountCallable):
+    """Callable which returns a new instance in fork, like the flow
+    callables."""
+
+    def fork(self):
+        return self.__class__(self.factor)
+
+def test_thread_scheduler_fork_copies():
+    """Test that the threads copy a callable only once if fork returns a new
+    instance."""
+    del _copy_log[:]
+    scheduler = parallel.ThreadScheduler(n_threads=2,
+                    result_container=parallel.OrderedResultContainer())
+    scheduler.set_task_callable(_ForkCopyCountCallable(2))
+    for i in xrange(20):
+        scheduler.add_task(i)
+    assert list(scheduler.get_results()) == [2*i for i in xrange(20)]
+    assert 1 <= len(_copy_log) <= 2
+    scheduler.shutdown()
+
+def test_thread_scheduler_error():
+    """Test that a failed task is raised by get_results."""
+    class TestTaskException(Exception): pass
+    def failing_callable(x):
+        if x == 3:
+            raise TestTaskException()
+        return x
+    scheduler = parallel.ThreadScheduler(n_threads=2, copy_callable=False)
+    for i in xrange(6):
+        scheduler.add_task(i, failing_callable)
+    py.test.raises(TestTaskException, scheduler.get_results)
+    # the scheduler is still usable afterwards
+    for i in xrange(2):
+        scheduler.add_task(i, failing_callable)
+    assert list(scheduler.get_results()) == [0, 1]
+    scheduler.shutdown()
+
 def test_thread_scheduler_flow():
     """Test thread scheduler with real Nodes."""
     precision = 6
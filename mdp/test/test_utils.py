@@ -150,3 +150,26 @@ def test_nongeneral_svd_bug():
     diag = numx.diagonal(utils.mult(utils.hermitian(z),
                                     utils.mult(a, z))).real
     assert_array_almost_equal(diag, w, 12)
+
+def test_PrefetchIterable():
+    chunks = [numx_rand.random((10, 3)) for i in range(7)]
+    prefetched = utils.PrefetchIterable(chunks, n_chunks=2)
+    # the iterable can be used several times
+    for i in range(2):
+        result = list(prefetched)
+        assert len(result) == len(chunks)
+        for chunk, ref_chunk in zip(result, chunks):
+            assert chunk is ref_chunk
+    # stopping the iteration early must not block
+    for chunk in prefetched:
+        break
+    assert len(list(prefetched)) == len(chunks)
+
+def test_PrefetchIterable_exception():
+    def failing_generator():
+        yield numx.zeros((2, 2))
+        raise ValueError("bogus error")
+    prefetched = utils.PrefetchIterable(failing_generator())
+    iterator = iter(prefetched)
+    iterator.next()
+    py.test.raises(ValueError, iterator.next)
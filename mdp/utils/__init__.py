@@ -23,6 +23,8 @@
 from quad_forms import QuadraticForm, QuadraticFormException
 from covariance import (CovarianceMatrix, DelayCovarianceMatrix,
                         MultipleCovarianceMatrices,CrossCovarianceMatrix)
+from memmap_buffer import MemmapArrayBuffer
+from prefetch import PrefetchIterable
 from progress_bar import progressinfo
 from slideshow import (basic_css, slideshow_css, HTMLSlideShow,
                        image_slideshow_css, ImageHTMLSlideShow,
@@ -38,6 +40,18 @@
 mult = _mdp.numx.dot
 matmult = mult
 
+def mult_into(a, b, out):
+    """Store the matrix product of a and b in the array out and return it.
+
+    The product is computed directly in out if the dtypes match and out is
+    C contiguous, otherwise a temporary array is used.
+    """
+    if a.dtype == b.dtype == out.dtype and out.flags.c_contiguous:
+        mult(a, b, out)
+    else:
+        out[...] = mult(a, b)
+    return out
+
 if _mdp.numx_description == 'scipy':
     def matmult(a,b, alpha=1.0, beta=0.0, c=None, trans_a=0, trans_b=0):
         """Return alpha*(a*b) + beta*c.
@@ -79,10 +93,11 @@ def svd(x, compute_uv = True):
         raise SymeigException(str(exc))
 
 __all__ = ['CovarianceMatrix', 'DelayCovarianceMatrix','CrossCovarianceMatrix',
-           'MultipleCovarianceMatrices', 'QuadraticForm',
-           'QuadraticFormException',
+           'MultipleCovarianceMatrices', 'MemmapArrayBuffer', 'QuadraticForm',
+           'QuadraticFormException', 'PrefetchIterable',
            'comb', 'cov2', 'dig_node', 'get_dtypes', 'get_node_size',
-           'hermitian', 'inv', 'mult', 'mult_diag', 'nongeneral_svd',
+           'hermitian', 'inv', 'mult', 'mult_diag', 'mult_into',
+           'nongeneral_svd',
            'norm2', 'permute', 'pinv', 'progressinfo',
            'random_rot', 'refcast', 'rotate', 'scast', 'solve', 'sqrtm',
            'svd', 'symrand', 'timediff', 'matmult',
@@ -203,6 +218,8 @@ def _fixup_namespace_item(parent, mname, name, old_modules, path):
                  'introspection',
                  'quad_forms',
                  'covariance',
+                 'memmap_buffer',
+                 'prefetch',
                  'progress_bar',
                  'slideshow',
                  '_ordered_dict',
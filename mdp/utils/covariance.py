@@ -4,6 +4,36 @@
 # import numeric module (scipy, Numeric or numarray)
 numx = mdp.numx
 
+# check if the BLAS symmetric rank-k update is available
+_HAS_SYRK = False
+if mdp.numx_description == 'scipy':
+    try:
+        mdp.numx_linalg.get_blas_funcs(('syrk',), (numx.zeros((1, 1)),))
+        _HAS_SYRK = True
+    except (ValueError, AttributeError):
+        pass
+
+def _add_xtx(mtx, x):
+    """Add x^T x to mtx and return the result.
+
+    If the BLAS 'syrk' function is available, only the upper triangle is
+    updated (saving half of the flops), and the update is done in-place if
+    mtx is Fortran contiguous. In any case only the upper triangle of the
+    returned matrix is valid, so the final matrix has to be restored with
+    _symmetrize.
+    """
+    if _HAS_SYRK and x.dtype.char in 'fdFD' and mtx.dtype.char in 'fdFD':
+        syrk, = mdp.numx_linalg.get_blas_funcs(('syrk',), (x, mtx))
+        # x.T is Fortran contiguous, so no copy is needed
+        return syrk(1.0, x.T, beta=1.0, c=mtx, trans=0, lower=0,
+                    overwrite_c=1)
+    mtx += mdp.utils.mult(x.T, x)
+    return mtx
+
+def _symmetrize(mtx):
+    """Return the symmetric matrix defined by the upper triangle of mtx."""
+    return numx.triu(mtx) + numx.triu(mtx, 1).T
+
 def _check_roundoff(t, dtype):
     """Check if t is so large that t+1 == t up to 2 precision digits"""
     # limit precision
@@ -16,38 +46,74 @@ def _check_roundoff(t, dtype):
               ' information.' % (t, dtype.name))
         warnings.warn(wr, mdp.MDPWarning)
 
+def _get_accumulator_dtype(dtype):
+    """Return the dtype with at least double precision that is used to
+    accumulate data of the given dtype."""
+    if dtype.kind == 'c':
+        acc_dtype = numx.dtype('D')
+    else:
+        acc_dtype = numx.dtype('d')
+    if dtype.itemsize > acc_dtype.itemsize:
+        return dtype
+    return acc_dtype
+
 class CovarianceMatrix(object):
     """This class stores an empirical covariance matrix that can be updated
     incrementally. A call to the 'fix' method returns the current state of
     the covariance matrix, the average and the number of observations, and
     resets the internal data.
 
-    Note that the internal sum is a standard __add__ operation. We are not
-    using any of the fancy sum algorithms to avoid round off errors when
-    adding many numbers. If you want to contribute a CovarianceMatrix class
-    that uses such algorithms we would be happy to include it in MDP.
-    For a start see the Python recipe by Raymond Hettinger at
-    http://aspn.activestate.com/ASPN/Cookbook/Python/Recipe/393090
+    Two accumulation modes are available:
+
+    - In the default mode the raw sums of x^T x and x are accumulated
+      with a standard __add__ operation in the given dtype, and the
+      outer product of the means is only subtracted in 'fix'. This is fast,
+      but for long data streams in single precision the round off errors
+      can become severe.
+    - In the stable mode (selected with the 'stable' argument) each data
+      chunk is centered on its own mean and merged into a running mean and
+      a centered sum of squares with the pairwise update formula by Chan,
+      Golub and LeVeque. The accumulators
+      have at least double precision, while the products x^T x of the
+      centered chunks are still computed in the input dtype.
+      The result of 'fix' is cast back to the given dtype.
+
+    Two instances can be combined with the 'merge' method, e.g. to join the
+    statistics collected in parallel.
+
+    If SciPy provides the BLAS 'syrk' function, then only the upper triangle
+    of x^T x is computed during the accumulation and the matrix is
+    symmetrized in 'fix'.
+
     For a review about floating point arithmetic and its pitfalls see
     http://docs.oracle.com/cd/E19957-01/806-3568/ncg_goldberg.html
     """
 
-    def __init__(self, dtype=None, bias=False):
+    # default for instances pickled by older versions
+    _stable = False
+
+    def __init__(self, dtype=None, bias=False, stable=False):
         """If dtype is not defined, it will be inherited from the first
         data bunch received by 'update'.
         All the matrices in this class are set up with the given dtype and
-        no upcast is possible.
+        no upcast is possible (except for the internal accumulators in the
+        stable mode).
         If bias is True, the covariance matrix is normalized by dividing
         by T instead of the usual T-1.
+        If stable is True, the stable accumulation mode is used (see the
+        class docstring).
         """
         if dtype is None:
             self._dtype = None
         else:
             self._dtype = numx.dtype(dtype)
+        self._stable = stable
         self._input_dim = None  # will be set in _init_internals
         # covariance matrix, updated during the training phase
+        # (centered sum of squares in the stable mode)
         self._cov_mtx = None
         # average, updated during the training phase
+        # (running mean in the stable mode)
         self._avg = None
         # number of observation so far during the training phase
         self._tlen = 0
@@ -64,11 +130,20 @@ def _init_internals(self, x):
         # init dtype
         if self._dtype is None:
             self._dtype = x.dtype
-        dim = x.shape[1]
+        self._init_accumulators(x.shape[1])
+
+    def _init_accumulators(self, dim):
+        """Init the covariance matrix and the average for the given dimension.
+
+        The dtype must already be known.
+        """
         self._input_dim = dim
-        type_ = self._dtype
-        # init covariance matrix
-        self._cov_mtx = numx.zeros((dim, dim), type_)
+        if self._stable:
+            type_ = _get_accumulator_dtype(self._dtype)
+        else:
+            type_ = self._dtype
+        # init covariance matrix (Fortran order for the in-place BLAS update)
+        self._cov_mtx = numx.zeros((dim, dim), type_, order='F')
         # init average
         self._avg = numx.zeros(dim, type_)
 
@@ -82,12 +157,85 @@ def update(self, x):
             self._init_internals(x)
         # cast input
         x = mdp.utils.refcast(x, self._dtype)
+        if self._stable:
+            self._update_stable(x)
+            return
         # update the covariance matrix, the average and the number of
         # observations (try to do everything inplace)
-        self._cov_mtx += mdp.utils.mult(x.T, x)
+        self._cov_mtx = _add_xtx(self._cov_mtx, x)
         self._avg += x.sum(axis=0)
         self._tlen += x.shape[0]
 
+    def _update_stable(self, x):
+        """Merge the centered statistics of the chunk x."""
+        tlen = x.shape[0]
+        if tlen == 0:
+            return
+        acc_type = self._cov_mtx.dtype
+        # shift the data by the chunk mean in the input dtype, the residual
+        # mean of the shifted data is corrected in double precision
+        shift = x.mean(axis=0, dtype=acc_type)
+        x = x - shift.astype(self._dtype)
+        residual = x.mean(axis=0, dtype=acc_type)
+        cov_mtx = _add_xtx(numx.zeros((x.shape[1], x.shape[1]), self._dtype,
+                                      order='F'), x)
+        cov_mtx = mdp.utils.refcast(cov_mtx, acc_type)
+        cov_mtx -= tlen * numx.outer(residual, residual)
+        self._merge_centered(tlen, shift + residual, cov_mtx)
+
+    def _merge_centered(self, tlen, avg, cov_mtx):
+        """Merge the mean and the centered sum of squares of tlen
+        observations into the internal accumulators of the stable mode."""
+        if tlen == 0:
+            return
+        total_tlen = self._tlen + tlen
+        delta = avg - self._avg
+        self._cov_mtx += cov_mtx
+        self._cov_mtx += ((float(self._tlen) * tlen / total_tlen) *
+                          numx.outer(delta, delta))
+        self._avg += (float(tlen) / total_tlen) * delta
+        self._tlen = total_tlen
+
+    def _get_centered(self):
+        """Return the number of observations, the mean and the centered sum
+        of squares, independent of the accumulation mode."""
+        tlen = self._tlen
+        if self._stable:
+            return tlen, self._avg, self._cov_mtx
+        avg = self._avg / tlen
+        return tlen, avg, self._cov_mtx - tlen * numx.outer(avg, avg)
+
+    def _get_raw(self):
+        """Return the number of observations, the sum and the sum of squares,
+        independent of the accumulation mode."""
+        tlen = self._tlen
+        if self._stable:
+            return (tlen, tlen * self._avg,
+                    self._cov_mtx + tlen * numx.outer(self._avg, self._avg))
+        return tlen, self._avg, self._cov_mtx
+
+    def merge(self, other):
+        """Add the observations accumulated in the other CovarianceMatrix
+        instance to this one.
+
+        The result is the same as if all the data had been passed to this
+        instance (up to round off errors). Both instances can use different
+        accumulation modes. The other instance is not modified.
+        """
+        if other._cov_mtx is None or other._tlen == 0:
+            return
+        if self._cov_mtx is None:
+            if self._dtype is None:
+                self._dtype = other._dtype
+            self._init_accumulators(other._input_dim)
+        if self._stable:
+            self._merge_centered(*other._get_centered())
+        else:
+            tlen, avg, cov_mtx = other._get_raw()
+            self._cov_mtx += cov_mtx
+            self._avg += avg
+            self._tlen += tlen
+
     def fix(self, center=True):
         """Returns a triple containing the covariance matrix, the average and
         the number of observations. The covariance matrix is then reset to
@@ -95,6 +243,8 @@ def fix(self, center=True):
 
         If center is false, the returned matrix is the matrix of the second moments,
         i.e. the covariance matrix of the data without subtracting the mean."""
+        if self._stable:
+            return self._fix_stable(center)
         # local variables
         type_ = self._dtype
         tlen = self._tlen
@@ -117,6 +267,9 @@ def fix(self, center=True):
                 avg_mtx /= tlen*(tlen - 1)
             cov_mtx -= avg_mtx
 
+        # only the upper triangle was accumulated
+        cov_mtx = _symmetrize(cov_mtx)
+
         # fix the average
         avg /= tlen
 
@@ -130,6 +283,30 @@ def fix(self, center=True):
 
         return cov_mtx, avg, tlen
 
+    def _fix_stable(self, center):
+        """Implementation of 'fix' for the stable mode."""
+        tlen = self._tlen
+        avg = self._avg
+        cov_mtx = self._cov_mtx
+        _check_roundoff(tlen, cov_mtx.dtype)
+
+        if not center:
+            cov_mtx += tlen * numx.outer(avg, avg)
+        if self.bias:
+            cov_mtx /= tlen
+        else:
+            cov_mtx /= tlen - 1
+        # only the upper triangle was accumulated
+        cov_mtx = _symmetrize(cov_mtx)
+
+        ##### clean up
+        self._cov_mtx = None
+        self._avg = None
+        self._tlen = 0
+
+        return (mdp.utils.refcast(cov_mtx, self._dtype),
+                mdp.utils.refcast(avg, self._dtype), tlen)
+
 
 class DelayCovarianceMatrix(object):
     """This class stores an empirical covariance matrix between the signal and
@@ -143,6 +320,10 @@ class DelayCovarianceMatrix(object):
     http://aspn.activestate.com/ASPN/Cookbook/Python/Recipe/393090
     For a review about floating point arithmetic and its pitfalls see
     http://docs.sun.com/source/806-3568/ncg_goldberg.html
+
+    For dt==0 the matrix is symmetric, so in this case only the upper
+    triangle is accumulated if the BLAS 'syrk' function is available (see
+    CovarianceMatrix).
     """
 
     def __init__(self, dt, dtype=None, bias=False):
@@ -182,8 +363,8 @@ def _init_internals(self, x):
             self._dtype = x.dtype
         dim = x.shape[1]
         self._input_dim = dim
-        # init covariance matrix
-        self._cov_mtx = numx.zeros((dim, dim), self._dtype)
+        # init covariance matrix (Fortran order for the in-place BLAS update)
+        self._cov_mtx = numx.zeros((dim, dim), self._dtype, order='F')
         # init averages
         self._avg = numx.zeros(dim, self._dtype)
         self._avg_dt = numx.zeros(dim, self._dtype)
@@ -206,7 +387,10 @@ def update(self, x):
 
         # update the covariance matrix, the average and the number of
         # observations (try to do everything inplace)
-        self._cov_mtx += mdp.utils.mult(x[:tlen-dt, :].T, x[dt:tlen, :])
+        if dt == 0:
+            self._cov_mtx = _add_xtx(self._cov_mtx, x)
+        else:
+            self._cov_mtx += mdp.utils.mult(x[:tlen-dt, :].T, x[dt:tlen, :])
         totalsum = x.sum(axis=0)
         self._avg += totalsum - x[tlen-dt:, :].sum(axis=0)
         self._avg_dt += totalsum - x[:dt, :].sum(axis=0)
@@ -243,6 +427,9 @@ def fix(self, A=None):
             cov_mtx /= tlen
         else:
             cov_mtx /= tlen - 1
+        if self._dt == 0:
+            # only the upper triangle was accumulated
+            cov_mtx = _symmetrize(cov_mtx)
 
         if A is not None:
             cov_mtx = mdp.utils.mult(A, mdp.utils.mult(cov_mtx, A.T))
@@ -350,6 +537,25 @@ def _init_internals(self, x, y):
         self._avgx = numx.zeros(dim_x, type_)
         self._avgy = numx.zeros(dim_y, type_)
 
+    def merge(self, other):
+        """Add the observations accumulated in the other
+        CrossCovarianceMatrix instance to this one.
+
+        This replaces CovarianceMatrix.merge, since the raw sums of
+        the two signals are accumulated separately.
+        """
+        if other._cov_mtx is None:
+            return
+        if self._cov_mtx is None:
+            if self._dtype is None:
+                self._dtype = other._dtype
+            self._cov_mtx = numx.zeros(other._cov_mtx.shape, self._dtype)
+            self._avgx = numx.zeros(other._avgx.shape, self._dtype)
+            self._avgy = numx.zeros(other._avgy.shape, self._dtype)
+        self._cov_mtx += other._cov_mtx
+        self._avgx += other._avgx
+        self._avgy += other._avgy
+        self._tlen += other._tlen
 
     def update(self, x, y):
         # check internal dimensions consistency
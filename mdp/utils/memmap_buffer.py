@@ -0,0 +1,105 @@
+"""
+Growable array storage on disk, which is used for out-of-core data
+collection.
+"""
+
+import os
+import tempfile
+
+import mdp
+
+# import numeric module (scipy, Numeric or numarray)
+numx = mdp.numx
+
+
+class MemmapArrayBuffer(object):
+    """Collect arrays along their first axis in a file on disk.
+
+    The arrays are appended to a binary file, so the memory usage does not
+    grow with the amount of collected data. At the end the data is
+    available as a single memory mapped array, so no concatenation copy is
+    needed either.
+
+    All arrays must have the same shape apart from the first axis. They are
+    cast to the dtype of the first array.
+    """
+
+    def __init__(self, dirname=None, prefix="mdp_buffer_"):
+        """Create the buffer file.
+
+        dirname -- Directory for the buffer file. If None (default value)
+            then the default temporary directory is used.
+        prefix -- Prefix for the buffer file name.
+        """
+        fd, self.filename = tempfile.mkstemp(prefix=prefix, suffix=".dat",
+                                             dir=dirname)
+        self._file = os.fdopen(fd, "wb")
+        self.dtype = None
+        # shape of the arrays without the first axis
+        self.shape = None
+        # number of collected rows
+        self.tlen = 0
+
+    def append(self, x):
+        """Append the array x to the buffer."""
+        if self._file is None:
+            err = "The buffer has already been closed."
+            raise mdp.MDPException(err)
+        x = numx.asarray(x)
+        if self.dtype is None:
+            self.dtype = x.dtype
+            self.shape = x.shape[1:]
+        elif x.shape[1:] != self.shape:
+            err = ("Array shape %s does not match the buffer shape %s." %
+                   (str(x.shape[1:]), str(self.shape)))
+            raise mdp.MDPException(err)
+        numx.ascontiguousarray(x, dtype=self.dtype).tofile(self._file)
+        self.tlen += x.shape[0]
+
+    def get_array(self, mode="r+"):
+        """Close the buffer and return the collected data as a single array.
+
+        mode -- Mode for numx.memmap, the default 'r+' allows in-place
+            modifications of the data.
+
+        On POSIX systems the buffer file is removed right away and the
+        returned array is a view on the mapped file, which stays valid as long
+        as the array exists. On other systems the data is loaded into memory
+        before the file is removed.
+        """
+        if self.dtype is None:
+            err = "No data was appended to the buffer."
+            raise mdp.MDPException(err)
+        self._file.close()
+        self._file = None
+        try:
+            if self.tlen == 0:
+                return numx.zeros((0,) + self.shape, dtype=self.dtype)
+            array = numx.memmap(self.filename, dtype=self.dtype, mode=mode,
+                                shape=(self.tlen,) + self.shape)
+            if os.name != "posix":
+                # open files can not be removed, so make a copy
+                return numx.array(array)
+            # keep the memmap alive as the base, but return a normal array
+            return array.view(numx.ndarray)
+        finally:
+            self._remove_file()
+
+    def _remove_file(self):
+        """Remove the buffer file if it still exists."""
+        if self.filename is not None:
+            try:
+                os.remove(self.filename)
+            except OSError:
+                pass
+            self.filename = None
+
+    def __del__(self):
+        # clean up if the buffer was never turned into an array
+        try:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self._remove_file()
+        except Exception:
+            pass
@@ -0,0 +1,90 @@
+"""
+Iteration over data chunks in a background thread, so that loading the
+data overlaps with the processing.
+"""
+
+import sys
+import threading
+import Queue
+
+import mdp
+
+# marks the end of the iteration in the queue
+_END = object()
+
+
+class _Failure(object):
+    """Wrapper for an exception raised by the prefetched iterable."""
+
+    def __init__(self, exc_info):
+        self.exc_info = exc_info
+
+
+class PrefetchIterable(object):
+    """Wrap an iterable so that its items are fetched in a background thread.
+
+    Every iteration starts a new thread, which iterates over the wrapped
+    iterable and keeps up to ``n_chunks`` items ready for the consumer.
+    Iterating several times (e.g. for nodes with multiple training phases)
+    therefore works as long as the wrapped object is an iterable and not an
+    iterator. Exceptions raised by the wrapped iterable are re-raised in the
+    consuming thread.
+    """
+
+    def __init__(self, iterable, n_chunks=2):
+        """Wrap the iterable.
+
+        iterable -- The iterable (or iterator) to be prefetched.
+        n_chunks -- Maximum number of items that are fetched in advance.
+        """
+        if n_chunks < 1:
+            err = "n_chunks must be at least 1 (%d given)." % n_chunks
+            raise mdp.MDPException(err)
+        self.iterable = iterable
+        self.n_chunks = n_chunks
+
+    def __iter__(self):
+        items = Queue.Queue(maxsize=self.n_chunks)
+        stop = threading.Event()
+        thread = threading.Thread(target=self._fetch, args=(items, stop))
+        thread.setDaemon(True)
+        thread.start()
+        try:
+            while True:
+                item = items.get()
+                if item is _END:
+                    break
+                if type(item) is _Failure:
+                    exc_type, exc_value, exc_tb = item.exc_info
+                    raise exc_type, exc_value, exc_tb
+                yield item
+        finally:
+            # the consumer might have stopped early, end the thread
+            stop.set()
+            try:
+                while True:
+                    items.get_nowait()
+            except Queue.Empty:
+                pass
+
+    def _fetch(self, items, stop):
+        """Put the items of the wrapped iterable into the queue."""
+        try:
+            for item in self.iterable:
+                if not self._put(items, stop, item):
+                    return
+        except Exception:
+            self._put(items, stop, _Failure(sys.exc_info()))
+            return
+        self._put(items, stop, _END)
+
+    @staticmethod
+    def _put(items, stop, item):
+        """Put the item into the queue, return False if stopped before."""
+        while not stop.isSet():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except Queue.Full:
+                pass
+        return False